@@ -0,0 +1,211 @@
+##Offline batch-job mode: large sweeps go through an OpenAI-batch-style queue instead of interactive calls.
+##"prepare" turns a sweep grid (same options as sweep.py) into requests JSONL files with one
+##{"custom_id", "method", "url", "body"} line per trial; the custom_id "<cell tag>--sim<N>" is stable, so the
+##same grid always produces the same ids. "ingest" reads the provider's results JSONL (in any order, several
+##files allowed) into one journal per cell and writes the usual prioritized / embedded_only / raw_llm_outputs
+##and metrics files, exactly like coinflip_regex.py and sweep.py do.
+##Everything for one batch lives in results/batch_<timestamp>/ (the top-level requests.jsonl is left alone).
+##
+##Examples:
+##  python batch_jobs.py prepare --models deepseek-r1 --temperatures 1 1.5 --num-simulations 10000
+##  (upload results/batch_<timestamp>/requests_*.jsonl to the batch endpoint, download the output file)
+##  python batch_jobs.py ingest results/batch_<timestamp>/batch_manifest.json batch_output.jsonl
+
+import argparse
+import json
+import os
+from datetime import datetime
+from openai.types.chat import ChatCompletion
+from sweep import add_grid_arguments, build_cell_request, cell_metadata, cell_num_flips, cell_tag, grid_from_args
+from inference_client import completion_to_record, request_kwargs
+from flip_extraction import is_valid_sequence, run_extractions
+from trial_journal import TrialJournal, write_reports_from_journal
+from trial_metrics import write_metrics_report
+from run_store import write_run_from_journal
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+CUSTOM_ID_SEPARATOR = "--sim"
+# OpenAI batch input files are limited to 50,000 requests each
+MAX_LINES_PER_FILE = 50000
+
+
+def custom_id_for(tag, simulation_id):
+    return f"{tag}{CUSTOM_ID_SEPARATOR}{simulation_id}"
+
+
+def parse_custom_id(custom_id):
+    """(cell tag, simulation id) of a custom_id written by custom_id_for."""
+    tag, _, simulation_id = custom_id.rpartition(CUSTOM_ID_SEPARATOR)
+    return tag, int(simulation_id)
+
+
+def prepare_batch(cells, num_simulations, results_dir="results", timestamp=None, max_lines_per_file=MAX_LINES_PER_FILE):
+    """
+    Writes the batch request files and manifest for a sweep grid.
+
+    Args:
+        cells (list): Grid cells from sweep.build_grid.
+        num_simulations (int): Trials per cell.
+        results_dir (str): Parent directory of the batch directory.
+        timestamp (str, optional): Batch timestamp (default: now).
+        max_lines_per_file (int): Requests per file before a new requests_NNN.jsonl is started.
+
+    Returns:
+        dict: The manifest (timestamp, batch_dir, num_simulations, cells with tags, request files).
+    """
+    timestamp = timestamp or datetime.now().strftime("%Y%m%d_%H%M%S")
+    batch_dir = os.path.join(results_dir, f"batch_{timestamp}")
+    os.makedirs(batch_dir, exist_ok=True)
+
+    request_files = []
+    out = None
+    lines_in_file = 0
+    try:
+        for cell in cells:
+            tag = cell_tag(cell)
+            for simulation_id in range(1, num_simulations + 1):
+                if out is None or lines_in_file >= max_lines_per_file:
+                    if out is not None:
+                        out.close()
+                    request_files.append(os.path.join(batch_dir, f"requests_{len(request_files) + 1:03d}.jsonl"))
+                    out = open(request_files[-1], "w", encoding="utf-8")
+                    lines_in_file = 0
+                line = {
+                    "custom_id": custom_id_for(tag, simulation_id),
+                    "method": "POST",
+                    "url": BATCH_ENDPOINT,
+                    "body": request_kwargs(build_cell_request(cell, simulation_id)),
+                }
+                out.write(json.dumps(line, ensure_ascii=False) + "\n")
+                lines_in_file += 1
+    finally:
+        if out is not None:
+            out.close()
+
+    manifest = {
+        "timestamp": timestamp,
+        "batch_dir": batch_dir,
+        "num_simulations": num_simulations,
+        "cells": [dict(cell, tag=cell_tag(cell)) for cell in cells],
+        "request_files": request_files,
+    }
+    manifest_path = os.path.join(batch_dir, "batch_manifest.json")
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Wrote {len(cells) * num_simulations} batch requests to {len(request_files)} file(s) in {batch_dir}")
+    print(f"Batch manifest saved to {manifest_path}")
+    return manifest
+
+
+def batch_line_to_record(line):
+    """
+    Trial record for one line of a batch results (or errors) file.
+
+    Returns:
+        tuple: (cell tag, record) with simulation_id, custom_id, raw_output, usage and error/error_status on failure.
+    """
+    tag, simulation_id = parse_custom_id(line["custom_id"])
+    record = {"simulation_id": simulation_id, "custom_id": line["custom_id"]}
+    response = line.get("response") or {}
+    status = response.get("status_code")
+    error = line.get("error")
+    if error or status != 200:
+        message = (error or {}).get("message") or ((response.get("body") or {}).get("error") or {}).get("message")
+        record.update(raw_output=f"Error: {message or f'status {status}'}", usage=None,
+                      error=message or f"status {status}", error_status=status)
+        return tag, record
+    record.update(completion_to_record(ChatCompletion.model_validate(response["body"])))
+    record["batch_request_id"] = response.get("request_id")
+    return tag, record
+
+
+def ingest_batch_results(manifest_path, result_paths, results_dir="results", text_reports=True):
+    """
+    Loads batch results into one journal per cell and writes each cell's reports and metrics.
+
+    Args:
+        manifest_path (str): batch_manifest.json written by prepare_batch.
+        result_paths (list): Results/errors JSONL files downloaded from the batch endpoint (any line order).
+        results_dir (str): Where the report files go.
+        text_reports (bool): Also write the text reports (the cells always go to the run store).
+
+    Returns:
+        dict: cell tag -> {"records", "errors", "missing"} counts.
+    """
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    cells = {cell["tag"]: cell for cell in manifest["cells"]}
+    num_simulations = manifest["num_simulations"]
+    timestamp = manifest["timestamp"]
+    journal_paths = {tag: os.path.join(manifest["batch_dir"], f"{tag}.jsonl") for tag in cells}
+    counts = {tag: {"records": 0, "errors": 0, "seen": set()} for tag in cells}
+
+    journals = {tag: TrialJournal(path, fsync_each=False) for tag, path in journal_paths.items()}
+    try:
+        for result_path in result_paths:
+            with open(result_path, "r", encoding="utf-8") as f:
+                for line_number, raw_line in enumerate(f, 1):
+                    if not raw_line.strip():
+                        continue
+                    try:
+                        tag, record = batch_line_to_record(json.loads(raw_line))
+                    except (ValueError, KeyError) as e:
+                        print(f"Warning: Skipping unreadable line {line_number} of '{result_path}': {e}")
+                        continue
+                    if tag not in cells:
+                        print(f"Warning: custom_id '{record['custom_id']}' does not belong to this batch, skipping it.")
+                        continue
+                    num_flips = cell_num_flips(cells[tag])
+                    record["extractions"] = run_extractions(record["raw_output"], num_flips)
+                    record["extraction_ok"] = is_valid_sequence(record["extractions"]["prioritized"], num_flips)
+                    record["num_flips"] = num_flips
+                    record["cell"] = cells[tag]
+                    journals[tag].append(record)
+                    counts[tag]["records"] += 1
+                    counts[tag]["errors"] += 1 if record.get("error") else 0
+                    counts[tag]["seen"].add(record["simulation_id"])
+    finally:
+        for journal in journals.values():
+            journal.close()
+
+    summary = {}
+    for tag, journal_path in journal_paths.items():
+        missing = num_simulations - len(counts[tag]["seen"])
+        summary[tag] = {"records": counts[tag]["records"], "errors": counts[tag]["errors"], "missing": missing}
+        print(f"Cell {tag}: {counts[tag]['records']} results ({counts[tag]['errors']} errors, {missing} missing)")
+        if counts[tag]["records"]:
+            if text_reports:
+                write_reports_from_journal(journal_path, timestamp, num_simulations, results_dir, suffix=f"_{tag}",
+                                           length=cell_num_flips(cells[tag]))
+            write_metrics_report(journal_path, timestamp, results_dir, suffix=f"_{tag}",
+                                 group_by=("model", "temperature", "max_tokens", "prompt"))
+            write_run_from_journal(journal_path, f"{timestamp}_{tag}", dict(cell_metadata(cells[tag]), timestamp=timestamp,
+                                                                            source="batch", num_simulations=num_simulations))
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prepare OpenAI-batch-style request files for a sweep grid, or ingest their results.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    prepare_parser = subparsers.add_parser("prepare", help="Write requests JSONL files for a grid")
+    add_grid_arguments(prepare_parser)
+    prepare_parser.add_argument("--results-dir", default="results")
+    prepare_parser.add_argument("--max-lines-per-file", type=int, default=MAX_LINES_PER_FILE)
+
+    ingest_parser = subparsers.add_parser("ingest", help="Load batch results into journals and reports")
+    ingest_parser.add_argument("manifest", help="batch_manifest.json written by prepare")
+    ingest_parser.add_argument("results", nargs="+", help="Batch results/errors JSONL file(s)")
+    ingest_parser.add_argument("--results-dir", default="results")
+    ingest_parser.add_argument("--no-text-reports", action="store_true", help="Only store the cells in the Parquet run store")
+    args = parser.parse_args()
+
+    if args.command == "prepare":
+        cells, num_simulations = grid_from_args(args)
+        prepare_batch(cells, num_simulations, args.results_dir, max_lines_per_file=args.max_lines_per_file)
+    else:
+        ingest_batch_results(args.manifest, args.results, args.results_dir, text_reports=not args.no_text_reports)
+
+
+if __name__ == "__main__":
+    main()
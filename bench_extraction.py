@@ -0,0 +1,173 @@
+##Benchmark of the flip-sequence extraction on the archived raw outputs, scaled up to corpus size.
+##The corpus is every raw output in results/coin_flips_raw_llm_outputs_*.txt and coin_flip_results_*.txt
+##(~2.7k-line R1 files), repeated until --responses responses. The legacy per-function extraction (the
+##implementations as they were before flip_extraction.extract_all, kept here as the reference) is timed
+##against extract_batch, after checking that both give identical results on the corpus and on random
+##fuzz inputs (odd whitespace, \r\n / \x0b / \u2028 line breaks, long H/T runs).
+##
+##Examples:
+##  python bench_extraction.py --responses 100000
+##  python bench_extraction.py --responses 1000000 --skip-legacy
+
+import argparse
+import glob
+import itertools
+import json
+import os
+import random
+import re
+import time
+from collections import Counter
+from datetime import datetime
+from raw_archive import ARCHIVE_GLOBS, parse_raw_archive
+from flip_extraction import EXTRACTION_FIELDS, extract_all, extract_batch
+
+BENCHMARK_DIR = os.path.join("results", "benchmarks")
+
+
+# --- Legacy implementations (reference semantics) ---
+def legacy_embedded_only(full_response_content):
+    if not isinstance(full_response_content, str):
+        return ""
+    ht_pattern = re.compile(r"([HT]{10})")
+    for line in full_response_content.splitlines():
+        match = ht_pattern.search(line)
+        if match:
+            return match.group(1)
+    return ""
+
+
+def legacy_prioritized(full_response_content):
+    if not isinstance(full_response_content, str):
+        return ""
+    lines = full_response_content.splitlines()
+    ht_pattern_embedded = re.compile(r"([HT]{10})")
+    for line in lines:
+        cleaned_line = line.strip()
+        if len(cleaned_line) == 10 and all(c in 'HT' for c in cleaned_line):
+            return cleaned_line
+        if len(cleaned_line) >= 10 and all(c in 'HT' for c in cleaned_line[:10]):
+            return cleaned_line[:10]
+    for line in lines:
+        match = ht_pattern_embedded.search(line.strip())
+        if match:
+            return match.group(1)
+    found_chars = "".join(c for c in full_response_content if c in "HT")
+    if len(found_chars) >= 10:
+        return found_chars[:10]
+    return ""
+
+
+def legacy_extract_flips(full_response_content):
+    if not isinstance(full_response_content, str):
+        return ""
+    for line in full_response_content.splitlines():
+        cleaned_line = line.strip()
+        if len(cleaned_line) >= 10 and all(c in 'HT' for c in cleaned_line[:10]):
+            return cleaned_line[:10]
+        if len(cleaned_line) == 10 and all(c in 'HT' for c in cleaned_line):
+            return cleaned_line
+    found_chars = "".join(c for c in full_response_content if c in "HT")
+    return found_chars[:10]
+
+
+def legacy_batch(responses):
+    """What the runners did per response before: three separate extraction functions."""
+    columns = {"prioritized": [], "embedded_only": [], "extract_flips": []}
+    for response in responses:
+        columns["prioritized"].append(legacy_prioritized(response))
+        columns["embedded_only"].append(legacy_embedded_only(response))
+        columns["extract_flips"].append(legacy_extract_flips(response))
+    return columns
+
+
+def load_corpus(patterns):
+    responses = []
+    for pattern in patterns:
+        for filepath in sorted(glob.glob(pattern)):
+            archive = parse_raw_archive(filepath)
+            responses.extend(archive[simulation_id] for simulation_id in sorted(archive))
+    return responses
+
+
+def fuzz_responses(count, seed=0):
+    """Random responses built from the pieces that matter to the extraction rules."""
+    rng = random.Random(seed)
+    pieces = ["H", "T", "HT", "HTHTHTHTHT", "HHHHHHHHHHHHH", "THTHTHTHT", " ", "\t", "\xa0", "\n", "\r\n",
+              "\r", "\x0b", "\u2028", "\x85", "\x1c", "\x1f", "é", "x", "The ", "Heads", "</think>", "TERMINATE", "1. H\n", ":"]
+    ascii_pieces = [piece for piece in pieces if piece.isascii()]
+    # Half of them ASCII-only, so both the bytes fast path and the str path of extract_all get checked
+    return ["".join(rng.choice(ascii_pieces if index % 2 else pieces) for _ in range(rng.randint(0, 40)))
+            for index in range(count)]
+
+
+def verify(responses):
+    """Indices (and values) where the engine and the legacy functions disagree."""
+    mismatches = []
+    for index, response in enumerate(responses):
+        result = extract_all(response)
+        expected = {"prioritized": legacy_prioritized(response), "embedded_only": legacy_embedded_only(response),
+                    "extract_flips": legacy_extract_flips(response)}
+        if any(result[field] != value for field, value in expected.items()):
+            mismatches.append({"index": index, "response": response[:200], "engine": result, "legacy": expected})
+    return mismatches
+
+
+def time_run(fn, responses):
+    start = time.perf_counter()
+    fn(responses)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the flip extraction engine against the legacy functions.")
+    parser.add_argument("--archives", nargs="+", default=ARCHIVE_GLOBS)
+    parser.add_argument("--responses", type=int, default=100000, help="Corpus size after repeating the archived outputs")
+    parser.add_argument("--fuzz", type=int, default=20000, help="Random inputs checked for identical results")
+    parser.add_argument("--skip-legacy", action="store_true", help="Only time the engine (for very large corpora)")
+    parser.add_argument("--save", default=None, help="Output JSON (default: results/benchmarks/extraction_<timestamp>.json)")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.archives)
+    if not corpus:
+        print("No archived raw outputs found.")
+        return
+    print(f"Loaded {len(corpus)} archived responses ({sum(map(len, corpus)) / 1e6:.2f} MB)")
+
+    mismatches = verify(corpus) + verify(fuzz_responses(args.fuzz))
+    if mismatches:
+        print(f"ERROR: {len(mismatches)} responses extract differently; first one:")
+        print(json.dumps(mismatches[0], indent=2, ensure_ascii=False))
+        return
+    print(f"Engine matches the legacy extraction on all {len(corpus)} archived and {args.fuzz} fuzz responses.")
+
+    responses = list(itertools.islice(itertools.cycle(corpus), args.responses))
+    megabytes = sum(map(len, responses)) / 1e6
+    results = {"engine": time_run(extract_batch, responses)}
+    if not args.skip_legacy:
+        results["legacy"] = time_run(legacy_batch, responses)
+
+    print(f"\n{len(responses)} responses, {megabytes:.1f} MB")
+    report = {}
+    for name, seconds in results.items():
+        report[name] = {"seconds": seconds, "responses_per_s": len(responses) / seconds, "mb_per_s": megabytes / seconds,
+                        "us_per_response": seconds / len(responses) * 1e6}
+        print(f"{name:<8} {seconds:8.2f}s  {report[name]['responses_per_s']:12,.0f} responses/s  "
+              f"{report[name]['mb_per_s']:8.1f} MB/s  {report[name]['us_per_response']:8.2f} us/response")
+    if "legacy" in results:
+        print(f"Speedup: {results['legacy'] / results['engine']:.1f}x")
+
+    rules = Counter(extract_all(response)["rule"] for response in corpus)
+    print("Rules fired on the archived corpus: " + ", ".join(f"{rule}={count}" for rule, count in rules.most_common()))
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    save_path = args.save or os.path.join(BENCHMARK_DIR, f"extraction_{timestamp}.json")
+    os.makedirs(os.path.dirname(save_path) or ".", exist_ok=True)
+    with open(save_path, "w", encoding="utf-8") as f:
+        json.dump({"timestamp": timestamp, "responses": len(responses), "megabytes": megabytes,
+                   "fields": list(EXTRACTION_FIELDS), "results": report, "rules": dict(rules)}, f, indent=2)
+    print(f"Benchmark results saved to {save_path}")
+
+
+if __name__ == "__main__":
+    main()
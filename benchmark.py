@@ -0,0 +1,282 @@
+##End-to-end throughput benchmark of the runners against the local mock endpoint (mock_server.py).
+##Every scenario (script x mode x concurrency x response body x error rate) runs run_coin_flip_simulation
+##in a fresh child process pointed at a mock server started for it, so CPU time and peak RSS belong to the
+##runner alone. Reported per scenario: trials/sec, CPU seconds per trial, peak RSS, p50/p95/p99 trial latency
+##(from the run's journal), retries and valid sequences.
+##Results are saved as JSON; pass an earlier file with --baseline to flag regressions between versions.
+##
+##Examples:
+##  python benchmark.py --modes direct stream --concurrency 1 8 32 --bodies short long --error-rates 0 0.1
+##  python benchmark.py --save results/benchmarks/baseline.json
+##  python benchmark.py --baseline results/benchmarks/baseline.json
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from mock_server import MockInferenceServer, load_archive_responses, start_mock_server
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCHMARK_DIR = os.path.join("results", "benchmarks")
+# Canned reply bodies: DeepSeek V3 answers are ~120 characters, R1 answers (with reasoning) ~2000
+RESPONSE_BODIES = {
+    "short": os.path.join(REPO_DIR, "results", "coin_flip_results_20250527_212423DeepseekV3.txt"),
+    "long": os.path.join(REPO_DIR, "results", "coin_flips_raw_llm_outputs_20250530_205248.txt"),
+}
+DEFAULT_SCRIPTS = ["coinflip_regex", "coinflip"]
+DEFAULT_MODES = ["direct", "stream"]
+# Metrics compared against a baseline: name -> True if higher is better
+COMPARED_METRICS = {
+    "trials_per_s": True,
+    "cpu_s_per_trial": False,
+    "peak_rss_mb": False,
+    "latency_p99_s": False,
+}
+DEFAULT_TOLERANCE = 0.10
+
+
+def build_scenarios(scripts, modes, concurrency_values, bodies, error_rates):
+    """Every combination of the benchmark axes as a list of scenario dicts."""
+    unknown_bodies = [body for body in bodies if body not in RESPONSE_BODIES]
+    if unknown_bodies:
+        raise ValueError(f"Unknown response body {unknown_bodies}; available: {sorted(RESPONSE_BODIES)}")
+    return [
+        {"script": script, "mode": mode, "concurrency": concurrency, "body": body, "error_rate": error_rate}
+        for script, mode, concurrency, body, error_rate in itertools.product(scripts, modes, concurrency_values, bodies, error_rates)
+    ]
+
+
+def scenario_name(scenario):
+    return (f"{scenario['script']}/{scenario['mode']}/c{scenario['concurrency']}/"
+            f"{scenario['body']}/err{scenario['error_rate']:g}")
+
+
+def run_worker(scenario_path, result_path):
+    """
+    Child-process side: runs one scenario in the current directory and writes its measurements as JSON.
+    Environment (LAMBDA_INFERENCE_API_BASE etc.) is set up by the parent.
+    """
+    with open(scenario_path, "r", encoding="utf-8") as f:
+        scenario = json.load(f)
+    import importlib
+    from trial_journal import iter_journal_records
+    from trial_metrics import summarize_records
+
+    runner = importlib.import_module(scenario["script"])
+    journal_path = os.path.abspath("journal.jsonl")
+    start_wall = time.perf_counter()
+    start_cpu = time.process_time()
+    runner.run_coin_flip_simulation(
+        num_simulations=scenario["num_simulations"], concurrency=scenario["concurrency"], mode=scenario["mode"],
+        journal_path=journal_path, requests_per_second=scenario["requests_per_second"],
+        max_retries=scenario["max_retries"],
+    )
+    wall_s = time.perf_counter() - start_wall
+    cpu_s = time.process_time() - start_cpu
+
+    records = list(iter_journal_records(journal_path))
+    summary = summarize_records(records, group_by=())
+    summary = summary[0] if summary else {}
+    trials = len(records)
+    latency = summary.get("latency_s") or {}
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_rss_mb = peak_rss / (1024 * 1024) if sys.platform == "darwin" else peak_rss / 1024
+
+    result = {
+        "trials": trials,
+        "valid_sequences": summary.get("valid_sequences", 0),
+        "errors": summary.get("errors", 0),
+        "retries": summary.get("retries", 0),
+        "wall_s": wall_s,
+        "trials_per_s": trials / wall_s if wall_s > 0 else None,
+        "cpu_s": cpu_s,
+        "cpu_s_per_trial": cpu_s / trials if trials else None,
+        "peak_rss_mb": peak_rss_mb,
+        "latency_p50_s": latency.get("p50"),
+        "latency_p95_s": latency.get("p95"),
+        "latency_p99_s": latency.get("p99"),
+    }
+    with open(result_path, "w", encoding="utf-8") as f:
+        json.dump(result, f)
+
+
+def run_scenario(scenario, responses, num_simulations, latency_mean, tokens_per_second, requests_per_second,
+                 max_retries, timeout):
+    """
+    Starts a mock server for the scenario and runs the runner in a child process against it.
+
+    Returns:
+        dict: The scenario with its measurements (or an "error" entry if the child failed).
+    """
+    # Half the injected failures are 429s (rate limiter feedback), half 500s (plain retries)
+    server = start_mock_server(responses=responses, latency="lognormal", latency_mean=latency_mean,
+                               tokens_per_second=tokens_per_second, rate_429=scenario["error_rate"] / 2,
+                               rate_500=scenario["error_rate"] / 2)
+    env = dict(os.environ)
+    env["LAMBDA_INFERENCE_API_BASE"] = server.base_url
+    env["LAMBDA_INFERENCE_API_KEY"] = "mock"
+    env.setdefault("LAMBDA_CLOUD_API_KEY", "mock")
+    env.setdefault("SSH_KEY_NAME", "mock")
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [REPO_DIR, env.get("PYTHONPATH")]))
+
+    entry = dict(scenario, num_simulations=num_simulations)
+    try:
+        with tempfile.TemporaryDirectory(prefix="coinflip_bench_") as work_dir:
+            scenario_path = os.path.join(work_dir, "scenario.json")
+            result_path = os.path.join(work_dir, "result.json")
+            with open(scenario_path, "w", encoding="utf-8") as f:
+                json.dump(dict(entry, requests_per_second=requests_per_second, max_retries=max_retries), f)
+            completed = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--worker", scenario_path, result_path],
+                cwd=work_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, timeout=timeout,
+            )
+            if completed.returncode != 0 or not os.path.exists(result_path):
+                stderr_tail = completed.stderr.strip().splitlines()[-1:] or ["no output"]
+                entry["error"] = f"exit code {completed.returncode}: {stderr_tail[0]}"
+            else:
+                with open(result_path, "r", encoding="utf-8") as f:
+                    entry.update(json.load(f))
+    except subprocess.TimeoutExpired:
+        entry["error"] = f"timed out after {timeout}s"
+    finally:
+        entry["mock_requests"] = server.request_count
+        server.shutdown()
+        server.server_close()
+    return entry
+
+
+def compare_to_baseline(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Scenario-by-scenario comparison with a baseline run.
+
+    Returns:
+        list: One dict per metric that got worse by more than `tolerance` (relative):
+              scenario, metric, baseline, current and change.
+    """
+    baseline_by_name = {scenario_name(entry): entry for entry in baseline.get("scenarios", [])}
+    regressions = []
+    for entry in results:
+        previous = baseline_by_name.get(scenario_name(entry))
+        if previous is None or entry.get("error") or previous.get("error"):
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            old, new = previous.get(metric), entry.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (change < -tolerance) if higher_is_better else (change > tolerance):
+                regressions.append({"scenario": scenario_name(entry), "metric": metric,
+                                    "baseline": old, "current": new, "change": change})
+    return regressions
+
+
+def _fmt(value, spec):
+    return "n/a" if value is None else format(value, spec)
+
+
+def print_results(results):
+    print(f"\n{'scenario':<42} {'trials/s':>9} {'cpu ms/trial':>13} {'rss MB':>8} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} {'retries':>8} {'valid':>6}")
+    for entry in results:
+        if entry.get("error"):
+            print(f"{scenario_name(entry):<42} ERROR: {entry['error']}")
+            continue
+        cpu_ms = entry["cpu_s_per_trial"] * 1000 if entry.get("cpu_s_per_trial") is not None else None
+        print(f"{scenario_name(entry):<42} {_fmt(entry['trials_per_s'], '9.2f')} {_fmt(cpu_ms, '13.2f')} "
+              f"{_fmt(entry['peak_rss_mb'], '8.1f')} {_fmt(entry['latency_p50_s'], '7.3f')} "
+              f"{_fmt(entry['latency_p95_s'], '7.3f')} {_fmt(entry['latency_p99_s'], '7.3f')} "
+              f"{entry['retries']:>8} {entry['valid_sequences']:>6}")
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def main():
+    if len(sys.argv) == 4 and sys.argv[1] == "--worker":
+        run_worker(sys.argv[2], sys.argv[3])
+        return
+
+    parser = argparse.ArgumentParser(description="Throughput benchmark of the coin flip runners against the mock endpoint.")
+    parser.add_argument("--scripts", nargs="+", default=DEFAULT_SCRIPTS, help="Runner modules to benchmark")
+    parser.add_argument("--modes", nargs="+", default=DEFAULT_MODES, help="run_coin_flip_simulation modes (autogen, direct, stream, ...)")
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 8, 32])
+    parser.add_argument("--bodies", nargs="+", default=sorted(RESPONSE_BODIES), help=f"Response bodies: {sorted(RESPONSE_BODIES)}")
+    parser.add_argument("--error-rates", nargs="+", type=float, default=[0.0, 0.1], help="Share of injected 429/500 answers")
+    parser.add_argument("--num-simulations", type=int, default=100)
+    parser.add_argument("--latency-mean", type=float, default=0.05, help="Mock time to first token (lognormal mean, seconds)")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="Mock generation speed (0: instant)")
+    parser.add_argument("--rps", type=float, default=1000.0, help="Runner request rate (high, so the limiter does not cap the benchmark)")
+    parser.add_argument("--max-retries", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=600.0, help="Seconds before a scenario is abandoned")
+    parser.add_argument("--save", default=None, help="Output JSON path (default: results/benchmarks/benchmark_<timestamp>.json)")
+    parser.add_argument("--baseline", default=None, help="Earlier benchmark JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="Relative change that counts as a regression")
+    args = parser.parse_args()
+    # With more concurrent clients than the mock's listen backlog, dropped connections (SYN retries after ~1 s)
+    # would dominate the latency percentiles and retries instead of the runner
+    if max(args.concurrency) > MockInferenceServer.request_queue_size:
+        parser.error(f"--concurrency above the mock server's listen backlog ({MockInferenceServer.request_queue_size}) "
+                     "would measure the mock, not the runner")
+
+    scenarios = build_scenarios(args.scripts, args.modes, args.concurrency, args.bodies, args.error_rates)
+    bodies = {body: load_archive_responses([RESPONSE_BODIES[body]]) for body in set(args.bodies)}
+    print(f"Running {len(scenarios)} benchmark scenarios x {args.num_simulations} simulations")
+
+    results = []
+    for scenario in scenarios:
+        print(f"Scenario {scenario_name(scenario)} ...")
+        results.append(run_scenario(scenario, bodies[scenario["body"]], args.num_simulations, args.latency_mean,
+                                    args.tokens_per_second, args.rps, args.max_retries, args.timeout))
+    print_results(results)
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    output = {
+        "timestamp": timestamp,
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "mock_backlog": MockInferenceServer.request_queue_size,
+        "settings": {key: value for key, value in vars(args).items() if key not in ("save", "baseline")},
+        "scenarios": results,
+    }
+    save_path = args.save or os.path.join(BENCHMARK_DIR, f"benchmark_{timestamp}.json")
+    os.makedirs(os.path.dirname(save_path) or ".", exist_ok=True)
+    with open(save_path, "w", encoding="utf-8") as f:
+        json.dump(output, f, indent=2)
+    print(f"\nBenchmark results saved to {save_path}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        # Baselines saved before the mock's backlog was raised (socketserver's default of 5) measured the mock's
+        # listen queue at higher concurrency
+        baseline_backlog = baseline.get("mock_backlog", 5)
+        if baseline_backlog < max(args.concurrency):
+            print(f"Warning: {args.baseline} was recorded with a mock listen backlog of {baseline_backlog}; its latency "
+                  f"and retries above concurrency {baseline_backlog} are not comparable. Re-record the baseline.")
+        regressions = compare_to_baseline(results, baseline, args.tolerance)
+        print(f"Compared with {args.baseline} (revision {baseline.get('git_revision')}, tolerance {args.tolerance:.0%}):")
+        if not regressions:
+            print("No regressions.")
+        for regression in regressions:
+            print(f"  REGRESSION {regression['scenario']} {regression['metric']}: "
+                  f"{regression['baseline']:.4g} -> {regression['current']:.4g} ({regression['change']:+.1%})")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,28 @@
+import argparse
 import re
+import sqlite3
 import pandas as pd
 from scipy.stats import binom
 import os
 import matplotlib.pyplot as plt
 import numpy as np
 from matplotlib.ticker import PercentFormatter
+from flip_codes import DENSE_MAX_LENGTH, SEQUENCE_LENGTH, decode_sequences, encode_sequences, popcount
+from flip_extraction import EXTRACTION_STRATEGIES
+from run_catalog import DEFAULT_CATALOG_PATH, load_run_sequences, scan_results, select_runs, strategy_condition
+from run_store import DEFAULT_STORE_DIR, latest_run_id, load_sequences, stored_num_flips
 
-# --- parse_simulation_results_file function (remains the same) ---
-def parse_simulation_results_file(filepath):
+# --- parse_simulation_results_file function (sequence length as a parameter, 10 by default) ---
+def parse_simulation_results_file(filepath, n_trials=SEQUENCE_LENGTH):
     sequences = []
-    pattern = re.compile(r"Simulation \d+ sequence: ([HT]{10})")
+    pattern = re.compile(rf"Simulation \d+ sequence: ([HT]{{{n_trials}}})")
     try:
         with open(filepath, 'r', encoding='utf-8') as f:
             for line in f:
                 match = pattern.search(line)
                 if match:
                     sequence = match.group(1)
-                    if len(sequence) == 10 and all(c in 'HT' for c in sequence):
+                    if len(sequence) == n_trials and all(c in 'HT' for c in sequence):
                         sequences.append(sequence)
     except FileNotFoundError:
         print(f"Error: File not found at '{filepath}'")
@@ -25,59 +31,67 @@ def parse_simulation_results_file(filepath):
         print(f"An error occurred while reading the file: {e}")
         return []
     if not sequences:
-        print(f"No valid 'Simulation X sequence: [HT]{{10}}' lines found in {filepath}.")
+        print(f"No valid 'Simulation X sequence: [HT]{{{n_trials}}}' lines found in {filepath}.")
     return sequences
 
-# --- analyze_coin_flips_to_df function (remains the same) ---
-def analyze_coin_flips_to_df(flip_sequences):
-    if not flip_sequences:
+_BINOMIAL_PMF_TABLES = {}
+
+def binomial_pmf_table(n_trials=10, p_success=0.5):
+    """P(k heads), k = 0..n_trials, computed once per (n_trials, p_success) and indexed by head count."""
+    key = (n_trials, p_success)
+    if key not in _BINOMIAL_PMF_TABLES:
+        table = binom.pmf(np.arange(n_trials + 1), n_trials, p_success)
+        table.setflags(write=False)
+        _BINOMIAL_PMF_TABLES[key] = table
+    return _BINOMIAL_PMF_TABLES[key]
+
+# --- analyze_coin_flips_to_df function ---
+# Vectorized: validity masks and head counts from the bit-packed sequences (flip_codes), the binomial PMF table
+# indexed by head count and sequence frequencies from one bincount over the codes (np.unique beyond
+# DENSE_MAX_LENGTH flips, so long sequences never allocate 2^n_trials bins)
+def analyze_coin_flips_to_df(flip_sequences, n_trials=SEQUENCE_LENGTH):
+    if flip_sequences is None or len(flip_sequences) == 0:
         print("No flip sequences to analyze.")
         return None
-    data_for_df = []
-    n_trials = 10
     p_success = 0.5
-    for i, seq in enumerate(flip_sequences):
-        if len(seq) == n_trials and all(c in 'HT' for c in seq):
-            num_heads = seq.count('H')
-            num_tails = n_trials - num_heads
-            binomial_prob_for_this_num_heads = binom.pmf(num_heads, n_trials, p_success)
-            data_for_df.append({
-                "simulation_id": i + 1,
-                "flip_sequence": seq,
-                "num_heads": num_heads,
-                "num_tails": num_tails,
-                "binomial_probability_of_heads": binomial_prob_for_this_num_heads
-            })
-        else:
-            print(f"Warning: Skipping invalid sequence: '{seq}' (ID {i+1} in input list)")
-    if not data_for_df:
+    codes, valid = encode_sequences(flip_sequences, n_trials)
+    for i in np.flatnonzero(~valid):
+        print(f"Warning: Skipping invalid sequence: '{flip_sequences[i]}' (ID {i+1} in input list)")
+    if not valid.any():
         print("No valid sequences processed to create initial detailed DataFrame.")
         return None
-    df = pd.DataFrame(data_for_df)
-    if not df.empty and 'flip_sequence' in df.columns:
-        df['sequence_frequency'] = df.groupby('flip_sequence')['flip_sequence'].transform('size')
+    codes = codes[valid]
+    num_heads = n_trials - popcount(codes)
+    if n_trials <= DENSE_MAX_LENGTH:
+        sequence_frequency = np.bincount(codes, minlength=2 ** n_trials)[codes]
     else:
-        df['sequence_frequency'] = 0
-    return df
-
-# --- create_summary_for_plotting function (remains the same) ---
-def create_summary_for_plotting(detailed_df, total_simulations):
+        _, inverse, counts = np.unique(codes, return_inverse=True, return_counts=True)
+        sequence_frequency = counts[inverse]
+    return pd.DataFrame({
+        "simulation_id": np.flatnonzero(valid) + 1,
+        "flip_sequence": decode_sequences(codes, n_trials),
+        "num_heads": num_heads,
+        "num_tails": n_trials - num_heads,
+        "binomial_probability_of_heads": binomial_pmf_table(n_trials, p_success)[num_heads],
+        "sequence_frequency": sequence_frequency.astype(np.int64),
+    })
+
+# --- create_summary_for_plotting function ---
+# expected_distribution (optional): P(k heads) for k = 0..n_trials from another source, e.g. logprob_probe.py;
+# it is added as an 'expected_probability' column next to the binomial and observed ones
+def create_summary_for_plotting(detailed_df, total_simulations, expected_distribution=None, n_trials=SEQUENCE_LENGTH):
     if detailed_df is None or detailed_df.empty: return None
-    n_trials = 10
     p_success = 0.5
-    observed_head_counts = detailed_df['num_heads'].value_counts().sort_index()
-    summary_data = []
-    for k_heads in range(n_trials + 1): # From 0 to 10 heads
-        binomial_prob = binom.pmf(k_heads, n_trials, p_success)
-        observed_freq = observed_head_counts.get(k_heads, 0)
-        observed_prob = observed_freq / total_simulations if total_simulations > 0 else 0
-        summary_data.append({
-            "num_heads": k_heads,
-            "binomial_probability": binomial_prob,
-            "observed_frequency": observed_freq,
-            "observed_probability": observed_prob
-        })
-    return pd.DataFrame(summary_data)
+    observed_frequency = np.bincount(detailed_df['num_heads'].to_numpy(), minlength=n_trials + 1)[:n_trials + 1]
+    summary = {
+        "num_heads": np.arange(n_trials + 1),
+        "binomial_probability": binomial_pmf_table(n_trials, p_success),
+        "observed_frequency": observed_frequency,
+        "observed_probability": observed_frequency / total_simulations if total_simulations > 0 else np.zeros(n_trials + 1),
+    }
+    if expected_distribution is not None:
+        summary["expected_probability"] = np.asarray(expected_distribution, dtype=float)[:n_trials + 1]
+    return pd.DataFrame(summary)
 
 # --- plot_single_yaxis_percentages function (remains the same) ---
 def plot_single_yaxis_percentages(summary_df):
@@ -88,16 +102,22 @@ def plot_single_yaxis_percentages(summary_df):
     binomial_probs = summary_df["binomial_probability"]
     observed_probs = summary_df["observed_probability"]
     x = np.arange(len(num_heads))
-    width = 0.35
+    has_expected = "expected_probability" in summary_df.columns
+    width = 0.27 if has_expected else 0.35
     fig, ax = plt.subplots(figsize=(14, 8))
     def prob_to_percent_str(val):
         return f"{val*100:.1f}%"
-    rects1 = ax.bar(x - width/2, binomial_probs, width, label='Binomial Probability (Theoretical)', color='skyblue')
+    offset = width if has_expected else width/2
+    rects1 = ax.bar(x - offset, binomial_probs, width, label='Binomial Probability (Theoretical)', color='skyblue')
     ax.bar_label(rects1, padding=3, labels=[prob_to_percent_str(p) for p in binomial_probs])
-    rects2 = ax.bar(x + width/2, observed_probs, width, label='Observed Probability (from Simulations)', color='lightcoral')
+    rects2 = ax.bar(x if has_expected else x + width/2, observed_probs, width, label='Observed Probability (from Simulations)', color='lightcoral')
     ax.bar_label(rects2, padding=3, labels=[prob_to_percent_str(p) for p in observed_probs])
+    if has_expected:
+        expected_probs = summary_df["expected_probability"]
+        rects3 = ax.bar(x + width, expected_probs, width, label='Expected Probability (from Logprobs)', color='mediumseagreen')
+        ax.bar_label(rects3, padding=3, labels=[prob_to_percent_str(p) for p in expected_probs])
     ax.set_ylabel('Probability / Observed Proportion')
-    ax.set_xlabel('Number of Heads in 10 Flips')
+    ax.set_xlabel(f'Number of Heads in {len(num_heads) - 1} Flips')
     ax.set_title('Comparison of Theoretical Binomial Probability and Observed Simulation Proportion')
     ax.set_xticks(x)
     ax.set_xticklabels(num_heads)
@@ -141,25 +161,60 @@ def calculate_total_variation_distance(summary_df):
 def main():
     """
     Main function to orchestrate reading, parsing, analyzing, and plotting.
+    Sequences come from the run store (one column of a stored run), a run catalog query (--where) or, with
+    --file, from a text report.
     """
-    # Use a raw string or forward slashes for Windows paths
-    file_to_analyze = r"D:\Witold\Documents\Computing\LLMAgentsOfficial\Hackathon2\Lambda\lambda_inference_api_function_calling_workshop\results\coin_flips_prioritized_20250530_205248DSR1Temp1_5.txt" 
-    
+    parser = argparse.ArgumentParser(description="Observed vs binomial head-count distribution of one run.")
+    parser.add_argument("--run", default=None, help="Run id in the run store (default: the latest stored run; see python run_store.py list)")
+    parser.add_argument("--strategy", default="prioritized", choices=list(EXTRACTION_STRATEGIES), help="Extraction column to analyze (with --where: unless the condition names a strategy)")
+    parser.add_argument("--file", default=None, help="Read a coin_flips_prioritized_*.txt style text report instead of the run store")
+    parser.add_argument("--where", default=None,
+                        help="Latest run of the run catalog matching an SQL condition, e.g. \"model = 'deepseek-r1' AND temperature >= 1 AND strategy = 'final_answer'\"")
+    parser.add_argument("--catalog", default=DEFAULT_CATALOG_PATH)
+    parser.add_argument("--store-dir", default=DEFAULT_STORE_DIR)
+    parser.add_argument("--num-flips", type=int, default=SEQUENCE_LENGTH,
+                        help="Sequence length of a --file report (stored and catalogued runs record their own)")
+    args = parser.parse_args()
+
     # Define results directory
     results_dir = "results"
 
-    if not os.path.exists(file_to_analyze):
-        print(f"The file '{file_to_analyze}' does not exist. Please check the path.")
-        return
+    if args.file:
+        if not os.path.exists(args.file):
+            print(f"The file '{args.file}' does not exist. Please check the path.")
+            return
+        print(f"Reading simulations from: {args.file}")
+        n_trials = args.num_flips
+        sequences = parse_simulation_results_file(args.file, n_trials)
+    elif args.where:
+        scan_results(results_dir, args.catalog, args.store_dir)
+        where, params = strategy_condition(args.where, args.strategy)
+        try:
+            runs = select_runs(where, params, catalog_path=args.catalog)
+        except sqlite3.Error as e:
+            print(f"Error in --where condition: {e}")
+            return
+        if not runs:
+            print(f"No catalogued runs match: {args.where}")
+            return
+        run = runs[-1]
+        print(f"{len(runs)} catalogued run(s) match; reading '{run['strategy']}' sequences of {run['path']}")
+        n_trials = run.get("num_flips") or SEQUENCE_LENGTH
+        sequences = load_run_sequences(run)
+    else:
+        run_id = args.run or latest_run_id(args.store_dir)
+        if run_id is None:
+            print(f"No runs in {args.store_dir} yet (python run_store.py import adds the archived ones), or pass --file.")
+            return
+        print(f"Reading '{args.strategy}' sequences of run {run_id} from {args.store_dir}")
+        n_trials = stored_num_flips(run_id, args.store_dir)
+        sequences = load_sequences(run_id, args.strategy, args.store_dir, n_trials)
 
-    print(f"Reading simulations from: {file_to_analyze}")
-    sequences = parse_simulation_results_file(file_to_analyze)
-    
     if sequences:
         total_simulations = len(sequences)
         print(f"Successfully parsed {total_simulations} simulation sequences.")
             
-        detailed_results_df = analyze_coin_flips_to_df(sequences)
+        detailed_results_df = analyze_coin_flips_to_df(sequences, n_trials)
         
         if detailed_results_df is not None and not detailed_results_df.empty:
             print("\nDetailed Analysis DataFrame (Head):")
@@ -174,7 +229,7 @@ def main():
             except Exception as e:
                 print(f"Error saving detailed DataFrame to CSV: {e}")
 
-            summary_for_plot_df = create_summary_for_plotting(detailed_results_df, total_simulations)
+            summary_for_plot_df = create_summary_for_plotting(detailed_results_df, total_simulations, n_trials=n_trials)
             if summary_for_plot_df is not None:
                 print("\nSummary DataFrame for Plotting:")
                 print(summary_for_plot_df.to_string())
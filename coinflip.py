@@ -1,8 +1,21 @@
 import os
+import argparse
 from dotenv import load_dotenv
 import autogen
 from datetime import datetime
 import time
+from prompts import DIRECT_SYSTEM_MESSAGE, prompt_name
+from trial_engine import DEFAULT_CONCURRENCY, run_blocking_trials
+from inference_client import build_trial_request, run_direct_trials
+from trial_journal import (TrialJournal, iter_journal_records, journal_extraction_rows, journal_path_for,
+                           load_completed_ids, write_extraction_reports)
+from trial_metrics import write_metrics_report
+from run_store import write_run_from_journal
+from flip_extraction import is_valid_sequence, run_extractions
+from response_cache import DEFAULT_CACHE_DIR, DEFAULT_MAX_CACHE_MB, ResponseCache, run_replay_trials
+from raw_archive import parse_raw_archive
+from rate_limiter import DEFAULT_MAX_RETRIES, DEFAULT_REQUESTS_PER_SECOND, AdaptiveRateLimiter, estimate_request_tokens, is_retryable
+from sequential_test import DEFAULT_ALPHA, DEFAULT_MIN_TRIALS, DEFAULT_TVD_TOLERANCE, SequentialBiasTest
 
 # os.environ["OPENAI_API_REQUEST_TIMEOUT"] = "120"
 os.environ["AUTOGEN_USE_DOCKER"] = "False"
@@ -32,23 +45,7 @@ llm_config = {
     "max_tokens": 400,
 }
 
-COIN_SIMULATOR_SYSTEM_MESSAGE = (
-    "You are a direct output coin flip simulator. Your ONLY job is to IMMEDIATELY output a 10-character coin flip sequence ('H'/'T'), "
-    "a one-sentence explanation, and the word TERMINATE. NO OTHER TEXT, NO THINKING, NO PREAMBLE. "
-    "Your response MUST be ONLY the formatted output.\n\n"
-    "STRICT FORMAT (NO DEVIATIONS):\n"
-    "[10_CHAR_SEQUENCE_HT_ONLY_NO_SPACES_OR_OTHER_CHARS]\n"
-    "---Explanation---\n"
-    "[ONE_SENTENCE_EXPLANATION_OF_RANDOMIZATION_METHOD]\n"
-    "TERMINATE\n\n"
-    "EXAMPLE OF YOUR EXACT AND ONLY OUTPUT:\n"
-    "THTHTHTHHT\n"
-    "---Explanation---\n"
-    "Each flip was simulated with a 50% chance for H or T, independently.\n"
-    "TERMINATE\n\n"
-    "If your output contains any text before the 10-character sequence or any 'thinking' text, it is incorrect. "
-    "Produce ONLY the final answer in the specified format."
-)
+COIN_SIMULATOR_SYSTEM_MESSAGE = DIRECT_SYSTEM_MESSAGE
 
 def validate_flips(flip_result_str): # Parameter renamed for clarity
     if not isinstance(flip_result_str, str):
@@ -58,21 +55,7 @@ def validate_flips(flip_result_str): # Parameter renamed for clarity
     sequence_part = flip_result_str[:10] # Assuming sequence is at the start
     return all(c in 'HT' for c in sequence_part)
 
-def extract_flips(full_response_content):
-    if not isinstance(full_response_content, str):
-        return ""
-    lines = full_response_content.splitlines()
-    for line in lines:
-        cleaned_line = line.strip()
-        if len(cleaned_line) >= 10 and all(c in 'HT' for c in cleaned_line[:10]):
-            return cleaned_line[:10]
-        if len(cleaned_line) == 10 and all(c in 'HT' for c in cleaned_line): # Handles case where line is *only* the sequence
-            return cleaned_line
-    # Fallback: extract first 10 H/T characters found anywhere
-    found_chars = "".join(c for c in full_response_content if c in "HT")
-    return found_chars[:10]
-
-def run_coin_flip_simulation():
+def create_agents():
     user_proxy = autogen.UserProxyAgent(
         name="user_proxy",
         system_message="You are a coordinator.",
@@ -80,122 +63,243 @@ def run_coin_flip_simulation():
         is_termination_msg=lambda x: x.get("content", "").rstrip().endswith("TERMINATE"),
         code_execution_config=False,
     )
+    coin_flipper = autogen.AssistantAgent(
+        name="coin_flipper",
+        llm_config=llm_config,
+        system_message=COIN_SIMULATOR_SYSTEM_MESSAGE
+    )
+    return user_proxy, coin_flipper
 
-    results = []
-    full_responses = []
-
-    def save_results_manual(full_message, processed_flips_str):
-        full_responses.append(full_message)
-        # Validate the processed_flips_str which should be the 10-char sequence
-        if len(processed_flips_str) == 10 and all(c in 'HT' for c in processed_flips_str):
-            results.append(processed_flips_str)
-            print(f"Valid flip recorded: {processed_flips_str}")
-        else:
-            # This case should be less common now if extract_flips is good
-            print(f"Invalid flip string passed to save_results_manual: '{processed_flips_str}' from full message: '{full_message[:100]}...'")
+def run_single_simulation(simulation_id):
+    """
+    Runs one user_proxy <-> coin_flipper chat and returns a record with the flipper's reply (after TERMINATE removal).
+    Each call builds its own pair of agents so several simulations can run in parallel threads.
+    """
+    i = simulation_id - 1
+    start = time.perf_counter()
+    print(f"\n--- Starting Simulation {i+1} ---")
+    chat_message = f"Simulate 10 flips for simulation {i+1}. Output ONLY in the specified format and end with TERMINATE."
+    
+    # Default response content in case of issues
+    last_response_content_for_processing = "Error: Chat did not produce a usable response."
+    error = None
+    error_status = None
 
-    print("Attempting to initialize AssistantAgent...")
     try:
-        coin_flipper = autogen.AssistantAgent(
-            name="coin_flipper",
-            llm_config=llm_config,
-            system_message=COIN_SIMULATOR_SYSTEM_MESSAGE
+        user_proxy, coin_flipper = create_agents()
+        print(f"Attempting to initiate chat for simulation {i+1}...")
+        chat_res = user_proxy.initiate_chat(
+            coin_flipper,
+            message=chat_message,
+            max_rounds=2 # Kept at 2, as it seems to take 2 assistant turns
         )
-        print("AssistantAgent initialized successfully.")
+        print(f"Chat for simulation {i+1} completed (or reached max_rounds).")
+
+        flipper_final_reply_content = ""
+        if chat_res and chat_res.chat_history:
+            for msg_item in reversed(chat_res.chat_history): # Use msg_item
+                if msg_item.get("name") == coin_flipper.name and msg_item.get("content"): # Use msg_item
+                    flipper_final_reply_content = str(msg_item.get("content")).strip()
+                    if flipper_final_reply_content.rstrip().endswith("TERMINATE"):
+                        terminate_index = flipper_final_reply_content.rfind("TERMINATE")
+                        if terminate_index != -1:
+                            flipper_final_reply_content = flipper_final_reply_content[:terminate_index].strip()
+                    break 
+        
+        if flipper_final_reply_content:
+            last_response_content_for_processing = flipper_final_reply_content
+        elif chat_res and chat_res.summary:
+            print(f"Warning: No direct message from {coin_flipper.name} containing TERMINATE found, using chat summary.")
+            last_response_content_for_processing = chat_res.summary # This might not be ideal
+        else:
+            print(f"Error: Simulation {i+1} - No valid response or summary from Coin Flipper.")
+            # last_response_content_for_processing remains the default error message
+
     except Exception as e:
-        print(f"ERROR initializing AssistantAgent: {e}")
+        print(f"CRITICAL ERROR during chat for simulation {i+1}: {e}")
         import traceback
         traceback.print_exc()
-        return
+        last_response_content_for_processing = f"Error: Exception during chat - {e}"
+        error = str(e)
+        error_status = getattr(e, "status_code", None)
 
-    for i in range(100): # Number of simulations
-        print(f"\n--- Starting Simulation {i+1} ---")
-        chat_message = f"Simulate 10 flips for simulation {i+1}. Output ONLY in the specified format and end with TERMINATE."
-        
-        # Default response content in case of issues
-        last_response_content_for_processing = "Error: Chat did not produce a usable response."
+    print(f"Simulation {i+1} raw full response (after TERMINATE removal):\nSTART>>>\n{last_response_content_for_processing}\n<<<END")
+    record = {"simulation_id": simulation_id, "raw_output": last_response_content_for_processing, "latency_s": time.perf_counter() - start}
+    if error:
+        record["error"] = error
+        record["error_status"] = error_status
+    return record
 
-        try:
-            print(f"Attempting to initiate chat for simulation {i+1}...")
-            chat_res = user_proxy.initiate_chat(
-                coin_flipper,
-                message=chat_message,
-                max_rounds=2 # Kept at 2, as it seems to take 2 assistant turns
-            )
-            print(f"Chat for simulation {i+1} completed (or reached max_rounds).")
-
-            flipper_final_reply_content = ""
-            if chat_res and chat_res.chat_history:
-                for msg_item in reversed(chat_res.chat_history): # Use msg_item
-                    if msg_item.get("name") == coin_flipper.name and msg_item.get("content"): # Use msg_item
-                        flipper_final_reply_content = str(msg_item.get("content")).strip()
-                        if flipper_final_reply_content.rstrip().endswith("TERMINATE"):
-                            terminate_index = flipper_final_reply_content.rfind("TERMINATE")
-                            if terminate_index != -1:
-                                flipper_final_reply_content = flipper_final_reply_content[:terminate_index].strip()
-                        break 
-            
-            if flipper_final_reply_content:
-                last_response_content_for_processing = flipper_final_reply_content
-            elif chat_res and chat_res.summary:
-                print(f"Warning: No direct message from {coin_flipper.name} containing TERMINATE found, using chat summary.")
-                last_response_content_for_processing = chat_res.summary # This might not be ideal
-            else:
-                print(f"Error: Simulation {i+1} - No valid response or summary from Coin Flipper.")
-                # last_response_content_for_processing remains the default error message
+def run_coin_flip_simulation(num_simulations=100, concurrency=DEFAULT_CONCURRENCY, mode="autogen", token_budget=None,
+                             journal_path=None, resume=False, cache_dir=None, cache_max_mb=DEFAULT_MAX_CACHE_MB,
+                             replay=False, replay_archive=None, requests_per_second=DEFAULT_REQUESTS_PER_SECOND,
+                             tokens_per_minute=None, max_retries=DEFAULT_MAX_RETRIES, early_stop=False, alpha=DEFAULT_ALPHA,
+                             tvd_tolerance=DEFAULT_TVD_TOLERANCE, min_trials=DEFAULT_MIN_TRIALS, text_reports=True):
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+    # Ensure the "results" directory exists
+    results_dir = "results"
+    if not os.path.exists(results_dir):
+        os.makedirs(results_dir)
+
+    # Every finished simulation goes straight to the journal; the report below is rebuilt from it
+    if journal_path is None:
+        journal_path = journal_path_for(timestamp, results_dir)
+    completed_ids = load_completed_ids(journal_path) if resume else set()
+    if completed_ids:
+        print(f"Resuming from {journal_path}: {len(completed_ids)} simulations already completed.")
+    simulation_ids = [sid for sid in range(1, num_simulations + 1) if sid not in completed_ids]
 
+    # num_simulations becomes the maximum budget: stop as soon as the bias verdict is settled
+    sequential_test = SequentialBiasTest(alpha, tvd_tolerance, min_trials) if early_stop else None
+    if sequential_test is not None:
+        for record in iter_journal_records(journal_path) if completed_ids else ():
+            if not record.get("error"):
+                sequential_test.add(record["extractions"]["extract_flips"])
+        if sequential_test.should_stop():
+            print(f"Sequential test already settled by the resumed journal ({sequential_test.verdict}); no new trials.")
+            simulation_ids = []
+    should_stop = sequential_test.should_stop if sequential_test is not None else None
+
+    # Same request the direct path sends; also the response cache key for every mode
+    request_builder = lambda simulation_id: build_trial_request(simulation_id, llm_config, COIN_SIMULATOR_SYSTEM_MESSAGE)
+    cache = ResponseCache(cache_dir, cache_max_mb * 1024 * 1024) if cache_dir else None
+    # Paces requests at the provider's limit (AIMD on 429/503) instead of a fixed sleep between trials
+    rate_limiter = AdaptiveRateLimiter(requests_per_second, tokens_per_minute)
+
+    if mode == "autogen" and not replay:
+        print("Attempting to initialize AssistantAgent...")
+        try:
+            create_agents()
+            print("AssistantAgent initialized successfully.")
         except Exception as e:
-            print(f"CRITICAL ERROR during chat for simulation {i+1}: {e}")
+            print(f"ERROR initializing AssistantAgent: {e}")
             import traceback
             traceback.print_exc()
-            last_response_content_for_processing = f"Error: Exception during chat - {e}"
+            return
 
-        print(f"Simulation {i+1} raw full response (after TERMINATE removal):\nSTART>>>\n{last_response_content_for_processing}\n<<<END")
-        
-        processed_flips_str = extract_flips(last_response_content_for_processing)
-            
-        print(f"Simulation {i+1} processed result: {processed_flips_str}")
-        save_results_manual(last_response_content_for_processing, processed_flips_str)
-        
-        user_proxy.reset()
-        coin_flipper.reset()
+    with TrialJournal(journal_path) as journal:
+        def save_results_manual(simulation_id, record):
+            full_message = record["raw_output"]
+            # Every registered strategy is stored; this script reports the "extract_flips" one
+            record["extractions"] = run_extractions(full_message)
+            processed_flips_str = record["extractions"]["extract_flips"]
+            print(f"Simulation {simulation_id} processed result: {processed_flips_str}")
+            record["extraction_ok"] = is_valid_sequence(processed_flips_str)
+            record["model"] = llm_config["config_list"][0]["model"]
+            record["temperature"] = llm_config.get("temperature")
+            journal.append(record)
+            if sequential_test is not None:
+                sequential_test.add(processed_flips_str)
+            # Validate the processed_flips_str which should be the 10-char sequence
+            if record["extraction_ok"]:
+                print(f"Valid flip recorded: {processed_flips_str}")
+            else:
+                # This case should be less common now if extract_flips is good
+                print(f"Invalid flip string passed to save_results_manual: '{processed_flips_str}' from full message: '{full_message[:100]}...'")
 
-    # Save full messages and statistics to file
-    if full_responses:
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        if replay:
+            # No network at all: every trial comes from the response cache or the archived raw outputs
+            archive = parse_raw_archive(replay_archive) if replay_archive else None
+            run_replay_trials(request_builder, simulation_ids, cache=cache, archive=archive, concurrency=concurrency,
+                              on_result=save_results_manual, collect_results=False, should_stop=should_stop)
+        elif mode in ("direct", "stream"):
+            # One chat-completion request per simulation through a shared client, no agents involved
+            run_direct_trials(
+                request_builder, simulation_ids, LAMBDA_API_KEY, LAMBDA_BASE_URL, concurrency=concurrency,
+                stream=(mode == "stream"), token_budget=token_budget, cache=cache,
+                rate_limiter=rate_limiter, max_retries=max_retries,
+                on_result=save_results_manual, collect_results=False, should_stop=should_stop,
+            )
+        else:
+            # Up to `concurrency` chats in flight at once
+            run_blocking_trials(run_single_simulation, simulation_ids, concurrency=concurrency,
+                                on_result=save_results_manual, collect_results=False, should_stop=should_stop,
+                                rate_limiter=rate_limiter, estimated_tokens=estimate_request_tokens(request_builder(1)),
+                                cache=cache, request_builder=request_builder,
+                                should_retry=is_retryable, max_retries=max_retries)
+
+    if sequential_test is not None:
+        summary = sequential_test.summary()
+        print(f"Sequential test: {summary['verdict']} after {summary['trials']} trials "
+              f"(TVD {summary['tvd']}, chi-square p-value {summary['p_value']})")
+        sequential_test.save(timestamp, results_dir)
+
+    # Save full messages and statistics to file (built from the journal, ordered by simulation id)
+    if os.path.getsize(journal_path) > 0 and text_reports:
         filename = f"coin_flip_results_{timestamp}.txt"
-        
-        # Ensure the "results" directory exists
-        results_dir = "results"
-        if not os.path.exists(results_dir):
-            os.makedirs(results_dir)
-        
         filepath = os.path.join(results_dir, filename) # Corrected path
         
         with open(filepath, "w", encoding="utf-8") as f:
             f.write("Coin Flip Simulation Results\n")
             f.write("==========================\n\n")
-            for idx, full_msg in enumerate(full_responses, 1):
-                f.write(f"--- Simulation {idx} Raw Full Response (after TERMINATE removal) ---\n{full_msg}\n---------------------------------------\n\n")
+            for record in iter_journal_records(journal_path):
+                f.write(f"--- Simulation {record['simulation_id']} Raw Full Response (after TERMINATE removal) ---\n{record['raw_output']}\n---------------------------------------\n\n")
             
             f.write("\nValidated 10-flip sequences:\n")
-            valid_flip_strings = [r for r in results if isinstance(r, str) and len(r) == 10 and all(c in 'HT' for c in r)]
-            for idx, result_str in enumerate(valid_flip_strings, 1):
-                f.write(f"Simulation {idx} sequence: {result_str}\n")
+            num_valid = 0
+            total_heads = 0
+            for record in iter_journal_records(journal_path):
+                result_str = record["extractions"]["extract_flips"]
+                if isinstance(result_str, str) and len(result_str) == 10 and all(c in 'HT' for c in result_str):
+                    num_valid += 1
+                    total_heads += result_str.count('H')
+                    f.write(f"Simulation {num_valid} sequence: {result_str}\n")
             
-            total_heads = sum(result_str.count('H') for result_str in valid_flip_strings)
-            total_flips = len(valid_flip_strings) * 10
+            total_flips = num_valid * 10
             heads_percentage = (total_heads / total_flips) * 100 if total_flips > 0 else 0
             
             f.write(f"\nStatistics:\n")
-            f.write(f"Total validated simulations: {len(valid_flip_strings)}\n")
+            f.write(f"Total validated simulations: {num_valid}\n")
             f.write(f"Total flips (from validated results): {total_flips}\n")
             f.write(f"Total heads: {total_heads}\n")
             f.write(f"Heads percentage: {heads_percentage:.2f}%\n")
         
         print(f"\nResults saved to {filepath}")
+        write_extraction_reports(journal_extraction_rows(journal_path), timestamp, results_dir)
+    if os.path.getsize(journal_path) > 0:
+        write_metrics_report(journal_path, timestamp, results_dir)
+        write_run_from_journal(journal_path, timestamp, {
+            "timestamp": timestamp, "source": "coinflip", "model": llm_config["config_list"][0]["model"],
+            "temperature": llm_config.get("temperature"), "max_tokens": llm_config.get("max_tokens"),
+            "prompt": prompt_name(COIN_SIMULATOR_SYSTEM_MESSAGE), "num_simulations": num_simulations,
+        })
+        print(f"Trial journal: {journal_path}")
     else:
         print("\nNo simulation responses to save.")
 
 if __name__ == "__main__":
-    run_coin_flip_simulation()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Coin flip simulations against the Lambda inference API.")
+    parser.add_argument("--num-simulations", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Number of simulations in flight at once")
+    parser.add_argument("--mode", choices=["autogen", "direct", "stream"], default="autogen",
+                        help="autogen: two-agent chat per simulation; direct: one chat-completion request per simulation; "
+                             "stream: like direct, but streamed and closed as soon as the sequence is captured")
+    parser.add_argument("--token-budget", type=int, default=None, help="stream mode: cut a reply off after this many tokens")
+    parser.add_argument("--journal", default=None, help="JSONL trial journal (default: results/coin_flip_journal_<timestamp>.jsonl)")
+    parser.add_argument("--resume", action="store_true", help="Skip simulations already completed in --journal")
+    parser.add_argument("--cache-dir", default=None, help=f"Cache responses on disk here (e.g. {DEFAULT_CACHE_DIR})")
+    parser.add_argument("--cache-max-mb", type=int, default=DEFAULT_MAX_CACHE_MB, help="Evict least recently used responses beyond this size")
+    parser.add_argument("--replay", action="store_true", help="Serve every trial from --cache-dir and/or --replay-archive, without any API call")
+    parser.add_argument("--replay-archive", default=None, help="Archived raw-output file to replay (e.g. results/coin_flips_raw_llm_outputs_*.txt)")
+    parser.add_argument("--rps", type=float, default=DEFAULT_REQUESTS_PER_SECOND, help="Starting requests/second (adapted on 429/503)")
+    parser.add_argument("--tpm", type=int, default=None, help="Tokens/minute limit of the provider, if any")
+    parser.add_argument("--max-retries", type=int, default=DEFAULT_MAX_RETRIES, help="Re-queue a failed simulation up to this many times")
+    parser.add_argument("--early-stop", action="store_true", help="Stop once the sequential bias test is settled (--num-simulations is the budget)")
+    parser.add_argument("--alpha", type=float, default=DEFAULT_ALPHA, help="Early stop: overall significance level")
+    parser.add_argument("--tvd-tolerance", type=float, default=DEFAULT_TVD_TOLERANCE, help="Early stop: TVD within which a model counts as fair")
+    parser.add_argument("--min-trials", type=int, default=DEFAULT_MIN_TRIALS, help="Early stop: valid sequences before the first look")
+    parser.add_argument("--no-text-reports", action="store_true",
+                        help="Only store the run in the Parquet run store (text reports: python run_store.py export <run id>)")
+    args = parser.parse_args()
+    if args.resume and not args.journal:
+        parser.error("--resume needs the --journal of the run to resume")
+    if args.replay and not (args.cache_dir or args.replay_archive):
+        parser.error("--replay needs --cache-dir and/or --replay-archive")
+    run_coin_flip_simulation(num_simulations=args.num_simulations, concurrency=args.concurrency, mode=args.mode,
+                             token_budget=args.token_budget, journal_path=args.journal, resume=args.resume,
+                             cache_dir=args.cache_dir, cache_max_mb=args.cache_max_mb,
+                             replay=args.replay, replay_archive=args.replay_archive,
+                             requests_per_second=args.rps, tokens_per_minute=args.tpm, max_retries=args.max_retries,
+                             early_stop=args.early_stop, alpha=args.alpha, tvd_tolerance=args.tvd_tolerance,
+                             min_trials=args.min_trials, text_reports=not args.no_text_reports)
\ No newline at end of file
@@ -1,13 +1,27 @@
 ##extract_flips_embedded_only_regex provides the "Priority 3 only" extraction. Its results go into coin_flips_embedded_only_{timestamp}.txt.
 ##extract_flips_prioritized_logic provides the "Priority 1 then 2 then 3 (and a final fallback)" extraction. Its results go into coin_flips_prioritized_{timestamp}.txt.
+##Every run is also stored in the Parquet run store (run_store.py), which the analysis scripts read; --no-text-reports skips the text files.
+##--num-flips asks for longer (or shorter) sequences than 10; prompt, extraction and reports follow it.
 ##Now, when you run this script, you'll get three output files. You can then compare the contents of coin_flips_prioritized_...txt and coin_flips_embedded_only_...txt to see how often the extraction methods differ and which one is more consistently getting the sequence you intend to capture from the LLM's output. The raw output file will be very helpful if you need to debug why an extraction failed or to refine the extraction logic further.
 
 import os
+import argparse
 from dotenv import load_dotenv
 import autogen
 from datetime import datetime
 import time
-import re # Import regex module
+from prompts import UNBIASED_SYSTEM_MESSAGE, prompt_name, sized_prompt
+from flip_codes import SEQUENCE_LENGTH
+from trial_engine import DEFAULT_CONCURRENCY, run_blocking_trials
+from inference_client import build_trial_request, run_direct_trials
+from flip_extraction import is_valid_sequence, run_extractions
+from trial_journal import TrialJournal, iter_journal_records, journal_path_for, load_completed_ids, write_reports_from_journal
+from trial_metrics import write_metrics_report
+from run_store import write_run_from_journal
+from response_cache import DEFAULT_CACHE_DIR, DEFAULT_MAX_CACHE_MB, ResponseCache, run_replay_trials
+from raw_archive import parse_raw_archive
+from rate_limiter import DEFAULT_MAX_RETRIES, DEFAULT_REQUESTS_PER_SECOND, AdaptiveRateLimiter, estimate_request_tokens, is_retryable
+from sequential_test import DEFAULT_ALPHA, DEFAULT_MIN_TRIALS, DEFAULT_TVD_TOLERANCE, SequentialBiasTest
 
 # --- Environment and Config (same as your original) ---
 # os.environ["OPENAI_API_REQUEST_TIMEOUT"] = "120"
@@ -35,84 +49,13 @@ llm_config = {
     "max_tokens": 1000,
 }
 
-COIN_SIMULATOR_SYSTEM_MESSAGE = ( # Using your latest aggressive prompt
-    "You are a direct output coin flip simulator. Your ONLY job is to output a 10-character random and unbiased coin flip sequence ('H'/'T'), "
-    "a one-sentence explanation, and the word TERMINATE. NO OTHER TEXT, NO THINKING, NO PREAMBLE. "
-    "Your response MUST be ONLY the formatted output.\n\n"
-    "STRICT FORMAT (NO DEVIATIONS):\n"
-    "[10_CHAR_SEQUENCE_HT_ONLY_NO_SPACES_OR_OTHER_CHARS]\n"
-    "---Explanation---\n"
-    "[ONE_SENTENCE_EXPLANATION_OF_RANDOMIZATION_METHOD]\n"
-    "TERMINATE\n\n"
-    "EXAMPLE OF YOUR EXACT AND ONLY OUTPUT:\n"
-    "THTHTHTHHT\n"
-    "---Explanation---\n"
-    "Each flip was simulated with a 50% chance for H or T, independently.\n"
-    "TERMINATE\n\n"
-    "Produce the final answer in the specified format."
-)
+COIN_SIMULATOR_SYSTEM_MESSAGE = UNBIASED_SYSTEM_MESSAGE # Using your latest aggressive prompt
 # --- End Environment and Config ---
 
-# --- NEW EXTRACTION FUNCTIONS ---
-def extract_flips_embedded_only_regex(full_response_content):
-    """
-    Priority 3 ONLY: Extracts the *first* 10-character H/T sequence found anywhere
-    within any line using regex. Returns empty string if none found.
-    """
-    if not isinstance(full_response_content, str):
-        return ""
-    
-    ht_pattern = re.compile(r"([HT]{10})")
-    lines = full_response_content.splitlines()
-    for line in lines:
-        # No strip here, regex will find it even with leading/trailing spaces in the line content
-        match = ht_pattern.search(line) 
-        if match:
-            return match.group(1) # Return the first one found in any line
-    return "" # If no embedded sequence found in any line
-
-def extract_flips_prioritized_logic(full_response_content):
-    """
-    Prioritized Logic:
-    1. Line is ONLY 10 H/T characters.
-    2. Line STARTS WITH 10 H/T characters.
-    3. Fallback: Regex for embedded 10 H/T sequence in any line.
-    4. Super Fallback: Concatenate all H/T and take first 10.
-    """
-    if not isinstance(full_response_content, str):
-        return ""
-
-    lines = full_response_content.splitlines()
-    ht_pattern_embedded = re.compile(r"([HT]{10})")
-
-    # Priority 1 & 2 (Clean lines)
-    for line in lines:
-        cleaned_line = line.strip()
-        # Priority 1: Line is ONLY 10 H/T characters
-        if len(cleaned_line) == 10 and all(c in 'HT' for c in cleaned_line):
-            return cleaned_line
-        # Priority 2: Line STARTS WITH 10 H/T characters
-        if len(cleaned_line) >= 10 and all(c in 'HT' for c in cleaned_line[:10]):
-            return cleaned_line[:10]
-
-    # Priority 3: Regex for embedded sequence (if not found by P1/P2)
-    for line in lines:
-        # Search in the original line (strip not strictly necessary for regex but okay)
-        match = ht_pattern_embedded.search(line.strip()) 
-        if match:
-            return match.group(1)
-            
-    # Priority 4 (Super Fallback): extract first 10 H/T characters found anywhere in the entire content
-    found_chars = "".join(c for c in full_response_content if c in "HT")
-    if len(found_chars) >= 10:
-        return found_chars[:10]
-    
-    return "" # Return empty if nothing suitable is found
-
-# --- End NEW EXTRACTION FUNCTIONS ---
+# --- Extraction functions live in flip_extraction.py, report writing in trial_journal.py (shared with sweep.py) ---
 
 
-def run_coin_flip_simulation():
+def create_agents(system_message=COIN_SIMULATOR_SYSTEM_MESSAGE):
     user_proxy = autogen.UserProxyAgent(
         name="user_proxy",
         system_message="You are a coordinator.",
@@ -120,136 +63,221 @@ def run_coin_flip_simulation():
         is_termination_msg=lambda x: x.get("content", "").rstrip().endswith("TERMINATE"),
         code_execution_config=False,
     )
+    coin_flipper = autogen.AssistantAgent(
+        name="coin_flipper",
+        llm_config=llm_config,
+        system_message=system_message
+    )
+    return user_proxy, coin_flipper
 
-    # Store raw responses and results from different extraction methods
-    all_raw_responses = [] # Stores the full LLM response (after TERMINATE removal)
-    results_prioritized_extraction = [] # For extract_flips_prioritized_logic
-    results_embedded_only_extraction = [] # For extract_flips_embedded_only_regex
 
-    print("Attempting to initialize AssistantAgent...")
+def run_single_simulation(simulation_id, num_simulations, num_flips=SEQUENCE_LENGTH):
+    """
+    Runs one user_proxy <-> coin_flipper chat and returns a record with the flipper's reply (after TERMINATE removal).
+    Each call builds its own pair of agents so several simulations can run in parallel threads.
+    """
+    i = simulation_id - 1
+    start = time.perf_counter()
+    print(f"\n--- Starting Simulation {i+1}/{num_simulations} ---")
+    chat_message = f"Simulate {num_flips} flips for simulation {i+1}. Output ONLY in the specified format and end with TERMINATE."
+    
+    raw_llm_output_cleaned = "Error: Chat did not produce a usable response."
+    error = None
+    error_status = None
+
     try:
-        coin_flipper = autogen.AssistantAgent(
-            name="coin_flipper",
-            llm_config=llm_config,
-            system_message=COIN_SIMULATOR_SYSTEM_MESSAGE
+        user_proxy, coin_flipper = create_agents(sized_prompt(COIN_SIMULATOR_SYSTEM_MESSAGE, num_flips))
+        # print(f"Attempting to initiate chat for simulation {i+1}...") # Less verbose
+        chat_res = user_proxy.initiate_chat(
+            coin_flipper,
+            message=chat_message,
+            max_rounds=2 
         )
-        print("AssistantAgent initialized successfully.")
-    except Exception as e:
-        print(f"ERROR initializing AssistantAgent: {e}")
-        import traceback
-        traceback.print_exc()
-        return
-
-    num_simulations = 100 # As requested
-    for i in range(num_simulations):
-        print(f"\n--- Starting Simulation {i+1}/{num_simulations} ---")
-        chat_message = f"Simulate 10 flips for simulation {i+1}. Output ONLY in the specified format and end with TERMINATE."
+        # print(f"Chat for simulation {i+1} completed (or reached max_rounds).") # Less verbose
+
+        flipper_final_reply_content = ""
+        if chat_res and chat_res.chat_history:
+            for msg_item in reversed(chat_res.chat_history):
+                if msg_item.get("name") == coin_flipper.name and msg_item.get("content"):
+                    flipper_final_reply_content = str(msg_item.get("content")).strip()
+                    if flipper_final_reply_content.rstrip().endswith("TERMINATE"):
+                        terminate_index = flipper_final_reply_content.rfind("TERMINATE")
+                        if terminate_index != -1:
+                            flipper_final_reply_content = flipper_final_reply_content[:terminate_index].strip()
+                    break 
         
-        raw_llm_output_cleaned = "Error: Chat did not produce a usable response."
+        if flipper_final_reply_content:
+            raw_llm_output_cleaned = flipper_final_reply_content
+        elif chat_res and chat_res.summary:
+            print(f"Warning (Sim {i+1}): No direct message from {coin_flipper.name} containing TERMINATE found, using chat summary.")
+            raw_llm_output_cleaned = chat_res.summary
+        else:
+            print(f"Error (Sim {i+1}): No valid response or summary from Coin Flipper.")
+    
+    except Exception as e:
+        print(f"CRITICAL ERROR during chat for simulation {i+1}: {e}")
+        # import traceback # Only if very verbose debugging is needed
+        # traceback.print_exc()
+        raw_llm_output_cleaned = f"Error: Exception during chat - {e}"
+        error = str(e)
+        error_status = getattr(e, "status_code", None)
 
+    record = {"simulation_id": simulation_id, "raw_output": raw_llm_output_cleaned, "latency_s": time.perf_counter() - start}
+    if error:
+        record["error"] = error
+        record["error_status"] = error_status
+    return record
+
+
+def run_coin_flip_simulation(num_simulations=100, concurrency=DEFAULT_CONCURRENCY, mode="autogen", token_budget=None,
+                             journal_path=None, resume=False, cache_dir=None, cache_max_mb=DEFAULT_MAX_CACHE_MB,
+                             replay=False, replay_archive=None, requests_per_second=DEFAULT_REQUESTS_PER_SECOND,
+                             tokens_per_minute=None, max_retries=DEFAULT_MAX_RETRIES, early_stop=False, alpha=DEFAULT_ALPHA,
+                             tvd_tolerance=DEFAULT_TVD_TOLERANCE, min_trials=DEFAULT_MIN_TRIALS, text_reports=True,
+                             num_flips=SEQUENCE_LENGTH):
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    results_dir = "results"  # Define the results directory
+    os.makedirs(results_dir, exist_ok=True)
+
+    # Every finished simulation (raw output + both extractions) goes straight to the journal
+    if journal_path is None:
+        journal_path = journal_path_for(timestamp, results_dir)
+    completed_ids = load_completed_ids(journal_path) if resume else set()
+    if completed_ids:
+        print(f"Resuming from {journal_path}: {len(completed_ids)} simulations already completed.")
+    simulation_ids = [sid for sid in range(1, num_simulations + 1) if sid not in completed_ids]
+
+    # num_simulations becomes the maximum budget: stop as soon as the bias verdict is settled
+    sequential_test = SequentialBiasTest(alpha, tvd_tolerance, min_trials, n_flips=num_flips) if early_stop else None
+    if sequential_test is not None:
+        for record in iter_journal_records(journal_path) if completed_ids else ():
+            if not record.get("error"):
+                sequential_test.add(record["extractions"]["prioritized"])
+        if sequential_test.should_stop():
+            print(f"Sequential test already settled by the resumed journal ({sequential_test.verdict}); no new trials.")
+            simulation_ids = []
+    should_stop = sequential_test.should_stop if sequential_test is not None else None
+
+    # Same request the direct path sends; also the response cache key for every mode
+    system_message = sized_prompt(COIN_SIMULATOR_SYSTEM_MESSAGE, num_flips)
+    request_builder = lambda simulation_id: build_trial_request(simulation_id, llm_config, system_message, num_flips)
+    cache = ResponseCache(cache_dir, cache_max_mb * 1024 * 1024) if cache_dir else None
+    # Paces requests at the provider's limit (AIMD on 429/503) instead of a fixed sleep between trials
+    rate_limiter = AdaptiveRateLimiter(requests_per_second, tokens_per_minute)
+
+    if mode == "autogen" and not replay:
+        print("Attempting to initialize AssistantAgent...")
         try:
-            # print(f"Attempting to initiate chat for simulation {i+1}...") # Less verbose
-            chat_res = user_proxy.initiate_chat(
-                coin_flipper,
-                message=chat_message,
-                max_rounds=2 
-            )
-            # print(f"Chat for simulation {i+1} completed (or reached max_rounds).") # Less verbose
-
-            flipper_final_reply_content = ""
-            if chat_res and chat_res.chat_history:
-                for msg_item in reversed(chat_res.chat_history):
-                    if msg_item.get("name") == coin_flipper.name and msg_item.get("content"):
-                        flipper_final_reply_content = str(msg_item.get("content")).strip()
-                        if flipper_final_reply_content.rstrip().endswith("TERMINATE"):
-                            terminate_index = flipper_final_reply_content.rfind("TERMINATE")
-                            if terminate_index != -1:
-                                flipper_final_reply_content = flipper_final_reply_content[:terminate_index].strip()
-                        break 
-            
-            if flipper_final_reply_content:
-                raw_llm_output_cleaned = flipper_final_reply_content
-            elif chat_res and chat_res.summary:
-                print(f"Warning (Sim {i+1}): No direct message from {coin_flipper.name} containing TERMINATE found, using chat summary.")
-                raw_llm_output_cleaned = chat_res.summary
-            else:
-                print(f"Error (Sim {i+1}): No valid response or summary from Coin Flipper.")
-        
+            create_agents(system_message)
+            print("AssistantAgent initialized successfully.")
         except Exception as e:
-            print(f"CRITICAL ERROR during chat for simulation {i+1}: {e}")
-            # import traceback # Only if very verbose debugging is needed
-            # traceback.print_exc()
-            raw_llm_output_cleaned = f"Error: Exception during chat - {e}"
+            print(f"ERROR initializing AssistantAgent: {e}")
+            import traceback
+            traceback.print_exc()
+            return
 
-        all_raw_responses.append(raw_llm_output_cleaned) # Save the processed LLM output
+    with TrialJournal(journal_path) as journal:
+        def record_trial(simulation_id, record):
+            raw_llm_output_cleaned = record["raw_output"]
 
-        # Perform both extractions
-        flips_prioritized = extract_flips_prioritized_logic(raw_llm_output_cleaned)
-        flips_embedded_only = extract_flips_embedded_only_regex(raw_llm_output_cleaned)
+            # Perform both extractions
+            record["extractions"] = run_extractions(raw_llm_output_cleaned, num_flips)
+            record["extraction_ok"] = is_valid_sequence(record["extractions"]["prioritized"], num_flips)
+            record["model"] = llm_config["config_list"][0]["model"]
+            record["temperature"] = llm_config.get("temperature")
+            record["num_flips"] = num_flips
+            journal.append(record)
+            if sequential_test is not None:
+                sequential_test.add(record["extractions"]["prioritized"])
 
-        results_prioritized_extraction.append(flips_prioritized)
-        results_embedded_only_extraction.append(flips_embedded_only)
-        
-        print(f"Sim {i+1}: Prioritized Extr: '{flips_prioritized}', Embedded-Only Extr: '{flips_embedded_only}'")
-        
-        user_proxy.reset()
-        coin_flipper.reset()
-        time.sleep(0.5) # Small delay to avoid overwhelming API if it's remote & sensitive
+            print(f"Sim {simulation_id}: Prioritized Extr: '{record['extractions']['prioritized']}', "
+                  f"Embedded-Only Extr: '{record['extractions']['embedded_only']}'")
 
-    # --- Save results to separate files ---
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    results_dir = "results"  # Define the results directory
-    os.makedirs(results_dir, exist_ok=True)  # Create the directory if it doesn't exist
-
-    # Helper function to save results
-    def save_results(filename, content):
-        filepath = os.path.join(results_dir, filename)
-        with open(filepath, "w", encoding="utf-8") as f:
-            f.write(content)
-        print(f"Results saved to {filepath}")
-
-    # File for Prioritized Extraction Results
-    filename_prioritized = f"coin_flips_prioritized_{timestamp}.txt"
-    content_prioritized = f"Coin Flip Simulation Results (Prioritized Extraction)\n"
-    content_prioritized += f"Timestamp: {timestamp}\n"
-    content_prioritized += f"Total Simulations Attempted: {num_simulations}\n"
-    content_prioritized += "==================================================\n\n"
-    content_prioritized += "Validated 10-flip sequences (Prioritized Logic):\n"
-    valid_count_prioritized = 0
-    for idx, seq in enumerate(results_prioritized_extraction):
-        if len(seq) == 10 and all(c in 'HT' for c in seq):
-            content_prioritized += f"Simulation {idx+1} sequence: {seq}\n"
-            valid_count_prioritized +=1
-        else:
-            content_prioritized += f"Simulation {idx+1} sequence: INVALID_OR_EMPTY ('{seq}')\n" # Log invalid ones too
-    save_results(filename_prioritized, content_prioritized)
-
-    # File for Embedded-Only (Regex) Extraction Results
-    filename_embedded = f"coin_flips_embedded_only_{timestamp}.txt"
-    content_embedded = f"Coin Flip Simulation Results (Embedded-Only Regex Extraction)\n"
-    content_embedded += f"Timestamp: {timestamp}\n"
-    content_embedded += f"Total Simulations Attempted: {num_simulations}\n"
-    content_embedded += "=========================================================\n\n"
-    content_embedded += "Validated 10-flip sequences (Embedded-Only Regex Logic):\n"
-    valid_count_embedded = 0
-    for idx, seq in enumerate(results_embedded_only_extraction):
-        if len(seq) == 10 and all(c in 'HT' for c in seq):
-            content_embedded += f"Simulation {idx+1} sequence: {seq}\n"
-            valid_count_embedded += 1
+        if replay:
+            # No network at all: every trial comes from the response cache or the archived raw outputs
+            archive = parse_raw_archive(replay_archive) if replay_archive else None
+            run_replay_trials(request_builder, simulation_ids, cache=cache, archive=archive, concurrency=concurrency,
+                              on_result=record_trial, collect_results=False, should_stop=should_stop)
+        elif mode in ("direct", "stream"):
+            # One chat-completion request per simulation through a shared client, no agents involved
+            run_direct_trials(
+                request_builder, simulation_ids, LAMBDA_API_KEY, LAMBDA_BASE_URL, concurrency=concurrency,
+                stream=(mode == "stream"), token_budget=token_budget, cache=cache,
+                rate_limiter=rate_limiter, max_retries=max_retries,
+                on_result=record_trial, collect_results=False, should_stop=should_stop,
+            )
         else:
-            content_embedded += f"Simulation {idx+1} sequence: INVALID_OR_EMPTY ('{seq}')\n"
-    save_results(filename_embedded, content_embedded)
+            # Up to `concurrency` chats in flight at once
+            trial_fn = lambda simulation_id: run_single_simulation(simulation_id, num_simulations, num_flips)
+            run_blocking_trials(
+                trial_fn,
+                simulation_ids,
+                concurrency=concurrency,
+                on_result=record_trial,
+                collect_results=False,
+                should_stop=should_stop,
+                rate_limiter=rate_limiter,
+                estimated_tokens=estimate_request_tokens(request_builder(1)),
+                cache=cache,
+                request_builder=request_builder,
+                should_retry=is_retryable,
+                max_retries=max_retries,
+            )
 
-    # Optionally, save the raw LLM responses too
-    filename_raw = f"coin_flips_raw_llm_outputs_{timestamp}.txt"
-    content_raw = f"Raw LLM Outputs (after TERMINATE removal)\n"
-    content_raw += f"Timestamp: {timestamp}\n"
-    content_raw += f"Total Simulations: {num_simulations}\n"
-    content_raw += "=========================================\n\n"
-    for idx, raw_output in enumerate(all_raw_responses):
-        content_raw += f"--- Simulation {idx+1} Raw Output ---\n{raw_output}\n-----------------------------------\n\n"
-    save_results(filename_raw, content_raw)
+    # --- Save results to separate files (rebuilt from the journal) ---
+    attempted = num_simulations
+    if sequential_test is not None:
+        summary = sequential_test.summary()
+        print(f"Sequential test: {summary['verdict']} after {summary['trials']} trials "
+              f"(TVD {summary['tvd']}, chi-square p-value {summary['p_value']})")
+        sequential_test.save(timestamp, results_dir)
+        attempted = summary["trials"]
+    if text_reports:
+        write_reports_from_journal(journal_path, timestamp, attempted, results_dir, length=num_flips)
+    write_metrics_report(journal_path, timestamp, results_dir)
+    write_run_from_journal(journal_path, timestamp, {
+        "timestamp": timestamp, "source": "coinflip_regex", "model": llm_config["config_list"][0]["model"],
+        "temperature": llm_config.get("temperature"), "max_tokens": llm_config.get("max_tokens"),
+        "prompt": prompt_name(system_message, num_flips), "num_simulations": attempted, "num_flips": num_flips,
+    })
+    print(f"Trial journal: {journal_path}")
 
 
 if __name__ == "__main__":
-    run_coin_flip_simulation()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Coin flip simulations (prioritized and embedded-only extraction) against the Lambda inference API.")
+    parser.add_argument("--num-simulations", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Number of simulations in flight at once")
+    parser.add_argument("--mode", choices=["autogen", "direct", "stream"], default="autogen",
+                        help="autogen: two-agent chat per simulation; direct: one chat-completion request per simulation; "
+                             "stream: like direct, but streamed and closed as soon as the sequence is captured")
+    parser.add_argument("--token-budget", type=int, default=None, help="stream mode: cut a reply off after this many tokens")
+    parser.add_argument("--journal", default=None, help="JSONL trial journal (default: results/coin_flip_journal_<timestamp>.jsonl)")
+    parser.add_argument("--resume", action="store_true", help="Skip simulations already completed in --journal")
+    parser.add_argument("--cache-dir", default=None, help=f"Cache responses on disk here (e.g. {DEFAULT_CACHE_DIR})")
+    parser.add_argument("--cache-max-mb", type=int, default=DEFAULT_MAX_CACHE_MB, help="Evict least recently used responses beyond this size")
+    parser.add_argument("--replay", action="store_true", help="Serve every trial from --cache-dir and/or --replay-archive, without any API call")
+    parser.add_argument("--replay-archive", default=None, help="Archived raw-output file to replay (e.g. results/coin_flips_raw_llm_outputs_*.txt)")
+    parser.add_argument("--rps", type=float, default=DEFAULT_REQUESTS_PER_SECOND, help="Starting requests/second (adapted on 429/503)")
+    parser.add_argument("--tpm", type=int, default=None, help="Tokens/minute limit of the provider, if any")
+    parser.add_argument("--max-retries", type=int, default=DEFAULT_MAX_RETRIES, help="Re-queue a failed simulation up to this many times")
+    parser.add_argument("--early-stop", action="store_true", help="Stop once the sequential bias test is settled (--num-simulations is the budget)")
+    parser.add_argument("--alpha", type=float, default=DEFAULT_ALPHA, help="Early stop: overall significance level")
+    parser.add_argument("--tvd-tolerance", type=float, default=DEFAULT_TVD_TOLERANCE, help="Early stop: TVD within which a model counts as fair")
+    parser.add_argument("--min-trials", type=int, default=DEFAULT_MIN_TRIALS, help="Early stop: valid sequences before the first look")
+    parser.add_argument("--num-flips", type=int, default=SEQUENCE_LENGTH, help="Flips per simulated sequence")
+    parser.add_argument("--no-text-reports", action="store_true",
+                        help="Only store the run in the Parquet run store (text reports: python run_store.py export <run id>)")
+    args = parser.parse_args()
+    if args.resume and not args.journal:
+        parser.error("--resume needs the --journal of the run to resume")
+    if args.replay and not (args.cache_dir or args.replay_archive):
+        parser.error("--replay needs --cache-dir and/or --replay-archive")
+    if args.num_flips < 1:
+        parser.error("--num-flips must be at least 1")
+    run_coin_flip_simulation(num_simulations=args.num_simulations, concurrency=args.concurrency, mode=args.mode,
+                             token_budget=args.token_budget, journal_path=args.journal, resume=args.resume,
+                             cache_dir=args.cache_dir, cache_max_mb=args.cache_max_mb,
+                             replay=args.replay, replay_archive=args.replay_archive,
+                             requests_per_second=args.rps, tokens_per_minute=args.tpm, max_retries=args.max_retries,
+                             early_stop=args.early_stop, alpha=args.alpha, tvd_tolerance=args.tvd_tolerance,
+                             min_trials=args.min_trials, text_reports=not args.no_text_reports, num_flips=args.num_flips)
\ No newline at end of file
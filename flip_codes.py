@@ -0,0 +1,171 @@
+##Bit-packed flip sequences: each H/T sequence is one unsigned integer in a NumPy array (uint16 for 10 flips).
+##Bit i (counted from the most significant of the sequence's bits) is 1 for T and 0 for H, so the code of a
+##sequence is its index in the sorted list of all 2^length sequences (process_multiple_sims.get_all_possible_sequences):
+##the 1024-slot counts vector is np.bincount(codes, minlength=1024) and the number of heads is
+##length - popcount(code). Strings are only encoded when sequences are read and decoded when they are written.
+##Sequences longer than 64 flips have no fixed-width integer type; their codes are Python ints in an object array
+##(same ordering, only slower). Nothing ever enumerates the 2^length possible sequences beyond the short lengths:
+##unique_counts() gives the sparse (code, count) pairs of the sequences that occur, which is what the analysis
+##scripts use for 20-, 50- or 100-flip runs.
+##
+##Example:
+##  sequences = FlipSequences.from_strings(["HTHTHTHTHT", "HHHHHHHHHH", "no sequence"])
+##  sequences.head_counts()          # array([5, 10])
+##  sequences.histogram()            # 1024 counts, one per possible sequence
+##  sequences.to_strings()           # ["HTHTHTHTHT", "HHHHHHHHHH"]
+
+import functools
+import numpy as np
+
+SEQUENCE_LENGTH = 10
+MAX_SEQUENCE_LENGTH = 64  # longest length with a fixed-width code; longer ones use Python ints
+TABLE_DECODE_MAX_LENGTH = 16  # decode through a cached table of all 2^length strings up to this length
+DENSE_MAX_LENGTH = 24  # longest length with a dense 2^length histogram
+_TO_HT = str.maketrans("01", "HT")
+
+# Bits set per byte value, for NumPy versions without np.bitwise_count
+_BYTE_POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+
+def code_dtype(length=SEQUENCE_LENGTH):
+    """Smallest unsigned integer type holding `length` flips (object, i.e. Python ints, beyond 64)."""
+    if length < 1:
+        raise ValueError(f"Sequence length must be at least 1, got {length}")
+    if length > MAX_SEQUENCE_LENGTH:
+        return object
+    for dtype in (np.uint8, np.uint16, np.uint32, np.uint64):
+        if length <= np.iinfo(dtype).bits:
+            return dtype
+
+
+def encode_sequences(sequences, length=SEQUENCE_LENGTH):
+    """
+    Packs H/T strings into integer codes.
+
+    Args:
+        sequences (iterable): Strings; anything that is not exactly `length` H/T characters is invalid.
+        length (int): Number of flips per sequence.
+
+    Returns:
+        tuple: (codes, valid) - codes (code_dtype(length)) of every input, 0 where invalid, and the boolean validity mask.
+    """
+    dtype = code_dtype(length)
+    sequences = list(sequences)
+    if not sequences:
+        return np.zeros(0, dtype=dtype), np.zeros(0, dtype=bool)
+    # Fixed-width rows of bytes. Usual case, checked at C speed: all entries are ASCII strings of the right length
+    try:
+        joined = "".join(sequences) if set(map(len, sequences)) == {length} else None
+    except TypeError:
+        joined = None
+    if joined is None or not joined.isascii():
+        # Otherwise entries of the wrong type, length or non-ASCII become rows of "x"
+        placeholder = "x" * length
+        joined = "".join(sequence if isinstance(sequence, str) and len(sequence) == length and sequence.isascii()
+                         else placeholder for sequence in sequences)
+    chars = np.frombuffer(joined.encode("ascii"), dtype=np.uint8).reshape(len(sequences), length)
+    tails = chars == ord("T")
+    invalid = ~(tails | (chars == ord("H")))
+    valid = ~invalid.any(axis=1) if invalid.any() else np.ones(len(sequences), dtype=bool)
+    if dtype is object:
+        # Whole bytes per row, big-endian, then the padding bits shifted out
+        packed = np.packbits(tails & valid[:, None], axis=1)
+        padding = packed.shape[1] * 8 - length
+        codes = np.empty(len(sequences), dtype=object)
+        codes[:] = [int.from_bytes(row, "big") >> padding for row in map(bytes, packed)]
+        return codes, valid
+    codes = np.zeros(len(sequences), dtype=dtype)
+    for position in range(length):
+        codes |= tails[:, position].astype(dtype) << dtype(length - 1 - position)
+    codes[~valid] = 0
+    return codes, valid
+
+
+def _decode_bits(codes, length):
+    """H/T strings of the codes, built from their bits."""
+    if length > MAX_SEQUENCE_LENGTH:
+        return [format(int(code), f"0{length}b").translate(_TO_HT) for code in codes]
+    codes = np.asarray(codes, dtype=np.uint64)
+    shifts = np.arange(length - 1, -1, -1, dtype=np.uint64)
+    tails = (codes[:, None] >> shifts) & np.uint64(1)
+    joined = np.where(tails == 1, ord("T"), ord("H")).astype(np.uint8).tobytes().decode("ascii")
+    return [joined[start:start + length] for start in range(0, len(joined), length)]
+
+
+@functools.lru_cache(maxsize=None)
+def _sequence_table(length):
+    """Object array of all 2^length strings, indexed by code."""
+    table = np.empty(2 ** length, dtype=object)
+    table[:] = _decode_bits(np.arange(2 ** length), length)
+    return table
+
+
+def decode_sequences(codes, length=SEQUENCE_LENGTH):
+    """Unpacks integer codes back into H/T strings (through a table of all strings for short sequences)."""
+    if length <= TABLE_DECODE_MAX_LENGTH:
+        return _sequence_table(length)[np.asarray(codes, dtype=np.intp)].tolist()
+    return _decode_bits(codes, length)
+
+
+def popcount(codes):
+    """Number of set bits of every code."""
+    codes = np.asarray(codes)
+    if codes.dtype == object:
+        return np.fromiter((int(code).bit_count() for code in codes), dtype=np.int64, count=len(codes))
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(codes).astype(np.int64)
+    as_bytes = codes.astype(codes.dtype.newbyteorder("<")).view(np.uint8).reshape(len(codes), codes.dtype.itemsize)
+    return _BYTE_POPCOUNT[as_bytes].sum(axis=1, dtype=np.int64)
+
+
+def all_sequences(length=SEQUENCE_LENGTH):
+    """All 2^length sequences, sorted (so that position == code). Only sensible for short lengths."""
+    if length > DENSE_MAX_LENGTH:
+        raise ValueError(f"Listing all 2^{length} sequences is not feasible; work with the observed ones (FlipSequences.unique_counts)")
+    return decode_sequences(np.arange(2 ** length), length)
+
+
+class FlipSequences:
+    """A run's valid sequences as packed codes, with the vectorized counts the analysis scripts need."""
+
+    def __init__(self, codes, length=SEQUENCE_LENGTH):
+        self.length = length
+        self.codes = np.asarray(codes, dtype=code_dtype(length))
+
+    @classmethod
+    def from_strings(cls, sequences, length=SEQUENCE_LENGTH):
+        """Encodes the valid sequences (invalid ones are dropped; see encode_sequences for the mask)."""
+        codes, valid = encode_sequences(sequences, length)
+        return cls(codes[valid], length)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def to_strings(self):
+        return decode_sequences(self.codes, self.length)
+
+    def head_counts(self):
+        """Number of heads of every sequence."""
+        return self.length - popcount(self.codes)
+
+    def bit_matrix(self):
+        """(sequences x length) uint8 matrix of the flips, 1 for T and 0 for H, for tests that look at positions."""
+        if self.length > MAX_SEQUENCE_LENGTH:
+            joined = "".join(self.to_strings()).encode("ascii")
+            return (np.frombuffer(joined, dtype=np.uint8) == ord("T")).astype(np.uint8).reshape(len(self), self.length)
+        shifts = np.arange(self.length - 1, -1, -1, dtype=np.uint64)
+        return ((self.codes.astype(np.uint64)[:, None] >> shifts) & np.uint64(1)).astype(np.uint8)
+
+    def head_count_histogram(self):
+        """How many sequences have k heads, k = 0..length."""
+        return np.bincount(self.head_counts(), minlength=self.length + 1)
+
+    def histogram(self):
+        """How many times each of the 2^length possible sequences occurs, indexed by code."""
+        if self.length > DENSE_MAX_LENGTH:
+            raise ValueError(f"A dense histogram of {self.length}-flip sequences has 2^{self.length} bins; use unique_counts()")
+        return np.bincount(self.codes, minlength=2 ** self.length)
+
+    def unique_counts(self):
+        """(codes, counts) of the sequences that occur, sorted by code: memory grows with the distinct sequences only."""
+        return np.unique(self.codes, return_counts=True)
@@ -0,0 +1,377 @@
+##Flip-sequence extraction shared by coinflip_regex.py and the streaming client in inference_client.py.
+##extract_flips_embedded_only_regex provides the "Priority 3 only" extraction.
+##extract_flips_prioritized_logic provides the "Priority 1 then 2 then 3 (and a final fallback)" extraction.
+##Both come from extract_all, which finds every priority level (and coinflip.py's extract_flips variant) in one
+##scan and reports which rule fired; extract_batch runs it over a whole batch of responses (see bench_extraction.py).
+##ASCII responses (almost all of them) are scanned as bytes through a character-class table; others use the regex.
+##Strategies are registered in EXTRACTION_STRATEGIES (prioritized, embedded_only, coinflip.py's extract_flips,
+##think_first and final_answer); evaluate_strategies runs them all over one response, and every trial is stored
+##with one column per strategy (see trial_journal.write_extraction_reports for the table and disagreement report).
+##IncrementalFlipExtractor computes the same prioritized result chunk by chunk while a response is streamed.
+##Every function takes the sequence length (`length`, default SEQUENCE_LENGTH = 10 flips); the runs searched for
+##are compiled once per length.
+
+import functools
+import re
+from flip_codes import SEQUENCE_LENGTH
+
+# Line breaks as str.splitlines() sees them; a run of H/T never spans one
+LINE_BREAK_CHARS = "\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029"
+_HT_CHAR = re.compile(r"[HT]")
+_LINE_BREAK = re.compile(f"[{LINE_BREAK_CHARS}]")
+
+# ASCII fast path: each byte mapped to its class, 1 = H/T, \n = line break, space = other whitespace, 0 = anything else
+_ASCII_CLASSES = bytes(
+    ord("1") if c in b"HT" else ord("\n") if chr(c) in LINE_BREAK_CHARS else ord(" ") if chr(c).isspace() else ord("0")
+    for c in range(256)
+)
+_NOT_HT_BYTES = bytes(c for c in range(256) if c not in b"HT")
+
+RULE_EXACT_LINE = "exact_line"        # Priority 1: a line is ONLY `length` H/T characters
+RULE_LINE_PREFIX = "line_prefix"      # Priority 2: a line STARTS WITH `length` H/T characters
+RULE_EMBEDDED = "embedded"            # Priority 3: `length` H/T characters anywhere in a line
+RULE_CONCATENATED = "concatenated"    # Priority 4: first `length` H/T characters of the whole response
+RULE_NONE = "none"
+EXTRACTION_RULES = (RULE_EXACT_LINE, RULE_LINE_PREFIX, RULE_EMBEDDED, RULE_CONCATENATED, RULE_NONE)
+EXTRACTION_FIELDS = ("prioritized", "rule", "embedded_only", "extract_flips")
+
+
+@functools.lru_cache(maxsize=None)
+def _ht_run(length):
+    """Regex of a run of `length` H/T characters."""
+    return re.compile(f"[HT]{{{length}}}")
+
+
+def _starts_line(text, position):
+    """True if only whitespace separates `position` from the start of its line."""
+    while position > 0:
+        c = text[position - 1]
+        if c in LINE_BREAK_CHARS:
+            return True
+        if not c.isspace():
+            return False
+        position -= 1
+    return True
+
+
+def _concatenated(text, length):
+    """First (up to) `length` H/T characters of the whole text."""
+    chars = []
+    for match in _HT_CHAR.finditer(text):
+        chars.append(match.group())
+        if len(chars) == length:
+            break
+    return "".join(chars)
+
+
+def _extract_ascii(data, length):
+    """extract_all for ASCII text, on its bytes: the class map turns the run search into bytes.find."""
+    classes = data.translate(_ASCII_CLASSES)
+    run_classes = b"1" * length
+    embedded = ""
+    start = classes.find(run_classes)
+    while start != -1:
+        end = start + length
+        if not embedded:
+            embedded = data[start:end].decode()
+        if not classes[classes.rfind(b"\n", 0, start) + 1:start].strip():
+            line_end = classes.find(b"\n", end)
+            rule = RULE_LINE_PREFIX if classes[end:line_end if line_end != -1 else len(classes)].strip() else RULE_EXACT_LINE
+            sequence = data[start:end].decode()
+            return {"prioritized": sequence, "rule": rule, "embedded_only": embedded, "extract_flips": sequence}
+        # Same non-overlapping runs as _ht_run(length).finditer (a run starting inside this one can't start its line)
+        start = classes.find(run_classes, end)
+    concatenated = data.translate(None, _NOT_HT_BYTES)[:length].decode()
+    if embedded:
+        return {"prioritized": embedded, "rule": RULE_EMBEDDED, "embedded_only": embedded, "extract_flips": concatenated}
+    if len(concatenated) == length:
+        return {"prioritized": concatenated, "rule": RULE_CONCATENATED, "embedded_only": "", "extract_flips": concatenated}
+    return {"prioritized": "", "rule": RULE_NONE, "embedded_only": "", "extract_flips": concatenated}
+
+
+def extract_all(full_response_content, length=SEQUENCE_LENGTH):
+    """
+    Every priority level of one response from a single scan over its `length`-character H/T runs.
+
+    Args:
+        full_response_content (str): Raw response text.
+        length (int): Number of flips in a sequence.
+
+    Returns:
+        dict: prioritized (extract_flips_prioritized_logic), rule (which priority produced it, see
+              EXTRACTION_RULES), embedded_only (extract_flips_embedded_only_regex) and extract_flips
+              (coinflip.py's line-then-concatenated variant, extract_flips_line_first).
+    """
+    if not isinstance(full_response_content, str):
+        return {"prioritized": "", "rule": RULE_NONE, "embedded_only": "", "extract_flips": ""}
+    if full_response_content.isascii():
+        return _extract_ascii(full_response_content.encode("ascii"), length)
+    text = full_response_content
+    embedded = ""
+    # Runs are found left to right, so the first one is Priority 3 and the first one that starts its
+    # line (after whitespace) is Priority 1/2; a line break is never part of a run, so none is skipped
+    for match in _ht_run(length).finditer(text):
+        if not embedded:
+            embedded = match.group()
+        if _starts_line(text, match.start()):
+            line_end = _LINE_BREAK.search(text, match.end())
+            rest = text[match.end():line_end.start() if line_end else len(text)]
+            rule = RULE_LINE_PREFIX if rest.strip() else RULE_EXACT_LINE
+            return {"prioritized": match.group(), "rule": rule, "embedded_only": embedded, "extract_flips": match.group()}
+    concatenated = _concatenated(text, length)
+    if embedded:
+        return {"prioritized": embedded, "rule": RULE_EMBEDDED, "embedded_only": embedded, "extract_flips": concatenated}
+    if len(concatenated) == length:
+        return {"prioritized": concatenated, "rule": RULE_CONCATENATED, "embedded_only": "", "extract_flips": concatenated}
+    return {"prioritized": "", "rule": RULE_NONE, "embedded_only": "", "extract_flips": concatenated}
+
+
+def extract_batch(responses, length=SEQUENCE_LENGTH):
+    """
+    extract_all over a whole batch of responses.
+
+    Args:
+        responses (iterable): Raw response texts.
+        length (int): Number of flips in a sequence.
+
+    Returns:
+        dict: Columns (EXTRACTION_FIELDS) -> list with one value per response, in input order.
+    """
+    columns = {field: [] for field in EXTRACTION_FIELDS}
+    appends = [(field, columns[field].append) for field in EXTRACTION_FIELDS]
+    for response in responses:
+        result = extract_all(response, length)
+        for field, append in appends:
+            append(result[field])
+    return columns
+
+
+def extract_flips_embedded_only_regex(full_response_content, length=SEQUENCE_LENGTH):
+    """
+    Priority 3 ONLY: Extracts the *first* `length`-character H/T sequence found anywhere
+    within any line using regex. Returns empty string if none found.
+    """
+    if not isinstance(full_response_content, str):
+        return ""
+    match = _ht_run(length).search(full_response_content)
+    return match.group() if match else ""
+
+def extract_flips_prioritized_logic(full_response_content, length=SEQUENCE_LENGTH):
+    """
+    Prioritized Logic (with the default length of 10):
+    1. Line is ONLY 10 H/T characters.
+    2. Line STARTS WITH 10 H/T characters.
+    3. Fallback: Regex for embedded 10 H/T sequence in any line.
+    4. Super Fallback: Concatenate all H/T and take first 10.
+    """
+    return extract_all(full_response_content, length)["prioritized"]
+
+
+def extract_flips_line_first(full_response_content, length=SEQUENCE_LENGTH):
+    """
+    coinflip.py's extraction: the first line that is or starts with `length` H/T characters (Priority 1/2),
+    else the first `length` H/T characters found anywhere (may be shorter than `length`).
+    """
+    return extract_all(full_response_content, length)["extract_flips"]
+
+
+def is_valid_sequence(sequence, length=SEQUENCE_LENGTH):
+    """True if `sequence` is exactly `length` H/T characters (the check every report applies)."""
+    return isinstance(sequence, str) and len(sequence) == length and all(c in 'HT' for c in sequence)
+
+
+# --- Strategy registry ---
+# name -> (function, description). A strategy function gets the response text, its extract_all result
+# (computed once per response and shared by all strategies) and the sequence length, and returns the extracted sequence.
+EXTRACTION_STRATEGIES = {}
+
+
+def register_strategy(name, description=""):
+    """Decorator adding an extraction strategy to EXTRACTION_STRATEGIES (a column of every extraction table)."""
+    def decorator(fn):
+        EXTRACTION_STRATEGIES[name] = (fn, description)
+        return fn
+    return decorator
+
+
+def split_think(text):
+    """(reasoning, answer): the text before and after the last </think> ("" and the whole text without one)."""
+    think_end = text.rfind("</think>")
+    if think_end == -1:
+        return "", text
+    return text[:think_end], text[think_end + len("</think>"):]
+
+
+@register_strategy("prioritized", "Priority 1 then 2 then 3, then the first 10 H/T characters (coinflip_regex.py)")
+def _prioritized_strategy(text, base, length):
+    return base["prioritized"]
+
+
+@register_strategy("embedded_only", "First 10-character H/T run anywhere (Priority 3 only)")
+def _embedded_only_strategy(text, base, length):
+    return base["embedded_only"]
+
+
+@register_strategy("extract_flips", "First line that is or starts with 10 H/T, else the first H/T characters (coinflip.py)")
+def _line_first_strategy(text, base, length):
+    return base["extract_flips"]
+
+
+@register_strategy("think_first", "First 10-character H/T run inside the reasoning (before the last </think>)")
+def _think_first_strategy(text, base, length):
+    reasoning, _ = split_think(text)
+    return extract_all(reasoning, length)["embedded_only"] if reasoning else ""
+
+
+@register_strategy("final_answer", "Prioritized extraction of the answer after the last </think> (whole text without one)")
+def _final_answer_strategy(text, base, length):
+    if "</think>" not in text:
+        return base["prioritized"]
+    return extract_all(split_think(text)[1], length)["prioritized"]
+
+
+def evaluate_strategies(full_response_content, strategies=None, length=SEQUENCE_LENGTH):
+    """
+    Runs the registered strategies over one response, sharing a single extract_all scan.
+
+    Args:
+        full_response_content (str): Raw response text.
+        strategies (list, optional): Strategy names (default: every registered one, in registration order).
+        length (int): Number of flips in a sequence.
+
+    Returns:
+        dict: strategy name -> extracted sequence.
+    """
+    text = full_response_content if isinstance(full_response_content, str) else ""
+    base = extract_all(text, length)
+    return {name: EXTRACTION_STRATEGIES[name][0](text, base, length) for name in strategies or EXTRACTION_STRATEGIES}
+
+
+def run_extractions(full_response_content, length=SEQUENCE_LENGTH):
+    """Every registered strategy's extraction of one response, as stored in the trial journal."""
+    return evaluate_strategies(full_response_content, length=length)
+
+
+def summarize_disagreements(rows, strategies, length=SEQUENCE_LENGTH):
+    """
+    Where the strategies disagree, from (simulation_id, {strategy: sequence}) rows.
+    Invalid extractions count as empty, so a pair only "conflicts" when both found a different valid sequence.
+
+    Returns:
+        dict: trials, valid (per strategy), pairs ("a vs b" -> {"differ", "conflict"}), unanimous (trials where
+              every strategy gave the same value) and conflicts (simulation_id -> values, for conflicting trials).
+    """
+    pairs = [(a, b) for i, a in enumerate(strategies) for b in strategies[i + 1:]]
+    summary = {"trials": 0, "valid": dict.fromkeys(strategies, 0),
+               "pairs": {f"{a} vs {b}": {"differ": 0, "conflict": 0} for a, b in pairs}, "unanimous": 0, "conflicts": {}}
+    for simulation_id, extractions in rows:
+        values = {name: extractions[name] if is_valid_sequence(extractions[name], length) else "" for name in strategies}
+        summary["trials"] += 1
+        for name, value in values.items():
+            summary["valid"][name] += 1 if value else 0
+        if len(set(values.values())) == 1:
+            summary["unanimous"] += 1
+            continue
+        for a, b in pairs:
+            if values[a] != values[b]:
+                counts = summary["pairs"][f"{a} vs {b}"]
+                counts["differ"] += 1
+                if values[a] and values[b]:
+                    counts["conflict"] += 1
+        if len({value for value in values.values() if value}) > 1:
+            summary["conflicts"][simulation_id] = values
+    return summary
+
+
+def _line_sequence(cleaned_line, length=SEQUENCE_LENGTH):
+    """Priority 1/2 check for one stripped line: the `length`-char H/T sequence it is or starts with, else ''."""
+    if len(cleaned_line) >= length and all(c in 'HT' for c in cleaned_line[:length]):
+        return cleaned_line[:length]
+    return ""
+
+
+class IncrementalFlipExtractor:
+    """
+    Incremental version of extract_flips_prioritized_logic for streamed responses.
+
+    feed() the text chunks as they arrive. result() always equals extract_flips_prioritized_logic()
+    on the text received so far. final_sequence is the first `length`-char H/T line after the last </think>
+    (or anywhere, if require_think_close is False and no </think> shows up), and is_complete() turns
+    True once TERMINATE has followed it, i.e. the stream can be closed.
+    """
+
+    def __init__(self, require_think_close=False, length=SEQUENCE_LENGTH):
+        self.require_think_close = require_think_close
+        self.length = length
+        self.ht_pattern_embedded = _ht_run(length)
+        self.text_parts = []
+        self.pending_line = ""
+        self.line_match = ""        # Priority 1/2
+        self.embedded_match = ""    # Priority 3
+        self.fallback_chars = ""    # Priority 4
+        self.think_closed = False
+        self.final_sequence = ""
+        self.terminated = False
+
+    @property
+    def text(self):
+        return "".join(self.text_parts)
+
+    def feed(self, chunk):
+        self.text_parts.append(chunk)
+        if len(self.fallback_chars) < self.length:
+            self.fallback_chars += "".join(c for c in chunk if c in "HT")[:self.length - len(self.fallback_chars)]
+        lines = (self.pending_line + chunk).splitlines(keepends=True)
+        # The last piece stays pending unless it already ends with a line break
+        if lines and lines[-1] == lines[-1].rstrip("\r\n"):
+            self.pending_line = lines.pop()
+        else:
+            self.pending_line = ""
+        for line in lines:
+            self._process_line(line.rstrip("\r\n"))
+        if self.final_sequence and "TERMINATE" in self.pending_line:
+            self.terminated = True
+
+    def _process_line(self, line):
+        cleaned_line = line.strip()
+        if not self.line_match:
+            self.line_match = _line_sequence(cleaned_line, self.length)
+        if not self.embedded_match:
+            match = self.ht_pattern_embedded.search(cleaned_line)
+            if match:
+                self.embedded_match = match.group()
+
+        if "</think>" in line:
+            # Anything captured so far was reasoning; start looking for the final answer again
+            self.think_closed = True
+            self.final_sequence = ""
+            self.terminated = False
+            line = line[line.rfind("</think>") + len("</think>"):]
+            cleaned_line = line.strip()
+        if self.require_think_close and not self.think_closed:
+            return
+        if not self.final_sequence:
+            self.final_sequence = _line_sequence(cleaned_line, self.length)
+            if self.final_sequence and "TERMINATE" in cleaned_line[self.length:]:
+                self.terminated = True
+        elif "TERMINATE" in line:
+            self.terminated = True
+
+    def is_complete(self):
+        return bool(self.final_sequence) and self.terminated
+
+    def result(self):
+        """Same value extract_flips_prioritized_logic would return for the text fed so far."""
+        pending_cleaned = self.pending_line.strip()
+        if self.line_match:
+            return self.line_match
+        if _line_sequence(pending_cleaned, self.length):
+            return _line_sequence(pending_cleaned, self.length)
+        if self.embedded_match:
+            return self.embedded_match
+        match = self.ht_pattern_embedded.search(pending_cleaned)
+        if match:
+            return match.group()
+        if len(self.fallback_chars) >= self.length:
+            return self.fallback_chars
+        return ""
@@ -0,0 +1,275 @@
+##Direct inference path for coinflip.py and coinflip_regex.py.
+##Every simulation is exactly one chat-completion request, sent through one shared OpenAI client per run
+##(same client setup as models.py, but async so its connection pool is shared by all trials in flight).
+##No autogen agents are created, so there is no second assistant turn and no per-trial agent setup/reset.
+##With stream=True the reply is streamed into an IncrementalFlipExtractor and the stream is closed as soon as
+##the final sequence and TERMINATE have arrived (or a token budget runs out), recording TTFT and time-to-sequence.
+##Retries are left to the trial engine (re-queue with backoff) and pacing to rate_limiter.AdaptiveRateLimiter,
+##so the client itself does not retry and 429/503 answers reach the limiter's AIMD adjustment.
+
+import asyncio
+import time
+from openai import AsyncOpenAI
+from trial_engine import DEFAULT_CONCURRENCY, run_trials_async
+from rate_limiter import DEFAULT_MAX_RETRIES, estimate_request_tokens, is_retryable
+from flip_codes import SEQUENCE_LENGTH
+from flip_extraction import IncrementalFlipExtractor
+
+USER_MESSAGE_TEMPLATE = "Simulate {num_flips} flips for simulation {simulation_id}. Output ONLY in the specified format and end with TERMINATE."
+
+
+def make_request(simulation_id, model, temperature, max_tokens, system_message, seed=None, num_flips=SEQUENCE_LENGTH):
+    """
+    The request dict for one simulation (also the response cache key and the batch-job line).
+    `system_message` should already ask for `num_flips` flips (prompts.sized_prompt).
+    """
+    return {
+        "simulation_id": simulation_id,
+        "model": model,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+        "seed": seed,
+        "system_message": system_message,
+        "user_message": USER_MESSAGE_TEMPLATE.format(num_flips=num_flips, simulation_id=simulation_id),
+        "num_flips": num_flips,
+    }
+
+
+def build_trial_request(simulation_id, llm_config, system_message, num_flips=SEQUENCE_LENGTH):
+    """
+    Builds the request for one simulation from an autogen-style llm_config, so the direct path
+    uses exactly the same model, temperature, max_tokens and messages as the agent chat.
+    """
+    return make_request(
+        simulation_id,
+        llm_config["config_list"][0]["model"],
+        llm_config.get("temperature"),
+        llm_config.get("max_tokens"),
+        system_message,
+        seed=llm_config.get("seed"),
+        num_flips=num_flips,
+    )
+
+
+def create_async_client(api_key, base_url, timeout=120.0, max_retries=0):
+    """Creates the AsyncOpenAI client shared by every trial of a run (one connection pool)."""
+    return AsyncOpenAI(api_key=api_key, base_url=base_url, timeout=timeout, max_retries=max_retries)
+
+
+def strip_terminate(content):
+    """Same cleanup the agent path applies to the flipper's reply: strip and cut at the trailing TERMINATE."""
+    content = str(content).strip()
+    if content.rstrip().endswith("TERMINATE"):
+        terminate_index = content.rfind("TERMINATE")
+        if terminate_index != -1:
+            content = content[:terminate_index].strip()
+    return content
+
+
+def usage_to_dict(usage):
+    """Flattens an OpenAI usage object into prompt/completion/reasoning token counts (None if not reported)."""
+    if usage is None:
+        return None
+    details = getattr(usage, "completion_tokens_details", None)
+    return {
+        "prompt_tokens": getattr(usage, "prompt_tokens", None),
+        "completion_tokens": getattr(usage, "completion_tokens", None),
+        "reasoning_tokens": getattr(details, "reasoning_tokens", None) if details is not None else None,
+    }
+
+
+def request_kwargs(request):
+    """chat.completions.create arguments for a request dict (seed only when one is configured)."""
+    kwargs = {
+        "model": request["model"],
+        "messages": [
+            {"role": "system", "content": request["system_message"]},
+            {"role": "user", "content": request["user_message"]},
+        ],
+        "temperature": request["temperature"],
+        "max_tokens": request["max_tokens"],
+    }
+    if request.get("seed") is not None:
+        kwargs["seed"] = request["seed"]
+    return kwargs
+
+
+async def request_completion(client, request):
+    """
+    Sends one chat-completion request and returns the cleaned reply text and token usage.
+    Reasoning returned in a separate `reasoning_content` field is put back in front of the answer
+    with a closing </think> tag, so the text looks like the archived R1 outputs.
+    """
+    response = await client.chat.completions.create(**request_kwargs(request))
+    return completion_to_record(response)
+
+
+def completion_to_record(response):
+    """raw_output and usage of a ChatCompletion (interactive responses and batch-job results alike)."""
+    message = response.choices[0].message
+    content = message.content or ""
+    reasoning = getattr(message, "reasoning_content", None)
+    if reasoning:
+        content = f"{reasoning}\n</think>\n\n{content}"
+    return {"raw_output": strip_terminate(content), "usage": usage_to_dict(response.usage)}
+
+
+def is_reasoning_model(model):
+    """Reasoning models (DeepSeek R1) think before answering; their final answer follows </think>."""
+    return "r1" in model.lower()
+
+
+async def stream_completion(client, request, token_budget=None):
+    """
+    Streams one chat-completion and stops reading as soon as the answer is captured.
+
+    The stream is closed when the final sequence line and TERMINATE have arrived (for reasoning models
+    only lines after </think> count), or once `token_budget` content chunks (~tokens) have been received.
+
+    Returns:
+        dict: raw_output, usage (None if the stream was cut before the usage chunk), ttft_s,
+              time_to_sequence_s, streamed_chunks and stop_reason
+              ("sequence_captured", "token_budget" or "stream_end").
+    """
+    start = time.perf_counter()
+    extractor = IncrementalFlipExtractor(require_think_close=is_reasoning_model(request["model"]),
+                                         length=request.get("num_flips", SEQUENCE_LENGTH))
+    ttft_s = None
+    time_to_sequence_s = None
+    streamed_chunks = 0
+    usage = None
+    stop_reason = "stream_end"
+    in_reasoning = False
+
+    stream = await client.chat.completions.create(
+        **request_kwargs(request),
+        stream=True,
+        stream_options={"include_usage": True},
+    )
+    try:
+        async for chunk in stream:
+            if getattr(chunk, "usage", None):
+                usage = usage_to_dict(chunk.usage)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            reasoning = getattr(delta, "reasoning_content", None) or ""
+            content = delta.content or ""
+            if reasoning:
+                in_reasoning = True
+            elif content and in_reasoning:
+                # Reasoning streamed in its own field: close it like the archived R1 outputs do
+                in_reasoning = False
+                content = "\n</think>\n\n" + content
+            text = reasoning + content
+            if not text:
+                continue
+            if ttft_s is None:
+                ttft_s = time.perf_counter() - start
+            streamed_chunks += 1
+            extractor.feed(text)
+            if time_to_sequence_s is None and extractor.final_sequence:
+                time_to_sequence_s = time.perf_counter() - start
+            if extractor.is_complete():
+                stop_reason = "sequence_captured"
+                break
+            if token_budget is not None and streamed_chunks >= token_budget:
+                stop_reason = "token_budget"
+                break
+    finally:
+        await stream.close()
+
+    return {
+        "raw_output": strip_terminate(extractor.text),
+        "usage": usage,
+        "ttft_s": ttft_s,
+        "time_to_sequence_s": time_to_sequence_s,
+        "streamed_chunks": streamed_chunks,
+        "stop_reason": stop_reason,
+    }
+
+
+async def run_direct_trial(client, request, stream=False, token_budget=None, cache=None, rate_limiter=None):
+    """
+    Runs one simulation as a single request; failures are recorded in raw_output like the agent path does,
+    with the HTTP status (if any) in error_status so the engine can decide whether to retry.
+    With a ResponseCache, hits are served from disk and complete responses are stored after the call.
+    With an AdaptiveRateLimiter, the request waits for a slot and its outcome adjusts the rate.
+    """
+    simulation_id = request["simulation_id"]
+    start = time.perf_counter()
+    if cache is not None:
+        cached = cache.get(request)
+        if cached is not None:
+            return dict(cached, simulation_id=simulation_id, latency_s=time.perf_counter() - start, cached=True)
+    estimated_tokens = estimate_request_tokens(request)
+    if rate_limiter is not None:
+        await rate_limiter.acquire(estimated_tokens)
+    rate_limit_wait_s = time.perf_counter() - start
+    start = time.perf_counter()
+    try:
+        if stream:
+            record = await stream_completion(client, request, token_budget=token_budget)
+        else:
+            record = await request_completion(client, request)
+    except Exception as e:
+        print(f"CRITICAL ERROR during request for simulation {simulation_id}: {e}")
+        record = {"raw_output": f"Error: Exception during chat - {e}", "usage": None, "error": str(e),
+                  "error_status": getattr(e, "status_code", None)}
+    record["simulation_id"] = simulation_id
+    record["latency_s"] = time.perf_counter() - start
+    record["rate_limit_wait_s"] = rate_limit_wait_s
+    if rate_limiter is not None:
+        usage = record.get("usage") or {}
+        actual_tokens = None
+        if usage.get("prompt_tokens") is not None and usage.get("completion_tokens") is not None:
+            actual_tokens = usage["prompt_tokens"] + usage["completion_tokens"]
+        rate_limiter.record_usage(estimated_tokens, actual_tokens)
+        rate_limiter.observe(record)
+    # Replies cut off by the token budget are incomplete, so they are never cached
+    if cache is not None and not record.get("error") and record.get("stop_reason") != "token_budget":
+        cache.put(request, record)
+    return record
+
+
+def run_direct_trials(request_builder, simulation_ids, api_key, base_url, concurrency=DEFAULT_CONCURRENCY, on_result=None,
+                      stream=False, token_budget=None, collect_results=True, cache=None, rate_limiter=None,
+                      max_retries=DEFAULT_MAX_RETRIES, should_stop=None):
+    """
+    Runs every simulation through one shared client with at most `concurrency` requests in flight.
+
+    Args:
+        request_builder (callable): Maps a simulation id to its request dict (see build_trial_request).
+        simulation_ids (iterable): Simulation ids to run.
+        api_key (str): Inference API key.
+        base_url (str): OpenAI-compatible endpoint (LAMBDA_INFERENCE_API_BASE or a local stub).
+        concurrency (int): Maximum number of requests in flight.
+        on_result (callable, optional): Passed through to the trial engine.
+        stream (bool): Stream each reply and close it early once the sequence is captured.
+        token_budget (int, optional): With stream=True, cut a reply off after this many content chunks.
+        collect_results (bool): Passed through to the trial engine.
+        cache (ResponseCache, optional): Serve repeated requests from disk instead of the API.
+        rate_limiter (AdaptiveRateLimiter, optional): Paces requests/tokens and backs off on 429/503.
+        max_retries (int): Re-queue a trial that failed with a retryable error up to this many times.
+        should_stop (callable, optional): Early-stopping check passed through to the trial engine.
+
+    Returns:
+        list: (simulation_id, record) tuples sorted by simulation id.
+    """
+    async def run_all():
+        client = create_async_client(api_key, base_url)
+        try:
+            return await run_trials_async(
+                lambda simulation_id: run_direct_trial(client, request_builder(simulation_id), stream=stream, token_budget=token_budget,
+                                                       cache=cache, rate_limiter=rate_limiter),
+                simulation_ids,
+                concurrency=concurrency,
+                on_result=on_result,
+                collect_results=collect_results,
+                should_retry=is_retryable,
+                max_retries=max_retries,
+                should_stop=should_stop,
+            )
+        finally:
+            await client.close()
+    return asyncio.run(run_all())
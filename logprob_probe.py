@@ -0,0 +1,221 @@
+##Logprob-based bias probe: estimates a model's head-count distribution from a few completions instead of
+##sampling 100 of them and counting.
+##Each probe is one chat-completion with logprobs/top_logprobs. The final 10-flip sequence is located in the
+##reply (same prioritized extraction as coinflip_regex.py), and for every flip position the alternatives the
+##model considered at that point give P(H | sequence so far) (for tokens spanning several flips, the
+##H/T-only alternatives of the whole token are marginalized per character). Treating these conditional
+##probabilities as independent flips gives a Poisson-binomial head-count distribution per probe; the probes
+##are averaged and the result is passed to create_summary_for_plotting as the expected distribution.
+##
+##Examples:
+##  python logprob_probe.py --num-probes 5 --model deepseek-v3-0324 --temperature 1
+##  python logprob_probe.py --observed results/coin_flips_prioritized_20250530_205248DSR1Temp1_5.txt --plot
+
+import argparse
+import asyncio
+import json
+import math
+import os
+from datetime import datetime
+import numpy as np
+from scipy.stats import binom
+from config import settings
+from prompts import PROMPTS
+from inference_client import create_async_client, make_request, request_kwargs, strip_terminate
+from flip_extraction import extract_flips_prioritized_logic, is_valid_sequence
+from trial_engine import run_trials_async
+
+DEFAULT_NUM_PROBES = 5
+DEFAULT_TOP_LOGPROBS = 5
+N_FLIPS = 10
+
+
+def locate_sequence(text, sequence):
+    """Start offset of the extracted sequence in the reply (the last occurrence after </think>), or -1."""
+    think_end = text.rfind("</think>")
+    search_from = think_end + len("</think>") if think_end != -1 else 0
+    start = text.rfind(sequence, search_from)
+    return start if start != -1 else text.rfind(sequence)
+
+
+def token_flip_probabilities(entry, offsets):
+    """
+    P(H) for the flip characters at `offsets` inside one token, from the token's top_logprobs.
+
+    Alternatives count if they have the same length, keep the token's non-flip characters and have H/T at
+    every flip offset. The sampled token itself is always included.
+
+    Returns:
+        list: P(H) per offset (conditional on everything before the token).
+    """
+    token = entry["token"]
+    alternatives = {alt["token"]: alt["logprob"] for alt in entry.get("top_logprobs") or []}
+    alternatives.setdefault(token, entry["logprob"])
+    weights = []
+    for alt_token, logprob in alternatives.items():
+        if len(alt_token) != len(token):
+            continue
+        if any(alt_token[k] not in "HT" for k in offsets):
+            continue
+        if any(alt_token[k] != token[k] for k in range(len(token)) if k not in offsets):
+            continue
+        weights.append((alt_token, math.exp(logprob)))
+    total = sum(weight for _, weight in weights)
+    return [sum(weight for alt_token, weight in weights if alt_token[k] == "H") / total for k in offsets]
+
+
+def flip_probabilities(logprob_content):
+    """
+    Rebuilds the per-position P(H) along the sampled path from a reply's logprob tokens.
+
+    Args:
+        logprob_content (list): choices[0].logprobs.content as dicts (token, logprob, top_logprobs).
+
+    Returns:
+        dict: sequence (the extracted flips), p_heads (P(H) per position, None if the sequence could not be
+              mapped onto tokens) and path_logprob (log-probability of the sampled flips under those P(H)).
+    """
+    tokens = [entry["token"] for entry in logprob_content]
+    text = "".join(tokens)
+    sequence = extract_flips_prioritized_logic(strip_terminate(text))
+    result = {"sequence": sequence, "p_heads": None, "path_logprob": None}
+    if not is_valid_sequence(sequence):
+        return result
+    start = locate_sequence(text, sequence)
+    if start == -1:
+        return result
+
+    p_heads = []
+    position = 0
+    for entry in logprob_content:
+        end = position + len(entry["token"])
+        offsets = [k - position for k in range(max(position, start), min(end, start + N_FLIPS))]
+        if offsets:
+            p_heads.extend(token_flip_probabilities(entry, offsets))
+        position = end
+    result["p_heads"] = p_heads
+    result["path_logprob"] = float(sum(math.log(max(p if flip == "H" else 1 - p, 1e-300))
+                                       for p, flip in zip(p_heads, sequence)))
+    return result
+
+
+def head_count_distribution(p_heads):
+    """Poisson-binomial distribution of the number of heads for independent flips with these P(H)."""
+    distribution = np.array([1.0])
+    for p in p_heads:
+        distribution = np.convolve(distribution, [1 - p, p])
+    return distribution
+
+
+async def probe_async(num_probes, model, temperature, max_tokens, system_message, api_key, base_url,
+                      top_logprobs=DEFAULT_TOP_LOGPROBS, concurrency=DEFAULT_NUM_PROBES):
+    """
+    Sends the probe requests and reconstructs each probe's flip probabilities.
+
+    Returns:
+        list: One record per probe (simulation_id, raw_output, sequence, p_heads, path_logprob, usage, error).
+    """
+    client = create_async_client(api_key, base_url)
+
+    async def probe(simulation_id):
+        request = make_request(simulation_id, model, temperature, max_tokens, system_message)
+        try:
+            response = await client.chat.completions.create(**request_kwargs(request), logprobs=True,
+                                                            top_logprobs=top_logprobs)
+        except Exception as e:
+            print(f"Error in probe {simulation_id}: {e}")
+            return {"simulation_id": simulation_id, "raw_output": f"Error: {e}", "error": str(e),
+                    "sequence": "", "p_heads": None, "path_logprob": None}
+        choice = response.choices[0]
+        content = [entry.model_dump() for entry in (choice.logprobs.content if choice.logprobs else None) or []]
+        record = {"simulation_id": simulation_id, "raw_output": strip_terminate(choice.message.content or "")}
+        record.update(flip_probabilities(content))
+        if not content:
+            print(f"Probe {simulation_id}: the endpoint returned no logprobs.")
+        return record
+
+    try:
+        results = await run_trials_async(probe, range(1, num_probes + 1), concurrency=concurrency)
+    finally:
+        await client.close()
+    return [record for _, record in results]
+
+
+def summarize_probes(records, n_flips=N_FLIPS):
+    """
+    Averages the probes into per-position P(H) and an expected head-count distribution.
+
+    Returns:
+        dict: valid_probes, mean_p_heads (per position), expected_distribution (P(k heads), k = 0..n_flips),
+              expected_heads and the TVD between the expected and the binomial distribution.
+    """
+    valid = [record["p_heads"] for record in records if record.get("p_heads") and len(record["p_heads"]) == n_flips]
+    if not valid:
+        return {"valid_probes": 0, "mean_p_heads": None, "expected_distribution": None,
+                "expected_heads": None, "tvd_vs_binomial": None}
+    expected = np.mean([head_count_distribution(p_heads) for p_heads in valid], axis=0)
+    binomial = binom.pmf(np.arange(n_flips + 1), n_flips, 0.5)
+    return {
+        "valid_probes": len(valid),
+        "mean_p_heads": np.mean(valid, axis=0).tolist(),
+        "expected_distribution": expected.tolist(),
+        "expected_heads": float(np.dot(np.arange(n_flips + 1), expected)),
+        "tvd_vs_binomial": 0.5 * float(np.abs(expected - binomial).sum()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Estimate a model's coin flip bias from token logprobs.")
+    parser.add_argument("--num-probes", type=int, default=DEFAULT_NUM_PROBES)
+    parser.add_argument("--model", default=settings.DEFAULT_MODEL)
+    parser.add_argument("--temperature", type=float, default=1.0)
+    parser.add_argument("--max-tokens", type=int, default=1000)
+    parser.add_argument("--prompt", default="unbiased", help=f"Prompt name from prompts.py: {sorted(PROMPTS)}")
+    parser.add_argument("--top-logprobs", type=int, default=DEFAULT_TOP_LOGPROBS)
+    parser.add_argument("--observed", default=None, help="coin_flips_prioritized_*.txt to compare the expected distribution with")
+    parser.add_argument("--plot", action="store_true", help="Plot binomial, observed and expected distributions")
+    args = parser.parse_args()
+
+    records = asyncio.run(probe_async(args.num_probes, args.model, args.temperature, args.max_tokens, PROMPTS[args.prompt],
+                                      settings.LAMBDA_INFERENCE_API_KEY, settings.LAMBDA_INFERENCE_API_BASE,
+                                      top_logprobs=args.top_logprobs))
+    summary = summarize_probes(records)
+    for record in records:
+        p_heads = ", ".join(f"{p:.2f}" for p in record["p_heads"]) if record.get("p_heads") else "n/a"
+        print(f"Probe {record['simulation_id']}: sequence '{record['sequence']}', P(H) per position: {p_heads}")
+    if not summary["valid_probes"]:
+        print("No probe produced usable logprobs for a 10-flip sequence.")
+        return
+    print(f"\nValid probes: {summary['valid_probes']}/{len(records)}")
+    print("Mean P(H) per position: " + ", ".join(f"{p:.3f}" for p in summary["mean_p_heads"]))
+    print(f"Expected heads per sequence: {summary['expected_heads']:.3f}")
+    print(f"TVD between expected and binomial distribution: {summary['tvd_vs_binomial']:.6f}")
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    results_dir = "results"
+    os.makedirs(results_dir, exist_ok=True)
+    filepath = os.path.join(results_dir, f"coin_flip_logprob_probe_{timestamp}.json")
+    with open(filepath, "w", encoding="utf-8") as f:
+        json.dump({"timestamp": timestamp, "model": args.model, "temperature": args.temperature, "prompt": args.prompt,
+                   "summary": summary, "probes": records}, f, indent=2)
+    print(f"Probe results saved to {filepath}")
+
+    if args.observed:
+        from coin_flips_distribution import (analyze_coin_flips_to_df, calculate_total_variation_distance,
+                                             create_summary_for_plotting, parse_simulation_results_file,
+                                             plot_single_yaxis_percentages)
+        sequences = parse_simulation_results_file(args.observed)
+        summary_df = create_summary_for_plotting(analyze_coin_flips_to_df(sequences), len(sequences),
+                                                 expected_distribution=summary["expected_distribution"])
+        if summary_df is not None:
+            print("\nSummary DataFrame (binomial / observed / logprob-expected):")
+            print(summary_df.to_string())
+            tvd = calculate_total_variation_distance(summary_df)
+            tvd_expected = 0.5 * float(np.abs(summary_df["expected_probability"] - summary_df["observed_probability"]).sum())
+            print(f"\nTVD observed vs binomial: {tvd:.6f}, observed vs logprob-expected: {tvd_expected:.6f}")
+            if args.plot:
+                plot_single_yaxis_percentages(summary_df)
+
+
+if __name__ == "__main__":
+    main()
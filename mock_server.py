@@ -0,0 +1,376 @@
+##Local stand-in for the Lambda OpenAI-compatible endpoint (LAMBDA_INFERENCE_API_BASE), for load and
+##regression testing of the runners without network access or API costs.
+##Implements GET /v1/models and POST /v1/chat/completions (plain and streamed, with stream_options.include_usage
+##and logprobs/top_logprobs). Replies are canned raw outputs replayed from the archived
+##results/coin_flips_raw_llm_outputs_*.txt files (or synthetic answers when no archive is given).
+##Latency (time to first token + per-token generation time) follows a configurable distribution, and a share
+##of requests can be answered with 429 / 500 or left hanging to trigger client timeouts.
+##
+##Examples:
+##  python mock_server.py --port 8000 --archives results/coin_flips_raw_llm_outputs_20250530_205248.txt
+##  python mock_server.py --latency lognormal --latency-mean 0.8 --tokens-per-second 200 --rate-429 0.1 --rate-500 0.02
+##then point the runners at it:
+##  LAMBDA_INFERENCE_API_BASE=http://127.0.0.1:8000/v1 python coinflip_regex.py --mode stream
+
+import argparse
+import glob
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from raw_archive import parse_raw_archive
+
+DEFAULT_PORT = 8000
+DEFAULT_MODELS = ("deepseek-r1", "deepseek-v3-0324")
+DEFAULT_ARCHIVE_GLOB = "results/coin_flips_raw_llm_outputs_*.txt"
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "exponential", "lognormal")
+SIMULATION_ID_PATTERN = re.compile(r"simulation (\d+)", re.IGNORECASE)
+NUM_FLIPS_PATTERN = re.compile(r"simulate (\d+) flips", re.IGNORECASE)
+TOKEN_PATTERN = re.compile(r"\s+|[HT](?=[HT])|\w{1,4}|[^\w\s]")
+
+
+def tokenize(text):
+    """Rough ~4-characters-per-token split; runs of H/T become one token per flip (so logprobs are per flip)."""
+    return TOKEN_PATTERN.findall(text)
+
+
+def synthetic_response(rng, model, num_flips=10):
+    """A made-up answer in the requested format, used when no archive is loaded."""
+    sequence = "".join(rng.choice("HT") for _ in range(num_flips))
+    reasoning = f"Okay, I will flip a fair coin {num_flips} times.\n</think>\n\n" if "r1" in model.lower() else ""
+    return f"{reasoning}{sequence}\n---Explanation---\nEach flip was drawn independently with p=0.5."
+
+
+class MockInferenceServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server holding the mock's settings and canned responses.
+
+    Args:
+        address (tuple): (host, port); port 0 picks a free port (see server_address).
+        models (iterable): Model ids listed by /v1/models (any model name is accepted for completions).
+        responses (list): Canned raw outputs; empty for synthetic answers.
+        response_order (str): "by-id" serves response (simulation id - 1) mod N, "random" picks one at random.
+        latency (str): Distribution of the time to first token, one of LATENCY_DISTRIBUTIONS.
+        latency_mean (float): Mean time to first token in seconds.
+        latency_sigma (float): Spread (uniform half-width in seconds, lognormal sigma of the log).
+        tokens_per_second (float): Generation speed after the first token (0 for instant).
+        rate_429 (float): Share of requests answered with 429 (with a Retry-After header).
+        rate_500 (float): Share of requests answered with 500.
+        timeout_rate (float): Share of requests that hang for hang_seconds and then drop the connection.
+        hang_seconds (float): How long a "timeout" request hangs.
+        heads_probability (float): P(H) reported in logprobs for flip tokens.
+        enforce_max_tokens (bool): Cut replies at max_tokens mock tokens (finish_reason "length"). Off by default,
+                                   since archived replies already respect the limit they were recorded with and
+                                   the mock's token split only approximates the real tokenizer.
+        seed (int, optional): Seed of the server's random generator (latency, errors, synthetic answers).
+    """
+
+    daemon_threads = True
+    # Listen backlog: socketserver's default of 5 drops connections beyond ~5 concurrent clients, which shows up as
+    # ~1 s SYN-retry tail latency and client retries; load tests open many more at once
+    request_queue_size = 1024
+
+    def __init__(self, address, models=DEFAULT_MODELS, responses=None, response_order="by-id", latency="fixed",
+                 latency_mean=0.05, latency_sigma=0.5, tokens_per_second=0.0, rate_429=0.0, rate_500=0.0,
+                 timeout_rate=0.0, hang_seconds=300.0, heads_probability=0.5, enforce_max_tokens=False, seed=None):
+        if latency not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution '{latency}'; available: {LATENCY_DISTRIBUTIONS}")
+        super().__init__(address, MockRequestHandler)
+        self.models = list(models)
+        self.responses = list(responses or [])
+        self.response_order = response_order
+        self.latency = latency
+        self.latency_mean = latency_mean
+        self.latency_sigma = latency_sigma
+        self.tokens_per_second = tokens_per_second
+        self.rate_429 = rate_429
+        self.rate_500 = rate_500
+        self.timeout_rate = timeout_rate
+        self.hang_seconds = hang_seconds
+        self.heads_probability = heads_probability
+        self.enforce_max_tokens = enforce_max_tokens
+        self.rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self.request_count = 0
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def draw(self, fn):
+        """Calls fn(rng) under a lock (random.Random is shared by all handler threads)."""
+        with self._rng_lock:
+            return fn(self.rng)
+
+    def count_request(self):
+        with self._rng_lock:
+            self.request_count += 1
+
+    def first_token_delay(self):
+        def sample(rng):
+            if self.latency == "fixed":
+                return self.latency_mean
+            if self.latency == "uniform":
+                return rng.uniform(max(0.0, self.latency_mean - self.latency_sigma), self.latency_mean + self.latency_sigma)
+            if self.latency == "exponential":
+                return rng.expovariate(1.0 / self.latency_mean) if self.latency_mean > 0 else 0.0
+            # lognormal with the requested mean: mu = ln(mean) - sigma^2 / 2
+            if self.latency_mean <= 0:
+                return 0.0
+            return rng.lognormvariate(math.log(self.latency_mean) - self.latency_sigma ** 2 / 2, self.latency_sigma)
+        return self.draw(sample)
+
+    def injected_failure(self):
+        """'429', '500', 'timeout' or None for this request."""
+        roll = self.draw(lambda rng: rng.random())
+        if roll < self.rate_429:
+            return "429"
+        if roll < self.rate_429 + self.rate_500:
+            return "500"
+        if roll < self.rate_429 + self.rate_500 + self.timeout_rate:
+            return "timeout"
+        return None
+
+    def response_text(self, body):
+        """The canned (or synthetic) reply for a chat-completion body, ending with TERMINATE like the real model."""
+        model = body.get("model", "")
+        user_text = " ".join(str(m.get("content", "")) for m in body.get("messages", []) if m.get("role") == "user")
+        if not self.responses:
+            # As many flips as the user message asks for (inference_client.USER_MESSAGE_TEMPLATE)
+            flips = NUM_FLIPS_PATTERN.search(user_text)
+            text = self.draw(lambda rng: synthetic_response(rng, model, int(flips.group(1)) if flips else 10))
+        elif self.response_order == "random":
+            text = self.draw(lambda rng: rng.choice(self.responses))
+        else:
+            match = SIMULATION_ID_PATTERN.search(user_text)
+            index = int(match.group(1)) - 1 if match else self.draw(lambda rng: rng.randrange(len(self.responses)))
+            text = self.responses[index % len(self.responses)]
+        return f"{text}\nTERMINATE"
+
+
+class MockRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status, message, error_type, headers=None):
+        self._send_json(status, {"error": {"message": message, "type": error_type, "code": status}}, headers)
+
+    def do_GET(self):
+        if self.path.rstrip("/") != "/v1/models":
+            self._send_error(404, f"Unknown path {self.path}", "not_found")
+            return
+        self._send_json(200, {"object": "list", "data": [
+            {"id": model, "object": "model", "created": 0, "owned_by": "mock"} for model in self.server.models
+        ]})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw_body = self.rfile.read(length)
+        if self.path.rstrip("/") != "/v1/chat/completions":
+            self._send_error(404, f"Unknown path {self.path}", "not_found")
+            return
+        try:
+            body = json.loads(raw_body or b"{}")
+        except ValueError:
+            self._send_error(400, "Request body is not valid JSON", "invalid_request_error")
+            return
+        self.server.count_request()
+
+        failure = self.server.injected_failure()
+        if failure == "429":
+            self._send_error(429, "Rate limit exceeded (injected)", "rate_limit_error", {"Retry-After": "1"})
+            return
+        if failure == "500":
+            self._send_error(500, "Internal server error (injected)", "server_error")
+            return
+        if failure == "timeout":
+            time.sleep(self.server.hang_seconds)
+            self.close_connection = True
+            return
+
+        completion = self._build_completion(body)
+        time.sleep(self.server.first_token_delay())
+        if body.get("stream"):
+            self._stream(body, completion)
+        else:
+            self._respond(body, completion)
+
+    def _build_completion(self, body):
+        """Tokens of the reply (cut at max_tokens if enforced), finish reason and usage."""
+        model = body.get("model", "")
+        tokens = tokenize(self.server.response_text(body))
+        max_tokens = body.get("max_tokens") or body.get("max_completion_tokens")
+        finish_reason = "stop"
+        if self.server.enforce_max_tokens and max_tokens and len(tokens) > max_tokens:
+            tokens = tokens[:max_tokens]
+            finish_reason = "length"
+        prompt_chars = sum(len(str(m.get("content", ""))) for m in body.get("messages", []))
+        text = "".join(tokens)
+        think_end = text.find("</think>")
+        reasoning_tokens = len(tokenize(text[:think_end])) if think_end != -1 and "r1" in model.lower() else 0
+        usage = {
+            "prompt_tokens": max(1, prompt_chars // 4),
+            "completion_tokens": len(tokens),
+            "total_tokens": max(1, prompt_chars // 4) + len(tokens),
+            "completion_tokens_details": {"reasoning_tokens": reasoning_tokens},
+        }
+        return {"id": f"chatcmpl-{uuid.uuid4().hex[:24]}", "model": model, "tokens": tokens,
+                "finish_reason": finish_reason, "usage": usage}
+
+    def _token_logprob(self, token, top_n):
+        """Logprob entry for one token; flip tokens report the configured H/T split."""
+        p_heads = self.server.heads_probability
+        if token in ("H", "T"):
+            candidates = [("H", p_heads), ("T", 1.0 - p_heads)]
+        else:
+            candidates = [(token, 0.9), (token.upper() if token != token.upper() else token.lower(), 0.1)]
+        candidates = [(tok, math.log(max(p, 1e-12))) for tok, p in candidates]
+        chosen = dict(candidates).get(token, math.log(0.9))
+        entry = {"token": token, "logprob": chosen, "bytes": list(token.encode("utf-8"))}
+        entry["top_logprobs"] = [{"token": tok, "logprob": lp, "bytes": list(tok.encode("utf-8"))}
+                                 for tok, lp in sorted(candidates, key=lambda c: -c[1])[:top_n]]
+        return entry
+
+    def _logprobs(self, body, tokens):
+        if not body.get("logprobs"):
+            return None
+        top_n = int(body.get("top_logprobs") or 0)
+        return {"content": [self._token_logprob(token, top_n) for token in tokens]}
+
+    def _generation_delay(self, num_tokens):
+        rate = self.server.tokens_per_second
+        return num_tokens / rate if rate > 0 else 0.0
+
+    def _respond(self, body, completion):
+        time.sleep(self._generation_delay(len(completion["tokens"])))
+        self._send_json(200, {
+            "id": completion["id"],
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": completion["model"],
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(completion["tokens"])},
+                "logprobs": self._logprobs(body, completion["tokens"]),
+                "finish_reason": completion["finish_reason"],
+            }],
+            "usage": completion["usage"],
+        })
+
+    def _stream(self, body, completion):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        include_usage = (body.get("stream_options") or {}).get("include_usage")
+        base = {"id": completion["id"], "object": "chat.completion.chunk", "created": int(time.time()),
+                "model": completion["model"]}
+        token_delay = self._generation_delay(1)
+
+        def send(payload):
+            self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        try:
+            send(dict(base, choices=[{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}]))
+            for token in completion["tokens"]:
+                choice = {"index": 0, "delta": {"content": token}, "finish_reason": None}
+                logprobs = self._logprobs(body, [token])
+                if logprobs is not None:
+                    choice["logprobs"] = logprobs
+                send(dict(base, choices=[choice]))
+                if token_delay:
+                    time.sleep(token_delay)
+            send(dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": completion["finish_reason"]}]))
+            if include_usage:
+                send(dict(base, choices=[], usage=completion["usage"]))
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client closed the stream early (e.g. once the sequence was captured)
+            return
+
+
+def load_archive_responses(patterns):
+    """Raw outputs of every archive matching the glob patterns, in file order then simulation id order."""
+    responses = []
+    for pattern in patterns:
+        for filepath in sorted(glob.glob(pattern)):
+            archive = parse_raw_archive(filepath)
+            responses.extend(archive[simulation_id] for simulation_id in sorted(archive))
+            print(f"Loaded {len(archive)} canned responses from {filepath}")
+    return responses
+
+
+def start_mock_server(host="127.0.0.1", port=0, **options):
+    """
+    Starts a MockInferenceServer on a background thread (port 0 picks a free port).
+
+    Returns:
+        MockInferenceServer: The running server; use .base_url for the client and .shutdown() to stop it.
+    """
+    server = MockInferenceServer((host, port), **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible mock of the inference endpoint.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--models", nargs="+", default=list(DEFAULT_MODELS), help="Model ids listed by /v1/models")
+    parser.add_argument("--archives", nargs="*", default=[DEFAULT_ARCHIVE_GLOB],
+                        help="Raw-output archive files/globs to replay (none: synthetic answers)")
+    parser.add_argument("--response-order", choices=("by-id", "random"), default="by-id",
+                        help="by-id: simulation N gets canned response N; random: any canned response")
+    parser.add_argument("--latency", choices=LATENCY_DISTRIBUTIONS, default="fixed", help="Time-to-first-token distribution")
+    parser.add_argument("--latency-mean", type=float, default=0.05, help="Mean time to first token (seconds)")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="Uniform half-width (s) or lognormal sigma")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="Generation speed after the first token (0: instant)")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Share of requests answered with 429")
+    parser.add_argument("--rate-500", type=float, default=0.0, help="Share of requests answered with 500")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="Share of requests that hang (client timeout)")
+    parser.add_argument("--hang-seconds", type=float, default=300.0)
+    parser.add_argument("--heads-probability", type=float, default=0.5, help="P(H) reported in logprobs")
+    parser.add_argument("--enforce-max-tokens", action="store_true", help="Cut replies at max_tokens (mock tokens)")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    server = MockInferenceServer(
+        (args.host, args.port), models=args.models, responses=load_archive_responses(args.archives),
+        response_order=args.response_order, latency=args.latency, latency_mean=args.latency_mean,
+        latency_sigma=args.latency_sigma, tokens_per_second=args.tokens_per_second, rate_429=args.rate_429,
+        rate_500=args.rate_500, timeout_rate=args.timeout_rate, hang_seconds=args.hang_seconds,
+        heads_probability=args.heads_probability, enforce_max_tokens=args.enforce_max_tokens, seed=args.seed,
+    )
+    print(f"Mock inference server listening on {server.base_url} "
+          f"({len(server.responses) or 'synthetic'} canned responses)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down mock server.")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
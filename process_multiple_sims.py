@@ -1,23 +1,34 @@
+##Repeat tables and multinomial probabilities of several runs, written to one summary file (plus a .json twin).
+##Every input (CSV, stored run or catalogued run) is summarized on its own, in a process pool, and the result is
+##cached in results/summary_cache/ under a hash of the input's content: re-summarizing only recomputes new or changed
+##inputs and assembles the file from the cache.
+
+import argparse
+import hashlib
+import json
 import pandas as pd
 import os
-from scipy.stats import multinomial # Added
-from math import factorial # For multinomial coefficient if needed (though scipy handles it)
-import itertools # To generate all possible sequences for ordering
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from scipy.special import gammaln
+import numpy as np
+from flip_codes import SEQUENCE_LENGTH, all_sequences, encode_sequences
+from flip_extraction import EXTRACTION_STRATEGIES
+from run_catalog import (DEFAULT_CATALOG_PATH, file_digests, file_sha256, load_run_sequences, scan_results, select_runs,
+                         strategy_condition)
+from repeat_profiles import MAX_EXACT_DRAWS, profile_p_values, repeat_profile, repeat_profile_distribution
+from run_store import DEFAULT_STORE_DIR, load_sequences, stored_num_flips, stored_run_metadata
 
 def get_all_possible_sequences(length=10):
-    """Generates all 2^length possible HT sequences of a given length."""
+    """Generates all 2^length possible HT sequences of a given length, sorted (position == flip_codes code)."""
     if length == 0:
         return [""]
-    shorter_sequences = get_all_possible_sequences(length - 1)
-    result = []
-    for s in shorter_sequences:
-        result.append(s + "H")
-        result.append(s + "T")
-    return sorted(result) # Sort for a consistent ordering
+    return all_sequences(length)
 
-ALL_10_FLIP_SEQUENCES = get_all_possible_sequences(10) # Should be 1024
-NUM_POSSIBLE_SEQUENCES = len(ALL_10_FLIP_SEQUENCES)
-PROB_SINGLE_SPECIFIC_SEQUENCE = (0.5)**10
+# The sequences themselves are never listed: a sequence is identified by its flip_codes code (its index in
+# get_all_possible_sequences order) and only the observed ones are counted, so any length works
+NUM_POSSIBLE_SEQUENCES = 2 ** SEQUENCE_LENGTH # 1024
+PROB_SINGLE_SPECIFIC_SEQUENCE = (0.5)**SEQUENCE_LENGTH
 
 def read_simulation_csv(filepath):
     # ... (same as before)
@@ -40,7 +51,30 @@ def read_simulation_csv(filepath):
         return None
 
 
-def generate_frequency_summary_and_counts_vector(df, total_simulations):
+def detailed_df_from_sequences(sequences):
+    """The flip_sequence / sequence_frequency columns of a detailed_analyzed_*.csv, built from a run's sequences."""
+    df = pd.DataFrame({"flip_sequence": pd.Series(sequences, dtype=object)})
+    df["sequence_frequency"] = df.groupby("flip_sequence")["flip_sequence"].transform("size")
+    return df
+
+
+def sequence_counts(unique_sequences_df, length=SEQUENCE_LENGTH):
+    """
+    Sparse counts of the observed sequences from unique (flip_sequence, sequence_frequency) rows.
+
+    The sequences are bit-packed (flip_codes) and grouped by code, so memory grows with the number of distinct
+    sequences, not with 2^length; rows that are not valid sequences are left out, as before.
+
+    Returns:
+        tuple: (codes, counts) - sorted codes of the observed sequences and how often each occurred.
+    """
+    codes, valid = encode_sequences(unique_sequences_df['flip_sequence'], length)
+    frequencies = unique_sequences_df['sequence_frequency'].to_numpy(dtype=np.int64)
+    observed_codes, inverse = np.unique(codes[valid], return_inverse=True)
+    return observed_codes, np.bincount(inverse, weights=frequencies[valid], minlength=len(observed_codes)).astype(np.int64)
+
+
+def generate_frequency_summary_and_counts_vector(df, total_simulations, length=SEQUENCE_LENGTH):
     """
     Generates a summary of sequence frequencies and a counts vector for multinomial probability.
 
@@ -49,10 +83,10 @@ def generate_frequency_summary_and_counts_vector(df, total_simulations):
         total_simulations (int): Total number of simulations in this file.
 
     Returns:
-        tuple: (list of duplicated sequences, count of single sequences, list of counts for all 1024 sequences)
+        tuple: (list of duplicated sequences, count of single sequences, counts of the observed sequences)
     """
     if df is None or df.empty:
-        return [], 0, [0] * NUM_POSSIBLE_SEQUENCES # Return zero vector if no data
+        return [], 0, np.zeros(0, dtype=np.int64) # No sequence observed
 
     unique_sequences_df = df[['flip_sequence', 'sequence_frequency']].drop_duplicates().reset_index(drop=True)
     
@@ -66,20 +100,15 @@ def generate_frequency_summary_and_counts_vector(df, total_simulations):
     num_single_sequences = unique_sequences_df[unique_sequences_df['sequence_frequency'] == 1].shape[0]
 
     # --- Prepare counts vector for multinomial ---
-    # This vector needs to have one entry for each of the 1024 possible sequences,
-    # in a consistent order.
+    # Sequences that never appeared contribute nothing to the multinomial, so only the
+    # observed ones are counted (sparse; no 2^length vector).
     
     # Get observed counts for sequences that actually appeared
-    observed_counts_map = pd.Series(unique_sequences_df.sequence_frequency.values, 
-                                    index=unique_sequences_df.flip_sequence).to_dict()
-
-    multinomial_counts_vector = [0] * NUM_POSSIBLE_SEQUENCES
-    for i, seq_key in enumerate(ALL_10_FLIP_SEQUENCES):
-        multinomial_counts_vector[i] = observed_counts_map.get(seq_key, 0)
+    _, multinomial_counts_vector = sequence_counts(unique_sequences_df, length)
         
     # Sanity check: sum of counts should be total_simulations
-    if sum(multinomial_counts_vector) != total_simulations:
-        print(f"Warning: Sum of multinomial_counts_vector ({sum(multinomial_counts_vector)}) "
+    if multinomial_counts_vector.sum() != total_simulations:
+        print(f"Warning: Sum of multinomial_counts_vector ({multinomial_counts_vector.sum()}) "
               f"does not match total_simulations ({total_simulations}). This can happen if "
               f"the input CSV was pre-filtered or doesn't represent all original trials.")
               # Or if the 'sequence_frequency' in the CSV was per unique sequence, not per original trial.
@@ -98,43 +127,339 @@ def generate_frequency_summary_and_counts_vector(df, total_simulations):
     return duplicated_sequences_summary, num_single_sequences, multinomial_counts_vector
 
 
-def calculate_multinomial_prob_of_distribution(counts_vector, total_trials):
+# Log-probability of any single specific sequence under the fair-coin model (uniform over all 2^10 sequences)
+LOG_PROB_SINGLE_SPECIFIC_SEQUENCE = SEQUENCE_LENGTH * np.log(0.5)
+
+
+def log_prob_single_sequence(length=SEQUENCE_LENGTH):
+    """Log-probability of one specific `length`-flip sequence under the fair-coin model."""
+    return length * np.log(0.5)
+# log(k!) for k = 0..len-1, grown on demand (see log_factorials)
+_LOG_FACTORIALS = gammaln(np.arange(1, 1025, dtype=np.float64))
+
+
+def log_factorials(counts):
+    """log(c!) of every count, looked up in a cached table that is extended when a larger count comes along."""
+    global _LOG_FACTORIALS
+    counts = np.asarray(counts, dtype=np.int64)
+    largest = int(counts.max()) if counts.size else 0
+    if largest >= len(_LOG_FACTORIALS):
+        _LOG_FACTORIALS = gammaln(np.arange(1, 2 * largest + 2, dtype=np.float64))
+    return _LOG_FACTORIALS[counts]
+
+
+def multinomial_log_pmf(counts, log_p=LOG_PROB_SINGLE_SPECIFIC_SEQUENCE):
+    """
+    Natural-log multinomial probability of observed counts when every category has the same probability.
+
+    log P = log n! - sum log c_i! + n log p. Categories with count 0 contribute nothing, so `counts` may be sparse
+    (only the sequences that occurred) and n can be arbitrarily large without underflow.
+
+    Args:
+        counts (array-like): Observed counts (dense over all categories or only the non-zero ones).
+        log_p (float): Log-probability of one category (default: one specific 10-flip sequence, 10 log 0.5).
+
+    Returns:
+        float: log P(counts).
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    counts = counts[counts > 0]
+    n = int(counts.sum())
+    return float(gammaln(n + 1) - log_factorials(counts).sum() + n * log_p)
+
+
+def batch_multinomial_log_pmf(count_vectors, log_p=LOG_PROB_SINGLE_SPECIFIC_SEQUENCE):
+    """
+    multinomial_log_pmf of many runs in one vectorized call.
+
+    Args:
+        count_vectors (list or 2-D array): One count vector per run; sparse vectors of different lengths are fine.
+
+    Returns:
+        numpy.ndarray: log P per run.
+    """
+    if isinstance(count_vectors, np.ndarray) and count_vectors.ndim == 2:
+        counts = count_vectors.astype(np.int64)
+        n = counts.sum(axis=1)
+        return gammaln(n + 1) - log_factorials(counts).sum(axis=1) + n * log_p
+    lengths = np.array([len(vector) for vector in count_vectors], dtype=np.int64)
+    counts = np.concatenate([np.asarray(vector, dtype=np.int64) for vector in count_vectors]) if len(lengths) else np.zeros(0, np.int64)
+    run_index = np.repeat(np.arange(len(lengths)), lengths)
+    observed = counts > 0
+    counts, run_index = counts[observed], run_index[observed]
+    n = np.bincount(run_index, weights=counts, minlength=len(lengths))
+    log_factorial_sums = np.bincount(run_index, weights=log_factorials(counts), minlength=len(lengths))
+    return gammaln(n + 1) - log_factorial_sums + n * log_p
+
+
+def format_log_probability(log_prob):
+    """A log-probability as d.dddde-XX, also where exp() would underflow to 0 (the format of the summary file)."""
+    if not np.isfinite(log_prob):
+        return f"{0.0:.4e}"
+    if log_prob > -700:
+        return f"{np.exp(log_prob):.4e}"
+    log10_prob = log_prob / np.log(10)
+    exponent = int(np.floor(log10_prob))
+    mantissa = round(10 ** (log10_prob - exponent), 4)
+    if mantissa >= 10:
+        mantissa, exponent = mantissa / 10, exponent + 1
+    return f"{mantissa:.4f}e{exponent:+03d}"
+
+
+def calculate_multinomial_log_prob_of_distribution(counts_vector, total_trials, length=SEQUENCE_LENGTH):
+    """
+    Log-probability of observing this distribution of counts over all possible sequences (fair coin).
+
+    Args:
+        counts_vector (array-like): Observed frequency per sequence (all 2^length slots, or only the observed ones).
+        total_trials (int): The total number of simulations (e.g., 100).
+        length (int): Flips per sequence.
+
+    Returns:
+        float: The natural-log multinomial probability (-inf if the counts do not add up to total_trials).
+    """
+    if np.sum(counts_vector) != total_trials:
+        print(f"Error in multinomial calculation: Sum of counts ({np.sum(counts_vector)}) "
+              f"does not equal total trials ({total_trials}). Probability will be 0 or incorrect.")
+        return float("-inf")
+    return multinomial_log_pmf(counts_vector, log_prob_single_sequence(length))
+
+
+def calculate_multinomial_prob_of_distribution(counts_vector, total_trials, length=SEQUENCE_LENGTH):
     """
     Calculates the probability of observing a specific distribution of counts
-    for all 1024 possible sequences.
+    for all 1024 possible sequences (exp of the log-space result; underflows to 0 for large runs,
+    use calculate_multinomial_log_prob_of_distribution there).
 
     Args:
-        counts_vector (list): A list of 1024 elements, where each element is the
-                              observed frequency of the corresponding unique sequence.
+        counts_vector (array-like): The observed frequency of each unique sequence (1024 slots or only the observed ones).
         total_trials (int): The total number of simulations (e.g., 100).
 
     Returns:
         float: The multinomial probability.
     """
-    if sum(counts_vector) != total_trials:
-        print(f"Error in multinomial calculation: Sum of counts ({sum(counts_vector)}) "
-              f"does not equal total trials ({total_trials}). Probability will be 0 or incorrect.")
-        # scipy.stats.multinomial.pmf will likely return 0 if sum(counts) != n
-    
-    # Probabilities for each of the 1024 categories (each specific sequence)
-    # Each specific sequence has a probability PROB_SINGLE_SPECIFIC_SEQUENCE of occurring.
-    p_categories = [PROB_SINGLE_SPECIFIC_SEQUENCE] * NUM_POSSIBLE_SEQUENCES
-    
-    # Ensure probabilities sum to 1 (they do because 1024 * (1/1024) = 1)
-    # print(f"Sum of p_categories for multinomial: {sum(p_categories)}")
+    return float(np.exp(calculate_multinomial_log_prob_of_distribution(counts_vector, total_trials, length)))
+
+def summary_output_path(results_dir, args):
+    """Summary file of a selection: the committed paper summary for the default CSVs, else one named by a selection hash."""
+    if not (args.runs or args.where or args.csv or args.exact_repeats) and args.num_flips == SEQUENCE_LENGTH:
+        return os.path.join(results_dir, "all_files_frequency_and_multinomial_summary.txt")
+    selection = {"runs": args.runs, "where": args.where, "csv": args.csv, "strategy": args.strategy}
+    if args.num_flips != SEQUENCE_LENGTH:
+        selection["num_flips"] = args.num_flips
+    if args.exact_repeats:
+        selection["exact_repeats"] = True
+    selection = json.dumps(selection, sort_keys=True)
+    digest = hashlib.sha1(selection.encode("utf-8")).hexdigest()[:10]
+    return os.path.join(results_dir, f"frequency_and_multinomial_summary_{digest}.txt")
+
+SUMMARY_CACHE_DIR = os.path.join("results", "summary_cache")
+# Part of every cache key: bump it when a per-source summary changes, so entries of the old layout are recomputed
+SUMMARY_CACHE_VERSION = 2
+
+
+def _source_df(source):
+    """The detailed (flip_sequence, sequence_frequency) DataFrame of a source (see summarize_source)."""
+    if source["kind"] == "csv":
+        return read_simulation_csv(source["path"])
+    if source["kind"] == "run":
+        return detailed_df_from_sequences(load_sequences(source["run_id"], source["strategy"], source["store_dir"], source["length"]))
+    return detailed_df_from_sequences(load_run_sequences(source["run"]))
+
+
+def summarize_source(source):
+    """
+    Repeat table and multinomial probability of one source, i.e. the content of its block in the summary file.
+
+    Args:
+        source (dict): name, kind ("csv" with path, "run" with run_id / strategy / store_dir, or "catalog" with a
+                       run_catalog.select_runs row) and length (flips per sequence).
+
+    Returns:
+        dict: JSON-ready summary: source, num_flips, status ("ok", "count_mismatch", "no_simulations" or "unreadable"),
+              total_simulations, counts_sum, repeated ([sequence, frequency] pairs, most frequent first),
+              single_occurrences, log_probability and probability (as printed in the summary file); with the source's
+              exact_repeats also the repeat_profile (pairs, triplets, 4+) with its exact probability and p-values
+              (repeat_profiles; None beyond MAX_EXACT_DRAWS simulations).
+    """
+    source_name, length = source["name"], source["length"]
+    summary = {"source": source_name, "num_flips": length, "status": "unreadable"}
+    detailed_df = _source_df(source)
+    if detailed_df is None or detailed_df.empty:
+        return summary
+
+    # Let's assume the number of rows in the detailed_df *is* the number of original trials (e.g., 100):
+    # each row of the CSV is one of the original simulations.
+    total_simulations_in_file = len(detailed_df) # Number of rows in the CSV
+
+    # `sequence_frequency` in the CSV is already the count of how many times *that specific sequence* appeared.
+    # Create a map of observed sequence -> its count, considering only unique (sequence, frequency) pairs.
+    unique_sequences_df = detailed_df[['flip_sequence', 'sequence_frequency']].drop_duplicates()
+    unique_sequence_counts_map = unique_sequences_df.set_index('flip_sequence')['sequence_frequency'].to_dict()
+
+    # Counts of the observed sequences (sparse: unobserved ones have count 0 and drop out)
+    _, multinomial_counts_vector = sequence_counts(unique_sequences_df, length)
+    counts_sum = int(multinomial_counts_vector.sum())
+    if counts_sum != total_simulations_in_file:
+        print(f"CRITICAL WARNING for {source_name}: Sum of constructed multinomial counts ({counts_sum}) "
+              f"does not match total simulations in file ({total_simulations_in_file}). "
+              "This indicates an issue with interpreting 'sequence_frequency' or the CSV structure. "
+              "The multinomial probability will be incorrect.")
+
+    # Duplicated sequences and single count for the text report, from unique_sequence_counts_map
+    duplicated_summary_report = []
+    single_count_report = 0
+    for seq, freq in sorted(unique_sequence_counts_map.items(), key=lambda item: item[1], reverse=True):
+        if freq > 1:
+            duplicated_summary_report.append([seq, int(freq)])
+        elif freq == 1:
+            single_count_report += 1
+
+    summary.update(total_simulations=total_simulations_in_file, counts_sum=counts_sum, repeated=duplicated_summary_report,
+                   single_occurrences=single_count_report, log_probability=None, probability=None)
+    # Calculate multinomial probability if counts sum correctly
+    if counts_sum == total_simulations_in_file and total_simulations_in_file > 0:
+        log_prob_dist = calculate_multinomial_log_prob_of_distribution(multinomial_counts_vector, total_simulations_in_file, length)
+        summary.update(status="ok", log_probability=log_prob_dist, probability=format_log_probability(log_prob_dist))
+    else:
+        summary["status"] = "no_simulations" if total_simulations_in_file == 0 else "count_mismatch"
+    if source.get("exact_repeats") and summary["status"] == "ok":
+        # Exact distribution of (pairs, triplets, 4+) for this many draws from the 2^length sequences; p-values only
+        # up to MAX_EXACT_DRAWS draws, beyond which the exact distribution is too expensive
+        profile = repeat_profile([freq for _, freq in duplicated_summary_report])
+        summary.update(repeat_profile=list(profile), repeat_profile_probability=None, repeat_profile_p_value=None,
+                       repeat_profile_p_at_least_as_many_repeats=None)
+        if total_simulations_in_file <= MAX_EXACT_DRAWS:
+            p_values = profile_p_values(repeat_profile_distribution(2 ** length, total_simulations_in_file), profile)
+            summary.update(repeat_profile_probability=p_values["probability"], repeat_profile_p_value=p_values["p_value"],
+                           repeat_profile_p_at_least_as_many_repeats=p_values["p_at_least_as_many_repeats"])
+    return summary
 
+
+def format_source_summary(summary, exact_repeats=False):
+    """The summary-file block of one summarize_source result (with exact_repeats: plus its repeat-profile p-values)."""
+    lines = [f"--- Summary for: {summary['source']} ---"]
+    if summary["num_flips"] != SEQUENCE_LENGTH:
+        lines.append(f"Sequence length: {summary['num_flips']} flips")
+    if summary["status"] == "unreadable":
+        lines.append("Could not process this file or file was empty/invalid.")
+        return "\n".join(lines) + "\n\n\n"
+    lines.append(f"Total simulations in this file: {summary['total_simulations']}")
+    lines.append("Flip Sequence, Frequency")
+    if summary["counts_sum"] != summary["total_simulations"]:
+        lines.append(f"Error: Could not verify consistency for multinomial calculation. Sum of counts: {summary['counts_sum']}, "
+                     f"Expected total: {summary['total_simulations']}")
+    lines.extend(f"{seq},{freq}" for seq, freq in summary["repeated"])
+    if not summary["repeated"]:
+        lines.append("No sequences appeared more than once.")
+    lines.append("--------------------------")
+    lines.append(f"Single Occurrences (Unique Sequences),{summary['single_occurrences']}")
+    if summary["status"] == "ok":
+        lines.append(f"Multinomial Probability of this specific distribution of sequence frequencies: {summary['probability']}") # scientific notation
+        if exact_repeats and summary.get("repeat_profile_p_value") is not None:
+            lines.append(f"Repeat profile (pairs, triplets, 4+): {tuple(summary['repeat_profile'])}, "
+                         f"exact probability {summary['repeat_profile_probability']:.4e}, "
+                         f"P(profile at most this likely) = {summary['repeat_profile_p_value']:.4e}, "
+                         f"P(at least as many repeats) = {summary['repeat_profile_p_at_least_as_many_repeats']:.4e}")
+        elif exact_repeats:
+            lines.append(f"Repeat profile (pairs, triplets, 4+): {tuple(summary['repeat_profile'])}, "
+                         f"exact p-values not calculated (more than {MAX_EXACT_DRAWS} simulations)")
+    elif summary["status"] == "no_simulations":
+        lines.append("Multinomial Probability: N/A (no simulations)")
+    else: # Sum mismatch
+        lines.append("Multinomial Probability: Not calculated due to count mismatch.")
+    return "\n".join(lines) + "\n\n\n"
+
+
+def source_cache_key(source, content_digest):
+    """Summary-cache key of a source: its content digest plus everything else the summary depends on."""
+    material = {"version": SUMMARY_CACHE_VERSION, "content": content_digest, "kind": source["kind"],
+                "num_flips": source["length"], "strategy": source.get("strategy"), "exact_repeats": source.get("exact_repeats", False)}
+    return hashlib.sha256(json.dumps(material, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _cache_path(cache_dir, key):
+    return os.path.join(cache_dir, f"{key}.json")
+
+
+def _summarize_task(source):
+    return source["cache_key"], summarize_source(source)
+
+
+def summarize_sources(sources, cache_dir=SUMMARY_CACHE_DIR, workers=None, refresh=False):
+    """
+    summarize_source for every source, computing only those not in the on-disk cache (in a process pool).
+
+    Args:
+        sources (list): Source dicts (see summarize_source), each with a cache_key (source_cache_key).
+        cache_dir (str): One JSON file per summary, named by its cache key; None disables the cache.
+        workers (int, optional): Worker processes (default: CPU count); 1 summarizes in this process.
+        refresh (bool): Recompute every source and overwrite its cache entry.
+
+    Returns:
+        tuple: (summaries in source order, number of sources taken from the cache)
+    """
+    summaries = {}
+    if cache_dir and not refresh:
+        for source in sources:
+            path = _cache_path(cache_dir, source["cache_key"])
+            if os.path.exists(path):
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        summaries[source["cache_key"]] = json.load(f)
+                except (OSError, ValueError) as e:
+                    print(f"Warning: Ignoring unreadable cached summary {path}: {e}")
+    cached = len(summaries)
+    # A run selected twice (e.g. under two names) is computed once
+    missing = list({source["cache_key"]: source for source in sources if source["cache_key"] not in summaries}.values())
+
+    if workers == 1 or len(missing) <= 1:
+        results = map(_summarize_task, missing)
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers)
+        results = executor.map(_summarize_task, missing)
     try:
-        prob = multinomial.pmf(x=counts_vector, n=total_trials, p=p_categories)
-        return prob
-    except ValueError as e:
-        print(f"ValueError during multinomial.pmf: {e}")
-        print(f"  Counts vector sum: {sum(counts_vector)}, n: {total_trials}")
-        print(f"  Length of counts vector: {len(counts_vector)}, Length of p_categories: {len(p_categories)}")
-        # print(f"  Counts vector (first 10): {counts_vector[:10]}")
-        # print(f"  p_categories (first 10): {p_categories[:10]}")
-        return 0.0 # Or handle error as appropriate
+        for key, summary in results:
+            summaries[key] = summary
+            # Unreadable inputs are not cached, so their warnings come back until they are fixed
+            if cache_dir and summary["status"] != "unreadable":
+                # Write next to it and swap, so a crash never leaves a half-written entry
+                os.makedirs(cache_dir, exist_ok=True)
+                tmp_path = f"{_cache_path(cache_dir, key)}.{os.getpid()}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(summary, f)
+                os.replace(tmp_path, _cache_path(cache_dir, key))
+    finally:
+        if workers != 1 and len(missing) > 1:
+            executor.shutdown()
+    # The name is not part of the content: a cached summary may have been computed under another one
+    return [dict(summaries[source["cache_key"]], source=source["name"]) for source in sources], cached
+
 
 def main():
+    parser = argparse.ArgumentParser(description="Sequence repeat tables and multinomial probabilities for several runs.")
+    parser.add_argument("--runs", nargs="+", default=None, help="Run ids in the run store (see python run_store.py list)")
+    parser.add_argument("--strategy", default="prioritized", choices=list(EXTRACTION_STRATEGIES), help="Extraction column used with --runs and --where (unless the condition names a strategy)")
+    parser.add_argument("--store-dir", default=DEFAULT_STORE_DIR)
+    parser.add_argument("--where", default=None,
+                        help="Runs from the run catalog matching an SQL condition, e.g. \"model = 'deepseek-r1' AND temperature >= 1 AND kind = 'archive'\"")
+    parser.add_argument("--catalog", default=DEFAULT_CATALOG_PATH)
+    parser.add_argument("--csv", nargs="+", default=None, help="detailed_analyzed_*.csv files instead (default without --runs: the paper's six)")
+    parser.add_argument("--num-flips", type=int, default=SEQUENCE_LENGTH,
+                        help="Sequence length of the --csv files (stored and catalogued runs record their own)")
+    parser.add_argument("--output", default=None,
+                        help="Summary file (default: all_files_frequency_and_multinomial_summary.txt for the paper's six CSVs, "
+                             "frequency_and_multinomial_summary_<selection hash>.txt for any other selection); "
+                             "a .json twin is written next to it")
+    parser.add_argument("--exact-repeats", action="store_true",
+                        help="Add each input's repeat profile (pairs, triplets, 4+) and its exact p-values to the summary and "
+                             f"its .json twin (inputs of up to {MAX_EXACT_DRAWS} simulations; see repeat_profiles.py)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count, 1 = no pool)")
+    parser.add_argument("--cache-dir", default=SUMMARY_CACHE_DIR, help="Per-input summaries, keyed by content hash")
+    parser.add_argument("--refresh", action="store_true", help="Summarize every input again, overwriting its cached summary")
+    parser.add_argument("--no-cache", action="store_true", help="Neither read nor write the summary cache")
+    args = parser.parse_args()
+
     # Define results directory
     results_dir = "results"
     
@@ -142,7 +467,7 @@ def main():
     os.makedirs(results_dir, exist_ok=True)
 
     # Input files are now in the results directory
-    file_paths = [
+    file_paths = args.csv or [
         os.path.join(results_dir, "detailed_analyzed_coin_flipsDeepSeekV3NoSeed.csv"),
         os.path.join(results_dir, "detailed_analyzed_coin_flipsDSV3Temp1_5.csv"),
         os.path.join(results_dir, "detailed_analyzed_coin_flipsDSR1Temp1Embedded.csv"),
@@ -150,93 +475,69 @@ def main():
         os.path.join(results_dir, "detailed_analyzed_coin_flipsDSR1Temp1_5Embedded.csv"),
         os.path.join(results_dir, "detailed_analyzed_coin_flipsDSR1Temp1_5Final.csv")
     ]
+    # One picklable spec per input (see summarize_source): stored runs are read straight from the run store, no CSV
+    # stage needed. The cache key hashes the input's content, so only new or changed inputs are summarized again
+    if args.where:
+        scan_results(results_dir, args.catalog, args.store_dir)
+        where, params = strategy_condition(args.where, args.strategy)
+        try:
+            runs = select_runs(where, params, catalog_path=args.catalog)
+        except sqlite3.Error as e:
+            print(f"Error in --where condition: {e}")
+            return
+        digests = file_digests(args.catalog)
+        sources = []
+        for run in runs:
+            source = {"name": f"{os.path.basename(run['path'])} ({run['strategy']})", "kind": "catalog", "run": run,
+                      "strategy": run["strategy"], "length": run["num_flips"] or SEQUENCE_LENGTH,
+                      "exact_repeats": args.exact_repeats}
+            source["cache_key"] = source_cache_key(source, digests.get(run["path"]))
+            sources.append(source)
+        if not sources:
+            print(f"No catalogued runs match: {args.where}")
+            return
+    elif args.runs:
+        stored_runs = stored_run_metadata(args.store_dir)
+        sources = []
+        for run_id in args.runs:
+            source = {"name": f"run {run_id} ({args.strategy})", "kind": "run", "run_id": run_id, "strategy": args.strategy,
+                      "store_dir": args.store_dir, "length": stored_num_flips(run_id, args.store_dir),
+                      "exact_repeats": args.exact_repeats}
+            # A stored run is written once; run id, creation time and counts identify its content
+            run = stored_runs.get(run_id) or {}
+            source["cache_key"] = source_cache_key(source, [run_id, run.get("created_at"), run.get("trials"), run.get("valid")])
+            sources.append(source)
+    else:
+        sources = []
+        for filepath in file_paths:
+            source = {"name": os.path.basename(filepath), "kind": "csv", "path": filepath, "length": args.num_flips,
+                      "exact_repeats": args.exact_repeats}
+            source["cache_key"] = source_cache_key(source, file_sha256(filepath) if os.path.isfile(filepath) else None)
+            sources.append(source)
     
     # Output file is also in the results directory
-    output_summary_file = os.path.join(results_dir, "all_files_frequency_and_multinomial_summary.txt")
+    # The paper's summary file is only written for the paper's six CSVs; other selections get their own file
+    output_summary_file = args.output or summary_output_path(results_dir, args)
 
-    # Pre-generate all 1024 possible sequences once if not already global
-    # (It's global: ALL_10_FLIP_SEQUENCES)
-    print(f"Total possible unique 10-flip sequences: {NUM_POSSIBLE_SEQUENCES}")
-    print(f"Probability of any single specific sequence: {PROB_SINGLE_SPECIFIC_SEQUENCE}")
+    # Only counted, never listed: 2^length possible sequences per length in the selection
+    for length in sorted({source["length"] for source in sources}):
+        print(f"Total possible unique {length}-flip sequences: {2 ** length}")
+        print(f"Probability of any single specific sequence: {0.5 ** length}")
 
+    cache_dir = None if args.no_cache else args.cache_dir
+    summaries, cached = summarize_sources(sources, cache_dir, args.workers, args.refresh)
+    if cache_dir:
+        print(f"\nSummarized {len(sources)} inputs: {cached} from the cache in {cache_dir}, {len(sources) - cached} computed")
 
     with open(output_summary_file, 'w', encoding='utf-8') as outfile:
-        for filepath in file_paths:
-            print(f"\nProcessing file: {filepath}...")
-            outfile.write(f"--- Summary for: {os.path.basename(filepath)} ---\n")
-            
-            detailed_df = read_simulation_csv(filepath)
-            
-            if detailed_df is not None and not detailed_df.empty:
-                # Determine total simulations from the sum of 'sequence_frequency' of unique sequences
-                # This assumes 'sequence_frequency' in the CSV is the count of that unique sequence from 100 trials.
-                # Correct way to get total_simulations for a file if not explicitly known:
-                # It should be the number of rows in the *original* simulation log, or sum of frequencies.
-                # For the multinomial, 'n' (total_trials) must be the sum of the counts vector.
-                
-                # Let's assume the number of rows in the detailed_df *is* the number of original trials (e.g., 100)
-                # This is crucial. If detailed_df is already summarized, this assumption is wrong.
-                # Based on your CSV example, it looks like each row is one of the 100 original simulations.
-                total_simulations_in_file = len(detailed_df) # Number of rows in the CSV
-                
-                outfile.write(f"Total simulations in this file: {total_simulations_in_file}\n")
-                outfile.write("Flip Sequence, Frequency\n")
-
-                # `sequence_frequency` in the CSV is already the count of how many times *that specific sequence* appeared.
-                # We need to map these observed sequences and their counts to the full 1024-slot vector.
-                
-                # Create a map of observed sequence -> its count from the 'sequence_frequency' column
-                # considering only unique (sequence, frequency) pairs for this map.
-                unique_sequence_counts_map = detailed_df[['flip_sequence', 'sequence_frequency']].drop_duplicates().set_index('flip_sequence')['sequence_frequency'].to_dict()
-
-                multinomial_counts_vector = [0] * NUM_POSSIBLE_SEQUENCES
-                for i, seq_key in enumerate(ALL_10_FLIP_SEQUENCES):
-                    multinomial_counts_vector[i] = unique_sequence_counts_map.get(seq_key, 0)
-                
-                # Verify sum of multinomial_counts_vector equals total_simulations_in_file
-                if sum(multinomial_counts_vector) != total_simulations_in_file:
-                    print(f"CRITICAL WARNING for {os.path.basename(filepath)}: Sum of constructed multinomial counts ({sum(multinomial_counts_vector)}) "
-                          f"does not match total simulations in file ({total_simulations_in_file}). "
-                          "This indicates an issue with interpreting 'sequence_frequency' or the CSV structure. "
-                          "The multinomial probability will be incorrect.")
-                    outfile.write(f"Error: Could not verify consistency for multinomial calculation. Sum of counts: {sum(multinomial_counts_vector)}, Expected total: {total_simulations_in_file}\n")
-
-                
-                # Regenerate duplicated_summary and single_count for the text report based on unique_sequence_counts_map
-                duplicated_summary_report = []
-                single_count_report = 0
-                sorted_unique_counts = sorted(unique_sequence_counts_map.items(), key=lambda item: item[1], reverse=True)
-
-                for seq, freq in sorted_unique_counts:
-                    if freq > 1:
-                        duplicated_summary_report.append((seq, freq))
-                    elif freq == 1:
-                        single_count_report += 1
-                
-                if duplicated_summary_report:
-                    for seq, freq in duplicated_summary_report:
-                        outfile.write(f"{seq},{freq}\n")
-                else:
-                    outfile.write("No sequences appeared more than once.\n")
-                
-                outfile.write("--------------------------\n")
-                outfile.write(f"Single Occurrences (Unique Sequences),{single_count_report}\n")
-
-                # Calculate multinomial probability if counts sum correctly
-                if sum(multinomial_counts_vector) == total_simulations_in_file and total_simulations_in_file > 0 :
-                    prob_dist = calculate_multinomial_prob_of_distribution(multinomial_counts_vector, total_simulations_in_file)
-                    outfile.write(f"Multinomial Probability of this specific distribution of sequence frequencies: {prob_dist:.4e}\n") # scientific notation
-                elif total_simulations_in_file == 0:
-                     outfile.write(f"Multinomial Probability: N/A (no simulations)\n")
-                else: # Sum mismatch
-                     outfile.write(f"Multinomial Probability: Not calculated due to count mismatch.\n")
-
-            else:
-                outfile.write("Could not process this file or file was empty/invalid.\n")
-            
-            outfile.write("\n\n")
-
-    print(f"\nSummary report generated: {output_summary_file}")
+        outfile.write("".join(format_source_summary(summary, args.exact_repeats) for summary in summaries))
+    # Same content, machine-readable, next to it
+    json_summary_file = os.path.splitext(output_summary_file)[0] + ".json"
+    with open(json_summary_file, 'w', encoding='utf-8') as f:
+        json.dump({"sources": summaries}, f, indent=2)
+        f.write("\n")
+
+    print(f"\nSummary report generated: {output_summary_file} (and {json_summary_file})")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,70 @@
+##System prompts used by the runners and by sweep.py.
+##DIRECT_SYSTEM_MESSAGE is the coinflip.py prompt (DeepSeek V3 runs),
+##UNBIASED_SYSTEM_MESSAGE is the coinflip_regex.py prompt (DeepSeek R1 runs, asks for a random and unbiased sequence).
+##Both ask for 10 flips; sized_prompt rewrites one for another sequence length (--num-flips of the runners).
+
+from flip_codes import SEQUENCE_LENGTH
+
+DIRECT_SYSTEM_MESSAGE = (
+    "You are a direct output coin flip simulator. Your ONLY job is to IMMEDIATELY output a 10-character coin flip sequence ('H'/'T'), "
+    "a one-sentence explanation, and the word TERMINATE. NO OTHER TEXT, NO THINKING, NO PREAMBLE. "
+    "Your response MUST be ONLY the formatted output.\n\n"
+    "STRICT FORMAT (NO DEVIATIONS):\n"
+    "[10_CHAR_SEQUENCE_HT_ONLY_NO_SPACES_OR_OTHER_CHARS]\n"
+    "---Explanation---\n"
+    "[ONE_SENTENCE_EXPLANATION_OF_RANDOMIZATION_METHOD]\n"
+    "TERMINATE\n\n"
+    "EXAMPLE OF YOUR EXACT AND ONLY OUTPUT:\n"
+    "THTHTHTHHT\n"
+    "---Explanation---\n"
+    "Each flip was simulated with a 50% chance for H or T, independently.\n"
+    "TERMINATE\n\n"
+    "If your output contains any text before the 10-character sequence or any 'thinking' text, it is incorrect. "
+    "Produce ONLY the final answer in the specified format."
+)
+
+UNBIASED_SYSTEM_MESSAGE = (
+    "You are a direct output coin flip simulator. Your ONLY job is to output a 10-character random and unbiased coin flip sequence ('H'/'T'), "
+    "a one-sentence explanation, and the word TERMINATE. NO OTHER TEXT, NO THINKING, NO PREAMBLE. "
+    "Your response MUST be ONLY the formatted output.\n\n"
+    "STRICT FORMAT (NO DEVIATIONS):\n"
+    "[10_CHAR_SEQUENCE_HT_ONLY_NO_SPACES_OR_OTHER_CHARS]\n"
+    "---Explanation---\n"
+    "[ONE_SENTENCE_EXPLANATION_OF_RANDOMIZATION_METHOD]\n"
+    "TERMINATE\n\n"
+    "EXAMPLE OF YOUR EXACT AND ONLY OUTPUT:\n"
+    "THTHTHTHHT\n"
+    "---Explanation---\n"
+    "Each flip was simulated with a 50% chance for H or T, independently.\n"
+    "TERMINATE\n\n"
+    "Produce the final answer in the specified format."
+)
+
+# Prompt names accepted by sweep.py
+PROMPTS = {
+    "direct": DIRECT_SYSTEM_MESSAGE,
+    "unbiased": UNBIASED_SYSTEM_MESSAGE,
+}
+
+
+EXAMPLE_SEQUENCE = "THTHTHTHHT"
+
+
+def sized_prompt(system_message, num_flips=SEQUENCE_LENGTH):
+    """
+    A system message asking for `num_flips` flips instead of 10 (unchanged for 10).
+
+    The length in the instructions and the format placeholder is replaced, and the example sequence is
+    repeated or cut to the new length.
+    """
+    if num_flips == SEQUENCE_LENGTH:
+        return system_message
+    example = (EXAMPLE_SEQUENCE * (num_flips // len(EXAMPLE_SEQUENCE) + 1))[:num_flips]
+    return (system_message.replace(f"{SEQUENCE_LENGTH}-character", f"{num_flips}-character")
+            .replace(f"[{SEQUENCE_LENGTH}_CHAR_", f"[{num_flips}_CHAR_")
+            .replace(f"\n{EXAMPLE_SEQUENCE}\n", f"\n{example}\n"))
+
+
+def prompt_name(system_message, num_flips=SEQUENCE_LENGTH):
+    """Name of a system message in PROMPTS, sized for `num_flips` flips (None for a custom one)."""
+    return next((name for name, message in PROMPTS.items() if sized_prompt(message, num_flips) == system_message), None)
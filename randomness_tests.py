@@ -0,0 +1,318 @@
+##Randomness test battery over whole runs. A run's valid sequences are read into one (sequences x flips) 0/1 matrix
+##(flip_codes.FlipSequences.bit_matrix, 1 = T) and every test is a handful of NumPy operations on it, so all catalogued
+##runs are scored in seconds. Each test is taken against the fair-coin model and pools the whole run:
+##  runs            Wald-Wolfowitz runs test: total runs vs their expectation given each sequence's head count
+##                  (z < 0: too few runs / streaky, z > 0: too many / over-alternating, the usual LLM bias)
+##  longest_run     Longest run of equal flips per sequence vs its exact distribution (chi-square, tail bins pooled)
+##  serial_lag<k>   Lag-k serial correlation of the +-1 flips within sequences
+##  block_frequency Share of heads per block of the run's flips in simulation order (NIST block frequency)
+##  approx_entropy  Approximate entropy of the run's flips in simulation order (NIST, pattern length m)
+##  transitions     H/T transition matrix within sequences vs P(next | previous) = 1/2 (chi-square)
+##One table per run (test, observed, expected, z or chi-square, df, p-value) goes to stdout and to
+##results/randomness_tests_<selection hash>.txt, with a .json twin.
+##
+##Example:
+##  python randomness_tests.py --where "kind = 'archive'"     # every archived run
+##  python randomness_tests.py --runs <run id> --lags 1 2 3 4
+
+import argparse
+import functools
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import numpy as np
+from scipy.stats import chi2, norm
+from flip_codes import SEQUENCE_LENGTH, FlipSequences
+from flip_extraction import EXTRACTION_STRATEGIES
+from run_catalog import (DEFAULT_CATALOG_PATH, file_kind, load_run_sequences, read_file_sequences, scan_results, select_runs,
+                         strategy_condition)
+from run_store import DEFAULT_STORE_DIR, load_runs, load_sequences, stored_num_flips
+from sequential_test import pooled_bins
+
+DEFAULT_LAGS = (1, 2, 3)
+DEFAULT_APPROX_ENTROPY_M = 2
+
+
+def _two_sided(z):
+    return float(2 * norm.sf(abs(z))) if np.isfinite(z) else None
+
+
+def _result(test, observed, expected, statistic, df=None, p_value=None, kind="z"):
+    """One row of a run's table."""
+    return {"test": test, "observed": float(observed), "expected": float(expected), "statistic_kind": kind,
+            "statistic": float(statistic) if np.isfinite(statistic) else None, "df": df, "p_value": p_value}
+
+
+def runs_test(bits):
+    """
+    Wald-Wolfowitz runs test pooled over the run's sequences.
+
+    Conditional on each sequence's number of heads n1 and tails n2 (length L), its number of runs R has mean
+    2 n1 n2 / L + 1 and variance 2 n1 n2 (2 n1 n2 - L) / (L^2 (L - 1)); z = sum(R - mean) / sqrt(sum variance).
+
+    Args:
+        bits (numpy.ndarray): (sequences x flips) 0/1 matrix.
+
+    Returns:
+        dict: Mean runs per sequence, its expectation and the two-sided z-test.
+    """
+    length = bits.shape[1]
+    runs = 1 + np.count_nonzero(bits[:, 1:] != bits[:, :-1], axis=1)
+    tails = bits.sum(axis=1, dtype=np.int64)
+    product = 2.0 * tails * (length - tails)
+    mean = product / length + 1
+    variance = product * (product - length) / (length ** 2 * (length - 1)) if length > 1 else np.zeros(len(bits))
+    total_variance = variance.sum()
+    z = (runs - mean).sum() / math.sqrt(total_variance) if total_variance > 0 else float("nan")
+    return _result("runs", runs.mean(), mean.mean(), z, p_value=_two_sided(z))
+
+
+def longest_runs(bits):
+    """Longest run of equal flips in every sequence (one pass over the columns, vectorized over sequences)."""
+    current = np.ones(len(bits), dtype=np.int64)
+    longest = current.copy()
+    for position in range(1, bits.shape[1]):
+        current = np.where(bits[:, position] == bits[:, position - 1], current + 1, 1)
+        np.maximum(longest, current, out=longest)
+    return longest
+
+
+@functools.lru_cache(maxsize=None)
+def longest_run_distribution(length):
+    """
+    Exact P(longest run = k), k = 0..length, for a fair coin.
+
+    A sequence whose runs are all at most k is a first flip plus a composition of `length` into parts 1..k, so
+    P(longest <= k) = 2 c_k(length) / 2^length with c_k(m) = c_k(m - 1) + ... + c_k(m - k), c_k(0) = 1 (integers,
+    so even the far tail of long sequences is not rounded away).
+    """
+    at_most = [0] * (length + 1)
+    for k in range(1, length + 1):
+        compositions = [1] + [0] * length
+        for m in range(1, length + 1):
+            compositions[m] = sum(compositions[max(0, m - k):m])
+        at_most[k] = compositions[length]
+    return np.array([(at_most[k] - at_most[k - 1]) / 2 ** (length - 1) if k else 0.0 for k in range(length + 1)])
+
+
+def longest_run_test(bits):
+    """Chi-square of the longest-run histogram against longest_run_distribution (tail bins pooled)."""
+    length = bits.shape[1]
+    longest = longest_runs(bits)
+    probabilities = longest_run_distribution(length)
+    observed = np.bincount(longest, minlength=length + 1)[1:]
+    expected = probabilities[1:] * len(bits)
+    observed, expected = pooled_bins(observed, expected)
+    statistic = float(((observed - expected) ** 2 / expected).sum()) if len(expected) > 1 else float("nan")
+    df = len(expected) - 1
+    p_value = float(chi2.sf(statistic, df)) if df > 0 and np.isfinite(statistic) else None
+    return _result("longest_run", longest.mean(), (np.arange(length + 1) * probabilities).sum(), statistic, df, p_value, "chi2")
+
+
+def serial_correlation_test(bits, lag=1):
+    """
+    Lag-k serial correlation of the +-1 flips within sequences.
+
+    For a fair coin the products x_t x_{t+k} are independent +-1 with mean 0, so their mean over the run is the
+    correlation and z = sum / sqrt(number of products).
+    """
+    signs = 1 - 2 * bits.astype(np.int8)
+    products = (signs[:, lag:] * signs[:, :-lag]).astype(np.int64) if lag < bits.shape[1] else np.zeros((len(bits), 0), np.int64)
+    pairs = products.size
+    z = products.sum() / math.sqrt(pairs) if pairs else float("nan")
+    return _result(f"serial_lag{lag}", products.mean() if pairs else float("nan"), 0.0, z, p_value=_two_sided(z))
+
+
+def block_frequency_test(bits, block_size=None):
+    """
+    NIST block frequency test on the run's flips in simulation order (block_size defaults to one sequence).
+
+    chi2 = 4 M sum (pi_i - 1/2)^2 over the N complete blocks of M flips, with N degrees of freedom.
+    """
+    stream = bits.reshape(-1)
+    block_size = block_size or bits.shape[1]
+    blocks = len(stream) // block_size
+    proportions = stream[:blocks * block_size].reshape(blocks, block_size).mean(axis=1)
+    statistic = 4 * block_size * ((proportions - 0.5) ** 2).sum()
+    p_value = float(chi2.sf(statistic, blocks)) if blocks else None
+    # Reported as the mean absolute deviation of a block's share of tails from 1/2
+    return _result("block_frequency", np.abs(proportions - 0.5).mean() if blocks else float("nan"),
+                   _expected_block_deviation(block_size), statistic, blocks, p_value, "chi2")
+
+
+def _expected_block_deviation(block_size):
+    """E|pi - 1/2| for the share of tails pi in a block of a fair coin."""
+    k = np.arange(block_size + 1)
+    weights = np.array([math.comb(block_size, int(i)) for i in k], dtype=np.float64) / 2.0 ** block_size
+    return float((weights * np.abs(k / block_size - 0.5)).sum())
+
+
+def _phi(stream, m):
+    """sum pi log pi over the overlapping (wrapped) m-flip patterns of the stream."""
+    if m == 0:
+        return 0.0
+    n = len(stream)
+    wrapped = np.concatenate([stream, stream[:m - 1]]).astype(np.int64)
+    codes = np.zeros(n, dtype=np.int64)
+    for offset in range(m):
+        codes = (codes << 1) | wrapped[offset:offset + n]
+    frequencies = np.bincount(codes, minlength=2 ** m) / n
+    frequencies = frequencies[frequencies > 0]
+    return float((frequencies * np.log(frequencies)).sum())
+
+
+def approximate_entropy_test(bits, m=DEFAULT_APPROX_ENTROPY_M):
+    """
+    NIST approximate entropy test on the run's flips in simulation order.
+
+    ApEn(m) = phi(m) - phi(m + 1) is log 2 for a perfectly random stream; chi2 = 2 n (log 2 - ApEn) with 2^m
+    degrees of freedom. Too regular a stream (e.g. over-alternation) has a small ApEn and a large chi2.
+    """
+    stream = bits.reshape(-1)
+    n = len(stream)
+    apen = _phi(stream, m) - _phi(stream, m + 1) if n else float("nan")
+    statistic = 2 * n * (math.log(2) - apen)
+    p_value = float(chi2.sf(statistic, 2 ** m)) if n and np.isfinite(statistic) else None
+    return _result("approx_entropy", apen, math.log(2), statistic, 2 ** m, p_value, "chi2")
+
+
+def transition_test(bits):
+    """
+    Chi-square of the H/T transition counts within sequences against P(next | previous) = 1/2.
+
+    Each row (previous flip) of the 2x2 transition matrix expects half of its transitions to go either way: 2 df.
+    Reported as the share of transitions that switch between H and T (1/2 for a fair coin).
+    """
+    previous, following = bits[:, :-1].reshape(-1), bits[:, 1:].reshape(-1)
+    counts = np.bincount(2 * previous.astype(np.int64) + following, minlength=4).reshape(2, 2)
+    expected = counts.sum(axis=1, keepdims=True) / 2.0
+    rows = expected[:, 0] > 0
+    statistic = float(((counts[rows] - expected[rows]) ** 2 / expected[rows]).sum())
+    df = int(rows.sum())
+    transitions = counts.sum()
+    switch_share = (counts[0, 1] + counts[1, 0]) / transitions if transitions else float("nan")
+    p_value = float(chi2.sf(statistic, df)) if df else None
+    return _result("transitions", switch_share, 0.5, statistic if df else float("nan"), df, p_value, "chi2")
+
+
+def run_battery(sequences, length=SEQUENCE_LENGTH, lags=DEFAULT_LAGS, block_size=None, m=DEFAULT_APPROX_ENTROPY_M):
+    """
+    Every test of the battery on one run.
+
+    Args:
+        sequences (list): The run's sequences (invalid ones are left out).
+        length (int): Flips per sequence.
+        lags (iterable): Lags of the serial correlation tests.
+        block_size (int, optional): Block size of the block frequency test (default: one sequence).
+        m (int): Pattern length of the approximate entropy test.
+
+    Returns:
+        dict: sequences (count), num_flips and tests (one _result row per test); no tests without sequences.
+    """
+    bits = FlipSequences.from_strings(sequences, length).bit_matrix()
+    battery = {"sequences": len(bits), "num_flips": length, "tests": []}
+    if not len(bits):
+        return battery
+    battery["tests"] = ([runs_test(bits), longest_run_test(bits)] + [serial_correlation_test(bits, lag) for lag in lags]
+                        + [block_frequency_test(bits, block_size), approximate_entropy_test(bits, m), transition_test(bits)])
+    return battery
+
+
+def _fmt(value, spec=".4f"):
+    return "n/a" if value is None or not np.isfinite(value) else format(value, spec)
+
+
+def format_battery(name, battery):
+    """The text table of one run."""
+    lines = [f"--- Randomness tests for: {name} ---", f"Sequences: {battery['sequences']} x {battery['num_flips']} flips"]
+    if not battery["tests"]:
+        lines.append("No valid sequences.")
+        return "\n".join(lines) + "\n\n"
+    lines.append(f"{'Test':<16}{'Observed':>11}{'Expected':>11}{'Statistic':>22}{'df':>8}{'p-value':>12}")
+    for row in battery["tests"]:
+        large = row["statistic"] is not None and abs(row["statistic"]) >= 1e6
+        statistic = f"{row['statistic_kind']} = {_fmt(row['statistic'], '.3e' if large else '.3f')}"
+        lines.append(f"{row['test']:<16}{_fmt(row['observed']):>11}{_fmt(row['expected']):>11}{statistic:>22}"
+                     f"{row['df'] if row['df'] is not None else '':>8}{_fmt(row['p_value'], '.4g'):>12}")
+    return "\n".join(lines) + "\n\n"
+
+
+def selected_sources(args, results_dir="results"):
+    """(name, sequences loader, length) of every run in the selection; None after a reported error."""
+    if args.file:
+        missing = [path for path in args.file if not os.path.isfile(path)]
+        if missing:
+            print(f"File(s) not found: {', '.join(missing)}")
+            return None
+        return [(f"{os.path.basename(path)} ({args.strategy})",
+                 lambda path=path: read_file_sequences(path, file_kind(path) or "report", [args.strategy], args.num_flips)[args.strategy],
+                 args.num_flips) for path in args.file]
+    if args.runs or not args.where:
+        run_ids = args.runs
+        if not run_ids:
+            runs = load_runs(args.store_dir)
+            run_ids = [] if runs is None else sorted(runs["run_id"])
+        return [(f"run {run_id} ({args.strategy})",
+                 lambda run_id=run_id: load_sequences(run_id, args.strategy, args.store_dir),
+                 stored_num_flips(run_id, args.store_dir)) for run_id in run_ids]
+    scan_results(results_dir, args.catalog, args.store_dir)
+    where, params = strategy_condition(args.where, args.strategy)
+    try:
+        runs = select_runs(where, params, catalog_path=args.catalog)
+    except sqlite3.Error as e:
+        print(f"Error in --where condition: {e}")
+        return None
+    return [(f"{os.path.basename(run['path'])} ({run['strategy']})", lambda run=run: load_run_sequences(run),
+             run["num_flips"] or SEQUENCE_LENGTH) for run in runs]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs, longest-run, serial correlation, block frequency, approximate entropy "
+                                                 "and transition tests of whole runs against a fair coin.")
+    parser.add_argument("--runs", nargs="+", default=None, help="Run ids in the run store (default without --where / --file: every stored run)")
+    parser.add_argument("--where", default=None, help="Runs from the run catalog matching an SQL condition, e.g. \"kind = 'archive'\"")
+    parser.add_argument("--file", nargs="+", default=None, help="Run files instead (archive, journal, text report or detailed CSV)")
+    parser.add_argument("--strategy", default="prioritized", choices=list(EXTRACTION_STRATEGIES), help="Extraction column (with --where: unless the condition names a strategy)")
+    parser.add_argument("--catalog", default=DEFAULT_CATALOG_PATH)
+    parser.add_argument("--store-dir", default=DEFAULT_STORE_DIR)
+    parser.add_argument("--num-flips", type=int, default=SEQUENCE_LENGTH, help="Sequence length of --file reports (stored and catalogued runs record their own)")
+    parser.add_argument("--lags", type=int, nargs="+", default=list(DEFAULT_LAGS), help="Lags of the serial correlation tests")
+    parser.add_argument("--block-size", type=int, default=None, help="Block frequency block size (default: one sequence)")
+    parser.add_argument("--m", type=int, default=DEFAULT_APPROX_ENTROPY_M, help="Approximate entropy pattern length")
+    parser.add_argument("--output", default=None, help="Text file (default: results/randomness_tests_<selection hash>.txt); a .json twin is written next to it")
+    args = parser.parse_args()
+    if min(args.lags) < 1 or (args.block_size is not None and args.block_size < 1) or args.m < 1:
+        parser.error("--lags, --block-size and --m must be at least 1")
+
+    results_dir = "results"
+    sources = selected_sources(args, results_dir)
+    if sources is None:
+        return
+    if not sources:
+        print("No runs selected (python run_store.py import adds the archived ones, or pass --where / --file).")
+        return
+
+    batteries = []
+    for name, load, length in sources:
+        battery = run_battery(load(), length, args.lags, args.block_size, args.m)
+        battery["source"] = name
+        batteries.append(battery)
+        print(format_battery(name, battery), end="")
+
+    selection = json.dumps({"runs": args.runs, "where": args.where, "file": args.file, "strategy": args.strategy,
+                            "lags": args.lags, "block_size": args.block_size, "m": args.m}, sort_keys=True)
+    output = args.output or os.path.join(results_dir, f"randomness_tests_{hashlib.sha1(selection.encode('utf-8')).hexdigest()[:10]}.txt")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        f.write("".join(format_battery(battery["source"], battery) for battery in batteries))
+    json_output = os.path.splitext(output)[0] + ".json"
+    with open(json_output, "w", encoding="utf-8") as f:
+        json.dump({"runs": batteries}, f, indent=2)
+        f.write("\n")
+    print(f"Randomness tests of {len(batteries)} runs written to {output} (and {json_output})")
+
+
+if __name__ == "__main__":
+    main()
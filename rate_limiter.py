@@ -0,0 +1,133 @@
+##Adaptive rate limiting and retry backoff for the trial engine (replaces the fixed time.sleep(0.5) between trials).
+##Two token buckets cap requests/second and (optionally) tokens/minute. The request rate follows AIMD:
+##it grows by a small step after every successful call and is cut in half whenever the API answers 429/503,
+##so the runners settle at the provider's real limit instead of a guessed constant.
+##Failed trials are re-queued with jittered exponential backoff instead of being recorded as invalid.
+
+import asyncio
+import random
+import time
+
+DEFAULT_REQUESTS_PER_SECOND = 2.0
+DEFAULT_MAX_RETRIES = 5
+THROTTLE_STATUS_CODES = {429, 503}
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` units per second, bursts of up to `capacity` units."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.level = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount=1):
+        """Waits until `amount` units are available and takes them (amounts above capacity wait for a full bucket)."""
+        async with self._lock:
+            needed = min(amount, self.capacity)
+            while True:
+                self._refill()
+                if self.level >= needed:
+                    self.level -= amount
+                    return
+                await asyncio.sleep((needed - self.level) / self.rate)
+
+    def adjust(self, amount):
+        """Takes (positive) or gives back (negative) units after the fact, e.g. once real token usage is known."""
+        self._refill()
+        self.level = min(self.capacity, self.level - amount)
+
+
+class AdaptiveRateLimiter:
+    """
+    Requests/second and tokens/minute limiter with AIMD adjustment of the request rate.
+
+    Args:
+        requests_per_second (float): Starting request rate.
+        tokens_per_minute (int, optional): Token budget per minute (prompt + completion), None for no limit.
+        min_requests_per_second (float): Floor for the multiplicative decrease.
+        max_requests_per_second (float, optional): Ceiling for the additive increase, None for no ceiling.
+        increase_step (float): Requests/second added after each successful call.
+        decrease_factor (float): Multiplier applied to the request rate on 429/503.
+        decrease_cooldown (float): Seconds after a decrease during which further 429/503s are ignored,
+                                   so one burst of throttled in-flight requests only halves the rate once.
+    """
+
+    def __init__(self, requests_per_second=DEFAULT_REQUESTS_PER_SECOND, tokens_per_minute=None,
+                 min_requests_per_second=0.1, max_requests_per_second=None, increase_step=0.05, decrease_factor=0.5,
+                 decrease_cooldown=2.0):
+        self.requests = TokenBucket(requests_per_second, max(1.0, requests_per_second))
+        self.tokens = TokenBucket(tokens_per_minute / 60.0, tokens_per_minute) if tokens_per_minute else None
+        self.min_requests_per_second = min_requests_per_second
+        self.max_requests_per_second = max_requests_per_second
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.decrease_cooldown = decrease_cooldown
+        self.last_decrease = None
+
+    @property
+    def requests_per_second(self):
+        return self.requests.rate
+
+    def _set_rate(self, rate):
+        if self.max_requests_per_second is not None:
+            rate = min(rate, self.max_requests_per_second)
+        rate = max(rate, self.min_requests_per_second)
+        self.requests.rate = rate
+        self.requests.capacity = max(1.0, rate)
+
+    async def acquire(self, estimated_tokens=0):
+        """Waits for a request slot (and `estimated_tokens` of token budget)."""
+        await self.requests.acquire(1)
+        if self.tokens is not None and estimated_tokens:
+            await self.tokens.acquire(estimated_tokens)
+
+    def record_usage(self, estimated_tokens, actual_tokens):
+        """Corrects the token bucket once the real usage of a call is known."""
+        if self.tokens is not None and actual_tokens is not None:
+            self.tokens.adjust(actual_tokens - estimated_tokens)
+
+    def on_success(self):
+        self._set_rate(self.requests.rate + self.increase_step)
+
+    def on_throttle(self):
+        now = time.monotonic()
+        if self.last_decrease is not None and now - self.last_decrease < self.decrease_cooldown:
+            return
+        self.last_decrease = now
+        self._set_rate(self.requests.rate * self.decrease_factor)
+        print(f"Rate limited by the API, lowering request rate to {self.requests.rate:.2f}/s")
+
+    def observe(self, record):
+        """AIMD feedback from a finished trial record."""
+        if record.get("error_status") in THROTTLE_STATUS_CODES:
+            self.on_throttle()
+        elif not record.get("error"):
+            self.on_success()
+
+
+def estimate_request_tokens(request):
+    """Rough upper bound of a request's tokens: ~4 characters per prompt token plus max_tokens."""
+    prompt_chars = len(request.get("system_message") or "") + len(request.get("user_message") or "")
+    return prompt_chars // 4 + (request.get("max_tokens") or 0)
+
+
+def is_retryable(record):
+    """Failed trials are retried on throttling, server errors and connection errors/timeouts (no status code)."""
+    if not record.get("error"):
+        return False
+    status = record.get("error_status")
+    return status is None or status in RETRYABLE_STATUS_CODES
+
+
+def backoff_delay(attempt, base=1.0, cap=60.0):
+    """Full-jitter exponential backoff: uniform in [0, min(cap, base * 2**attempt)]."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
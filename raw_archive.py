@@ -0,0 +1,110 @@
+##Reader for the archived raw-output files in results/.
+##Understands both layouts written by the runners:
+##  coin_flips_raw_llm_outputs_*.txt  ("--- Simulation N Raw Output ---", from coinflip_regex.py)
+##  coin_flip_results_*.txt           ("--- Simulation N Raw Full Response (after TERMINATE removal) ---", from coinflip.py)
+##ArchiveIndex memory-maps an archive and indexes the section boundaries once, so single simulations (or
+##byte ranges handed to other processes, see reextract.py) are read without loading the whole file.
+
+import mmap
+import os
+import re
+
+RAW_OUTPUT_HEADER = re.compile(r"^--- Simulation (\d+) Raw (?:Output|Full Response \(after TERMINATE removal\)) ---$", re.MULTILINE)
+SIMULATION_SEPARATOR = re.compile(r"\n-{20,}\n")
+# Same header on the raw bytes; "\r?" because parse_raw_archive's text-mode read also accepts \r\n files
+RAW_OUTPUT_HEADER_BYTES = re.compile(rb"^--- Simulation (\d+) Raw (?:Output|Full Response \(after TERMINATE removal\)) ---\r?$", re.MULTILINE)
+ARCHIVE_GLOBS = ["results/coin_flips_raw_llm_outputs_*.txt", "results/coin_flip_results_*.txt"]
+ARCHIVE_PREFIXES = ("coin_flips_raw_llm_outputs_", "coin_flip_results_")
+
+
+def parse_raw_archive(filepath):
+    """
+    Reads every simulation's raw LLM output from an archive file.
+
+    Args:
+        filepath (str): Path to a coin_flips_raw_llm_outputs_*.txt or coin_flip_results_*.txt file.
+
+    Returns:
+        dict: simulation id -> raw output text (after TERMINATE removal, exactly as archived).
+    """
+    try:
+        with open(filepath, "r", encoding="utf-8") as f:
+            content = f.read()
+    except FileNotFoundError:
+        print(f"Error: File not found at '{filepath}'")
+        return {}
+
+    headers = list(RAW_OUTPUT_HEADER.finditer(content))
+    raw_outputs = {}
+    for idx, header in enumerate(headers):
+        body_end = headers[idx + 1].start() if idx + 1 < len(headers) else len(content)
+        raw_outputs[int(header.group(1))] = _strip_separator(content[header.end() + 1:body_end])
+    if not raw_outputs:
+        print(f"No '--- Simulation N Raw ... ---' sections found in {filepath}.")
+    return raw_outputs
+
+
+def _strip_separator(body):
+    """Cuts a section body at its closing dashed separator line (the last one in the section)."""
+    # Prefix a newline so an empty output (separator right after the header) still matches
+    separators = list(SIMULATION_SEPARATOR.finditer("\n" + body))
+    if separators:
+        return body[:max(0, separators[-1].start() - 1)]
+    return body.rstrip("\n")
+
+
+def archive_label(filepath):
+    """Timestamp (plus any run tag) of an archive file name, e.g. 20250530_205248 or 20250527_212423DeepseekV3."""
+    name = os.path.splitext(os.path.basename(filepath))[0]
+    for prefix in ARCHIVE_PREFIXES:
+        if name.startswith(prefix):
+            return name[len(prefix):]
+    return name
+
+
+class ArchiveIndex:
+    """
+    Memory-mapped archive with the byte range of every simulation's section.
+
+    Args:
+        filepath (str): Archive file (either layout).
+        sections (dict, optional): simulation id -> (start, end) byte offsets from an earlier index of the same
+                                   file; skips the header scan (used by worker processes).
+
+    text(simulation_id) returns exactly what parse_raw_archive gives for that simulation.
+    """
+
+    def __init__(self, filepath, sections=None):
+        self.filepath = filepath
+        self._file = open(filepath, "rb")
+        # mmap refuses empty files; an empty archive simply has no sections
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(self._file.fileno()).st_size else b""
+        if sections is None:
+            headers = list(RAW_OUTPUT_HEADER_BYTES.finditer(self._map))
+            sections = {}
+            for idx, header in enumerate(headers):
+                body_end = headers[idx + 1].start() if idx + 1 < len(headers) else len(self._map)
+                sections[int(header.group(1))] = (min(header.end() + 1, body_end), body_end)
+        self.sections = sections
+
+    def __len__(self):
+        return len(self.sections)
+
+    def text(self, simulation_id):
+        start, end = self.sections[simulation_id]
+        body = self._map[start:end].decode("utf-8")
+        if "\r" in body:
+            # Universal newlines, as the text-mode read in parse_raw_archive does
+            body = body.replace("\r\n", "\n").replace("\r", "\n")
+        return _strip_separator(body)
+
+    def close(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
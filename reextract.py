@@ -0,0 +1,154 @@
+##Offline re-extraction of every archived run in results/ (no network).
+##Each raw-output archive (coin_flips_raw_llm_outputs_*.txt or coinflip.py's coin_flip_results_*.txt) is
+##memory-mapped and its "--- Simulation N Raw ... ---" sections indexed once (raw_archive.ArchiveIndex); the
+##byte ranges are then split into chunks and extracted in a process pool, each worker mapping the file itself.
+##For every archive the extraction table (one column per strategy) and disagreement report are written, plus
+##the coinflip_regex.py-layout coin_flips_prioritized_<archive label>.txt / coin_flips_embedded_only_* reports,
+##by default into results/reextracted/ so the original reports are kept, and a reextraction_<timestamp>.json summary.
+##Each archive is extracted at its run's sequence length, taken like run_catalog.py does from the run store, else from
+##a _flips<N> label suffix, else 10; --num-flips overrides it for every archive.
+##
+##Examples:
+##  python reextract.py
+##  python reextract.py results/coin_flips_raw_llm_outputs_20250530_205248.txt --strategies prioritized think_first final_answer --workers 4
+##  python reextract.py results/coin_flips_raw_llm_outputs_20250601_101500.txt --num-flips 50
+
+import argparse
+import glob
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from raw_archive import ARCHIVE_GLOBS, ArchiveIndex, archive_label
+from flip_codes import SEQUENCE_LENGTH
+from flip_extraction import EXTRACTION_STRATEGIES, evaluate_strategies, is_valid_sequence
+from run_catalog import run_num_flips
+from run_store import DEFAULT_STORE_DIR, stored_run_metadata
+from trial_journal import (SEQUENCE_REPORTS, sequence_report_filename, sequence_report_header, sequence_report_line,
+                           write_extraction_reports)
+
+DEFAULT_OUTPUT_DIR = os.path.join("results", "reextracted")
+DEFAULT_CHUNK_SIZE = 500
+
+
+def _extract_chunk(task):
+    """Worker: extracts one chunk of sections of one archive. Returns (filepath, {simulation_id: {strategy: sequence}})."""
+    filepath, sections, strategies, length = task
+    results = {}
+    with ArchiveIndex(filepath, sections) as index:
+        for simulation_id in sections:
+            results[simulation_id] = evaluate_strategies(index.text(simulation_id), strategies, length)
+    return filepath, results
+
+
+def reextract_archives(archive_paths, strategies=None, output_dir=DEFAULT_OUTPUT_DIR, workers=None,
+                       chunk_size=DEFAULT_CHUNK_SIZE, num_flips=None, store_dir=DEFAULT_STORE_DIR):
+    """
+    Re-runs the extraction strategies over every simulation of the archives and writes each archive's reports.
+
+    Args:
+        archive_paths (list): Archive files.
+        strategies (list): Registered strategy names (flip_extraction.EXTRACTION_STRATEGIES).
+        output_dir (str): Where the reports go.
+        workers (int, optional): Worker processes (default: CPU count); 1 extracts in this process.
+        chunk_size (int): Simulations per task handed to a worker.
+        num_flips (int, optional): Sequence length of every archive; by default each archive's run's length.
+        store_dir (str): Run store the run lengths are read from.
+
+    Returns:
+        dict: archive path -> {"label", "num_flips", "simulations", "valid" (per strategy), "conflicts", "reports"}.
+    """
+    strategies = list(strategies or EXTRACTION_STRATEGIES)
+    stored_runs = {} if num_flips else stored_run_metadata(store_dir)
+    tasks = []
+    simulation_counts = {}
+    lengths = {}
+    for filepath in archive_paths:
+        lengths[filepath] = num_flips or run_num_flips(archive_label(filepath), stored_runs) or SEQUENCE_LENGTH
+        with ArchiveIndex(filepath) as index:
+            sections = index.sections
+        simulation_counts[filepath] = len(sections)
+        if not sections:
+            print(f"No '--- Simulation N Raw ... ---' sections found in {filepath}.")
+        ids = sorted(sections)
+        for start in range(0, len(ids), chunk_size):
+            tasks.append((filepath, {simulation_id: sections[simulation_id] for simulation_id in ids[start:start + chunk_size]},
+                          strategies, lengths[filepath]))
+
+    extracted = {filepath: {} for filepath in archive_paths}
+    if workers == 1 or len(tasks) <= 1:
+        chunk_results = map(_extract_chunk, tasks)
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers)
+        chunk_results = executor.map(_extract_chunk, tasks)
+    try:
+        for filepath, results in chunk_results:
+            extracted[filepath].update(results)
+    finally:
+        if workers != 1 and len(tasks) > 1:
+            executor.shutdown()
+
+    os.makedirs(output_dir, exist_ok=True)
+    summary = {}
+    for filepath in archive_paths:
+        label = archive_label(filepath)
+        results = extracted[filepath]
+        length = lengths[filepath]
+        entry = {"label": label, "num_flips": length, "simulations": simulation_counts[filepath], "valid": {}, "reports": []}
+        for strategy in strategies:
+            entry["valid"][strategy] = sum(is_valid_sequence(row[strategy], length) for row in results.values())
+            if strategy not in SEQUENCE_REPORTS:
+                continue
+            report_path = os.path.join(output_dir, sequence_report_filename(strategy, label))
+            with open(report_path, "w", encoding="utf-8") as f:
+                f.write(sequence_report_header(strategy, label[:15], simulation_counts[filepath], length))
+                for simulation_id in sorted(results):
+                    f.write(sequence_report_line(simulation_id, results[simulation_id][strategy], length))
+            entry["reports"].append(report_path)
+        disagreements = write_extraction_reports(((simulation_id, results[simulation_id]) for simulation_id in sorted(results)),
+                                                 label, output_dir, strategies=strategies, length=length)
+        entry["conflicts"] = len(disagreements["conflicts"])
+        summary[filepath] = entry
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-run flip extraction over archived raw outputs, in parallel and offline.")
+    parser.add_argument("archives", nargs="*", help=f"Archive files (default: every {' / '.join(ARCHIVE_GLOBS)})")
+    parser.add_argument("--strategies", nargs="+", default=list(EXTRACTION_STRATEGIES), choices=list(EXTRACTION_STRATEGIES),
+                        help="Strategies to run (default: all registered ones); each is a column of the extraction table")
+    parser.add_argument("--output-dir", default=DEFAULT_OUTPUT_DIR)
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count, 1 = no pool)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--num-flips", type=int, default=None,
+                        help="Sequence length of every archive (default: each run's length from the run store or file name, else 10)")
+    parser.add_argument("--store-dir", default=DEFAULT_STORE_DIR, help="Run store the run lengths are read from")
+    args = parser.parse_args()
+    if args.num_flips is not None and args.num_flips < 1:
+        parser.error("--num-flips must be at least 1")
+
+    archive_paths = args.archives or sorted(path for pattern in ARCHIVE_GLOBS for path in glob.glob(pattern))
+    if not archive_paths:
+        print("No archived raw outputs found.")
+        return
+
+    start = time.perf_counter()
+    summary = reextract_archives(archive_paths, args.strategies, args.output_dir, args.workers, args.chunk_size,
+                                 args.num_flips, args.store_dir)
+    elapsed = time.perf_counter() - start
+    total = sum(entry["simulations"] for entry in summary.values())
+    for filepath, entry in summary.items():
+        valid = ", ".join(f"{strategy} {count}/{entry['simulations']}" for strategy, count in entry["valid"].items())
+        print(f"{os.path.basename(filepath)} ({entry['num_flips']} flips): valid sequences {valid}; {entry['conflicts']} trials with conflicting sequences")
+    print(f"\nRe-extracted {total} simulations from {len(summary)} archive(s) in {elapsed:.2f}s; reports in {args.output_dir}")
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    summary_path = os.path.join(args.output_dir, f"reextraction_{timestamp}.json")
+    with open(summary_path, "w", encoding="utf-8") as f:
+        json.dump({"timestamp": timestamp, "strategies": args.strategies, "seconds": elapsed, "archives": summary}, f, indent=2)
+    print(f"Summary saved to {summary_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+##Disk-backed, content-addressed response cache and offline replay for coinflip.py and coinflip_regex.py.
+##A response is stored under the SHA-256 of everything that determines it (model, temperature, max_tokens,
+##system message, user message, simulation id / seed). Total cache size is capped; the least recently used
+##entries (by file mtime, refreshed on every hit) are evicted first.
+##With --replay no request is sent at all: every trial is served from the cache or from an archived
+##raw-output file, so prompt and extraction changes can be iterated on at disk speed.
+
+import hashlib
+import json
+import os
+import time
+from trial_engine import DEFAULT_CONCURRENCY, run_trials
+
+DEFAULT_CACHE_DIR = os.path.join("results", "response_cache")
+DEFAULT_MAX_CACHE_MB = 512
+CACHE_KEY_FIELDS = ("model", "temperature", "max_tokens", "system_message", "user_message", "simulation_id", "seed")
+CACHED_RECORD_FIELDS = ("raw_output", "usage")
+
+
+def cache_key(request):
+    """SHA-256 of the request fields that determine the response."""
+    key_material = {field: request.get(field) for field in CACHE_KEY_FIELDS}
+    return hashlib.sha256(json.dumps(key_material, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """One JSON file per response in cache_dir, evicted least-recently-used first beyond max_bytes."""
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_CACHE_MB * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        self.total_bytes = sum(entry.stat().st_size for entry in os.scandir(cache_dir) if entry.name.endswith(".json"))
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, request):
+        """Cached record for this request, or None. A hit marks the entry as most recently used."""
+        path = self._path(cache_key(request))
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                record = json.load(f)
+            os.utime(path)
+        except (FileNotFoundError, ValueError):
+            return None
+        return record
+
+    def put(self, request, record):
+        key = cache_key(request)
+        path = self._path(key)
+        payload = json.dumps({field: record.get(field) for field in CACHED_RECORD_FIELDS}, ensure_ascii=False)
+        # Write to a temp file and rename, so a crash never leaves a half-written entry behind
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(payload)
+        previous_size = os.path.getsize(path) if os.path.exists(path) else 0
+        os.replace(tmp_path, path)
+        self.total_bytes += os.path.getsize(path) - previous_size
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """Deletes least recently used entries until the cache is back under max_bytes."""
+        entries = sorted((entry for entry in os.scandir(self.cache_dir) if entry.name.endswith(".json")),
+                         key=lambda entry: entry.stat().st_mtime)
+        self.total_bytes = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if self.total_bytes <= self.max_bytes:
+                break
+            size = entry.stat().st_size
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                continue
+            self.total_bytes -= size
+
+
+def run_replay_trials(request_builder, simulation_ids, cache=None, archive=None, concurrency=DEFAULT_CONCURRENCY,
+                      on_result=None, collect_results=True, should_stop=None):
+    """
+    Serves every trial from the cache (first) or an archived raw-output dict, without any network call.
+
+    Args:
+        request_builder (callable): Maps a simulation id to its request dict (used for the cache key).
+        simulation_ids (iterable): Simulation ids to replay.
+        cache (ResponseCache, optional): Response cache to look trials up in.
+        archive (dict, optional): simulation id -> raw output, e.g. from raw_archive.parse_raw_archive.
+        concurrency, on_result, collect_results, should_stop: Passed through to the trial engine.
+
+    Returns:
+        list: (simulation_id, record) tuples sorted by simulation id (empty if collect_results is False).
+    """
+    async def replay_trial(simulation_id):
+        start = time.perf_counter()
+        cached = cache.get(request_builder(simulation_id)) if cache is not None else None
+        if cached is not None:
+            record = dict(cached, replayed_from="cache")
+        elif archive is not None and simulation_id in archive:
+            record = {"raw_output": archive[simulation_id], "usage": None, "replayed_from": "archive"}
+        else:
+            print(f"Error: Simulation {simulation_id} is neither in the response cache nor in the replay archive.")
+            record = {"raw_output": "Error: No cached or archived response to replay.", "usage": None,
+                      "error": "not in cache or archive"}
+        record["simulation_id"] = simulation_id
+        record["latency_s"] = time.perf_counter() - start
+        return record
+
+    return run_trials(replay_trial, simulation_ids, concurrency=concurrency, on_result=on_result,
+                      collect_results=collect_results, should_stop=should_stop)
@@ -0,0 +1,380 @@
+##SQLite catalog of the runs in results/ (results/run_catalog.sqlite), so analysis scripts select runs with a
+##query instead of a hard-coded list of files.
+##Every recognized file is catalogued: trial journals, raw-output archives (coinflip_regex.py's
+##coin_flips_raw_llm_outputs_* and coinflip.py's coin_flip_results_*), the prioritized / embedded-only text
+##reports and detailed_analyzed_coin_flips*.csv tables. Each file gives one row per extraction strategy it holds
+##(every registered strategy for journals and archives) with the run's metadata - model, temperature,
+##max_tokens, prompt, sequence length (num_flips) and timestamp, taken from the journal records and the run store where they exist and
+##from file-name suffixes such as DSR1Temp1_5 otherwise (the length from the sequences themselves), shared
+##between the files of one timestamp - and
+##summary statistics of its sequences (valid count, mean heads, TVD vs the binomial, distinct / repeated
+##sequences, highest frequency). Reports and CSVs derived from an archive appear as their own rows (kind).
+##Scans are incremental: files whose size and mtime are unchanged are skipped without being read, files with a
+##new mtime are hashed and only re-parsed if their content changed, and deleted files are dropped.
+##
+##Examples:
+##  python run_catalog.py scan
+##  python run_catalog.py list --where "model = 'deepseek-r1' AND temperature >= 1 AND kind != 'report'"
+##  python process_multiple_sims.py --where "model LIKE 'deepseek-r1%' AND strategy = 'prioritized'"
+
+import argparse
+import csv
+import hashlib
+import os
+import re
+import sqlite3
+import time
+from datetime import datetime
+import numpy as np
+from scipy.stats import binom
+from flip_codes import SEQUENCE_LENGTH, FlipSequences
+from flip_extraction import EXTRACTION_STRATEGIES, evaluate_strategies
+from raw_archive import ARCHIVE_PREFIXES, ArchiveIndex, archive_label
+from run_store import DEFAULT_STORE_DIR, journal_run_info, stored_run_metadata
+from trial_journal import SEQUENCE_REPORTS, extraction_rows, is_journal_file, iter_journal_records
+
+DEFAULT_RESULTS_DIR = "results"
+DEFAULT_CATALOG_PATH = os.path.join("results", "run_catalog.sqlite")
+CSV_PREFIX = "detailed_analyzed_coin_flips"
+# Directories under results/ that hold no run files of their own: the run store, caches, benchmarks, and
+# reextract.py's reports (re-extractions of archives that are already catalogued)
+SKIPPED_DIRS = ("run_store", "reextracted", "response_cache", "summary_cache", "repeat_profile_cache", "benchmarks")
+RUN_COLUMNS = ("path", "strategy", "kind", "run_id", "timestamp", "source", "model", "temperature", "max_tokens",
+               "prompt", "num_flips", "trials", "valid", "mean_heads", "tvd_vs_binomial", "distinct_sequences",
+               "repeated_sequences", "max_frequency")
+HASH_CHUNK_BYTES = 1 << 20
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY, kind TEXT, size INTEGER, mtime_ns INTEGER, sha256 TEXT, scanned_at TEXT
+);
+CREATE TABLE IF NOT EXISTS runs (
+    path TEXT, strategy TEXT, kind TEXT, run_id TEXT, timestamp TEXT, source TEXT, model TEXT, temperature REAL,
+    max_tokens INTEGER, prompt TEXT, num_flips INTEGER, trials INTEGER, valid INTEGER, mean_heads REAL, tvd_vs_binomial REAL,
+    distinct_sequences INTEGER, repeated_sequences INTEGER, max_frequency INTEGER,
+    PRIMARY KEY (path, strategy)
+);
+CREATE INDEX IF NOT EXISTS runs_model_temperature ON runs (model, temperature);
+CREATE INDEX IF NOT EXISTS runs_timestamp ON runs (timestamp);
+CREATE INDEX IF NOT EXISTS runs_run_id ON runs (run_id);
+"""
+
+# File-name suffix conventions (DSR1Temp1_5, DeepSeekV3NoSeed, temp02, deepseek-r1_temp1_5_max1000_unbiased)
+_TIMESTAMP = re.compile(r"^(\d{8}_\d{6})")
+_TEMPERATURE = re.compile(r"temp_?(\d+)(?:_(\d+))?", re.IGNORECASE)
+_MAX_TOKENS = re.compile(r"_max(\d+)")
+_NUM_FLIPS = re.compile(r"_flips(\d+)$")
+_MODEL_NAME = re.compile(r"(deepseek-[a-z0-9.-]+?)(?=_temp|_max|$)")
+_MODEL_ALIASES = ((re.compile(r"dsr1|deepseekr1", re.IGNORECASE), "deepseek-r1"),
+                  (re.compile(r"dsv3|deepseekv3", re.IGNORECASE), "deepseek-v3-0324"))
+_SEQUENCE_LINE = re.compile(r"^Simulation (\d+) sequence: (.*)$")
+
+
+def label_metadata(label):
+    """
+    Run metadata encoded in a file-name label (the part after the file prefix).
+
+    Returns:
+        dict: timestamp, model, temperature, max_tokens, prompt and num_flips (None where the label says nothing).
+    """
+    metadata = {"timestamp": None, "model": None, "temperature": None, "max_tokens": None, "prompt": None, "num_flips": None}
+    match = _TIMESTAMP.match(label)
+    if match:
+        metadata["timestamp"] = match.group(1)
+    match = _MODEL_NAME.search(label)
+    if match:
+        metadata["model"] = match.group(1)
+    else:
+        metadata["model"] = next((model for pattern, model in _MODEL_ALIASES if pattern.search(label)), None)
+    match = _TEMPERATURE.search(label)
+    if match:
+        whole, fraction = match.groups()
+        # temp1_5 -> 1.5, temp02 -> 0.2 (a leading zero marks the decimal point), temp_1 -> 1
+        if fraction is None and len(whole) > 1 and whole.startswith("0"):
+            whole, fraction = "0", whole[1:]
+        metadata["temperature"] = float(f"{whole}.{fraction}" if fraction else whole)
+    flips = _NUM_FLIPS.search(label)
+    if flips:
+        # sweep.cell_tag suffix of a cell with another length than 10
+        metadata["num_flips"] = int(flips.group(1))
+        label = label[:flips.start()]
+    match = _MAX_TOKENS.search(label)
+    if match:
+        metadata["max_tokens"] = int(match.group(1))
+        metadata["prompt"] = label[match.end():].lstrip("_") or None
+    return metadata
+
+
+def file_kind(path):
+    """Catalog kind of a results file ("journal", "archive", "report", "csv"), or None if it holds no run."""
+    name = os.path.basename(path)
+    if is_journal_file(path):
+        return "journal"
+    if name.endswith(".txt") and name.startswith(ARCHIVE_PREFIXES):
+        return "archive"
+    if name.endswith(".txt") and any(name.startswith(f"{prefix}_") for prefix, *_ in SEQUENCE_REPORTS.values()):
+        return "report"
+    if name.endswith(".csv") and name.startswith(CSV_PREFIX):
+        return "csv"
+    return None
+
+
+def _report_strategy(name):
+    return next(strategy for strategy, (prefix, *_) in SEQUENCE_REPORTS.items() if name.startswith(f"{prefix}_"))
+
+
+def _file_runs(path, kind):
+    """(label, metadata, strategies) of one file: what it is a run of and which extraction columns it holds."""
+    name = os.path.splitext(os.path.basename(path))[0]
+    if kind == "journal":
+        label, metadata = journal_run_info(path)
+        metadata = {key: value for key, value in metadata.items() if value is not None}
+        return label, dict(label_metadata(label), **metadata), list(EXTRACTION_STRATEGIES)
+    if kind == "archive":
+        label = archive_label(path)
+        source = "coinflip" if name.startswith("coin_flip_results_") else "coinflip_regex"
+        return label, dict(label_metadata(label), source=source), list(EXTRACTION_STRATEGIES)
+    if kind == "report":
+        strategy = _report_strategy(name)
+        label = name[len(SEQUENCE_REPORTS[strategy][0]) + 1:]
+        return label, dict(label_metadata(label), source="coinflip_regex"), [strategy]
+    label = name[len(CSV_PREFIX):].lstrip("_")
+    # The paper's CSVs: ...Embedded = the embedded-only extraction, ...Final and the others = the prioritized one
+    strategy = "embedded_only" if label.endswith("Embedded") else "prioritized"
+    return label, dict(label_metadata(label), source="analysis"), [strategy]
+
+
+def read_file_sequences(path, kind, strategies, length=SEQUENCE_LENGTH):
+    """
+    Every trial's sequence of the file, per strategy, in simulation order (invalid ones as extracted, often "").
+    Archives are extracted at `length`; journal records carry their own.
+
+    Returns:
+        dict: strategy -> list of sequences.
+    """
+    if kind == "journal":
+        rows = sorted(extraction_rows(iter_journal_records(path), strategies), key=lambda row: row[0])
+        return {strategy: [extractions.get(strategy) or "" for _, extractions in rows] for strategy in strategies}
+    if kind == "archive":
+        with ArchiveIndex(path) as index:
+            results = [evaluate_strategies(index.text(simulation_id), strategies, length) for simulation_id in sorted(index.sections)]
+        return {strategy: [result[strategy] for result in results] for strategy in strategies}
+    if kind == "report":
+        with open(path, "r", encoding="utf-8") as f:
+            sequences = [match.group(2) for match in map(_SEQUENCE_LINE.match, f) if match]
+        return {strategy: sequences for strategy in strategies}
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        sequences = [row.get("flip_sequence") or "" for row in csv.DictReader(f)]
+    return {strategy: sequences for strategy in strategies}
+
+
+def infer_sequence_length(sequences):
+    """Most common length of the H/T-only entries (SEQUENCE_LENGTH if there are none), for files that do not record it."""
+    lengths = [len(sequence) for sequence in sequences if sequence and not sequence.strip("HT")]
+    return max(set(lengths), key=lengths.count) if lengths else SEQUENCE_LENGTH
+
+
+def sequence_statistics(sequences, length=SEQUENCE_LENGTH):
+    """Summary statistics of one run's sequences (invalid entries count as trials only)."""
+    packed = FlipSequences.from_strings(sequences, length)
+    stats = {"trials": len(sequences), "valid": len(packed), "mean_heads": None, "tvd_vs_binomial": None,
+             "distinct_sequences": 0, "repeated_sequences": 0, "max_frequency": 0}
+    if len(packed):
+        observed = packed.head_count_histogram() / len(packed)
+        _, counts = packed.unique_counts()
+        stats.update(mean_heads=float(packed.head_counts().mean()),
+                     tvd_vs_binomial=0.5 * float(np.abs(observed - binom.pmf(np.arange(length + 1), length, 0.5)).sum()),
+                     distinct_sequences=len(counts), repeated_sequences=int((counts > 1).sum()),
+                     max_frequency=int(counts.max()))
+    return stats
+
+
+def run_num_flips(label, stored_runs=None):
+    """Sequence length of an archive's run: the run store's record, else the label's _flips<N> suffix, else None."""
+    return (stored_runs or {}).get(label, {}).get("num_flips") or label_metadata(label)["num_flips"]
+
+
+def catalog_rows(path, kind, stored_runs=None):
+    """The runs-table rows of one file (one per strategy)."""
+    label, metadata, strategies = _file_runs(path, kind)
+    # Runs in the run store carry the metadata the runner was started with; it wins over the file name
+    stored = {key: value for key, value in (stored_runs or {}).get(label, {}).items() if value is not None}
+    num_flips = stored.get("num_flips") or metadata.get("num_flips")
+    rows = []
+    for strategy, sequences in read_file_sequences(path, kind, strategies, num_flips or SEQUENCE_LENGTH).items():
+        row = {"path": path, "strategy": strategy, "kind": kind, "run_id": label}
+        row.update({column: metadata.get(column) for column in ("timestamp", "source", "model", "temperature",
+                                                                "max_tokens", "prompt")})
+        row.update({column: stored[column] for column in ("model", "temperature", "max_tokens", "prompt") if column in stored})
+        row["num_flips"] = int(num_flips or infer_sequence_length(sequences))
+        row.update(sequence_statistics(sequences, row["num_flips"]))
+        rows.append(row)
+    return rows
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_digests(catalog_path=DEFAULT_CATALOG_PATH):
+    """{path: sha256} of the catalogued files, as of the last scan."""
+    with connect(catalog_path) as connection:
+        digests = {row["path"]: row["sha256"] for row in connection.execute("SELECT path, sha256 FROM files")}
+    connection.close()
+    return digests
+
+
+def connect(catalog_path=DEFAULT_CATALOG_PATH):
+    os.makedirs(os.path.dirname(catalog_path) or ".", exist_ok=True)
+    connection = sqlite3.connect(catalog_path)
+    connection.row_factory = sqlite3.Row
+    columns = {row["name"] for row in connection.execute("PRAGMA table_info(runs)")}
+    if columns and set(RUN_COLUMNS) - columns:
+        # Written before a column was added; the catalog only mirrors results/, so it is rebuilt by the next scan
+        connection.executescript("DROP TABLE IF EXISTS runs; DROP TABLE IF EXISTS files;")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def discover_files(results_dir=DEFAULT_RESULTS_DIR):
+    """(path, kind) of every run file under results_dir."""
+    found = []
+    for directory, subdirs, filenames in os.walk(results_dir):
+        subdirs[:] = sorted(subdir for subdir in subdirs if subdir not in SKIPPED_DIRS)
+        for filename in sorted(filenames):
+            path = os.path.join(directory, filename)
+            kind = file_kind(path)
+            if kind:
+                found.append((path, kind))
+    return found
+
+
+def scan_results(results_dir=DEFAULT_RESULTS_DIR, catalog_path=DEFAULT_CATALOG_PATH, store_dir=DEFAULT_STORE_DIR,
+                 force=False):
+    """
+    Brings the catalog up to date with results_dir.
+
+    Args:
+        force (bool): Re-parse every file, even unchanged ones (e.g. after new strategies were registered).
+
+    Returns:
+        dict: Counts of files added / updated, unchanged (skipped or same hash) and removed, and the seconds taken.
+    """
+    start = time.perf_counter()
+    counts = {"added": 0, "updated": 0, "unchanged": 0, "removed": 0}
+    stored_runs = None
+    with connect(catalog_path) as connection:
+        known = {row["path"]: row for row in connection.execute("SELECT path, size, mtime_ns, sha256 FROM files")}
+        found = discover_files(results_dir)
+        for path, kind in found:
+            stat = os.stat(path)
+            previous = known.get(path)
+            if previous and not force and (previous["size"], previous["mtime_ns"]) == (stat.st_size, stat.st_mtime_ns):
+                counts["unchanged"] += 1
+                continue
+            digest = file_sha256(path)
+            scanned_at = datetime.now().isoformat(timespec="seconds")
+            if previous and not force and previous["sha256"] == digest:
+                connection.execute("UPDATE files SET size = ?, mtime_ns = ?, scanned_at = ? WHERE path = ?",
+                                   (stat.st_size, stat.st_mtime_ns, scanned_at, path))
+                counts["unchanged"] += 1
+                continue
+            if stored_runs is None:
+                stored_runs = stored_run_metadata(store_dir)
+            try:
+                rows = catalog_rows(path, kind, stored_runs)
+            except (OSError, ValueError, KeyError, UnicodeDecodeError) as e:
+                print(f"Warning: Could not catalog {path}: {e}")
+                continue
+            connection.execute("DELETE FROM runs WHERE path = ?", (path,))
+            connection.executemany(f"INSERT INTO runs ({', '.join(RUN_COLUMNS)}) VALUES ({', '.join('?' * len(RUN_COLUMNS))})",
+                                   [tuple(row[column] for column in RUN_COLUMNS) for row in rows])
+            connection.execute("INSERT OR REPLACE INTO files (path, kind, size, mtime_ns, sha256, scanned_at) "
+                               "VALUES (?, ?, ?, ?, ?, ?)", (path, kind, stat.st_size, stat.st_mtime_ns, digest, scanned_at))
+            counts["updated" if previous else "added"] += 1
+        # Files that disappeared from the scanned directory
+        root = os.path.join(os.path.normpath(results_dir), "")
+        gone = set(path for path in known if os.path.join(os.path.normpath(path), "").startswith(root)) - {path for path, _ in found}
+        for path in gone:
+            connection.execute("DELETE FROM runs WHERE path = ?", (path,))
+            connection.execute("DELETE FROM files WHERE path = ?", (path,))
+        counts["removed"] = len(gone)
+        # Files of one run share its timestamp; fill in what only some of them name (e.g. an archive whose
+        # report was given the DSR1Temp1 suffix)
+        for column in ("model", "temperature", "max_tokens", "prompt") if counts["added"] or counts["updated"] else ():
+            connection.execute(f"UPDATE runs SET {column} = (SELECT other.{column} FROM runs AS other "
+                               f"WHERE other.timestamp = runs.timestamp AND other.{column} IS NOT NULL "
+                               f"ORDER BY other.path LIMIT 1) WHERE {column} IS NULL AND timestamp IS NOT NULL")
+    connection.close()
+    counts["seconds"] = time.perf_counter() - start
+    return counts
+
+
+def select_runs(where=None, params=(), catalog_path=DEFAULT_CATALOG_PATH, order_by="timestamp, path, strategy"):
+    """
+    Catalogued runs matching an SQL condition on the runs table.
+
+    Args:
+        where (str, optional): e.g. "model = 'deepseek-r1' AND temperature >= 1" (columns: RUN_COLUMNS).
+        params (tuple): Values for ? placeholders in `where`.
+
+    Returns:
+        list: One dict per (file, strategy) row.
+    """
+    query = f"SELECT * FROM runs{f' WHERE {where}' if where else ''} ORDER BY {order_by}"
+    with connect(catalog_path) as connection:
+        rows = [dict(row) for row in connection.execute(query, params)]
+    connection.close()
+    return rows
+
+
+def strategy_condition(where, strategy):
+    """(where, params) restricted to one extraction strategy, unless the condition already names a strategy."""
+    if re.search(r"\bstrategy\b", where):
+        return where, ()
+    return f"({where}) AND strategy = ?", (strategy,)
+
+
+def load_run_sequences(run):
+    """Valid sequences of one catalogued run (a select_runs row), in simulation order."""
+    length = run.get("num_flips") or SEQUENCE_LENGTH
+    sequences = read_file_sequences(run["path"], run["kind"], [run["strategy"]], length)[run["strategy"]]
+    return FlipSequences.from_strings(sequences, length).to_strings()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite catalog of the runs in results/.")
+    parser.add_argument("--catalog", default=DEFAULT_CATALOG_PATH)
+    parser.add_argument("--results-dir", default=DEFAULT_RESULTS_DIR)
+    parser.add_argument("--store-dir", default=DEFAULT_STORE_DIR)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    scan_parser = subparsers.add_parser("scan", help="Catalog new and changed files")
+    scan_parser.add_argument("--force", action="store_true", help="Re-parse every file")
+    list_parser = subparsers.add_parser("list", help="List catalogued runs (the catalog is updated first)")
+    list_parser.add_argument("--where", default=None, help=f"SQL condition on the columns {', '.join(RUN_COLUMNS)}")
+    args = parser.parse_args()
+
+    counts = scan_results(args.results_dir, args.catalog, args.store_dir, force=args.command == "scan" and args.force)
+    print(f"Catalog {args.catalog}: {counts['added']} added, {counts['updated']} updated, {counts['unchanged']} unchanged, "
+          f"{counts['removed']} removed ({counts['seconds']:.2f}s)")
+    if args.command == "list":
+        try:
+            runs = select_runs(args.where, catalog_path=args.catalog)
+        except sqlite3.Error as e:
+            print(f"Error in --where condition: {e}")
+            return
+        columns = ("run_id", "kind", "strategy", "model", "temperature", "num_flips", "trials", "valid", "mean_heads",
+                   "tvd_vs_binomial", "repeated_sequences", "max_frequency")
+        print("  ".join(columns))
+        for run in runs:
+            print("  ".join("" if run[column] is None else f"{run[column]:.4f}" if isinstance(run[column], float)
+                            else str(run[column]) for column in columns))
+        print(f"{len(runs)} run(s)")
+
+
+if __name__ == "__main__":
+    main()
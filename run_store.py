@@ -0,0 +1,389 @@
+##Columnar run store: every run's trials and metadata as Parquet files under results/run_store/.
+##  trials/<run_id>.parquet  one row per trial: one column per registered extraction strategy, extraction_ok,
+##                           error, timing (latency, TTFT, queue / rate-limit wait, start / finish), retries,
+##                           token usage, and a reference (path, format, byte offset and length) to the raw text
+##                           in the run's journal or archived raw-output file (the text itself is not copied)
+##  runs.parquet             one row per run: source, model, temperature, max_tokens, prompt, simulation and
+##                           valid counts, raw file, creation time, the trials file holding the run and the
+##                           sequence length (num_flips; empty for runs stored before it was recorded = 10)
+##"compact" merges the per-run trials files into one file sorted by run_id (a few large files read much faster
+##than thousands of small ones); runs written afterwards get their own file again until the next compaction.
+##The runners write their run here once it is finished; coin_flips_distribution.py and process_multiple_sims.py
+##read sequences straight from it (only the columns they need), so no text report has to be parsed back.
+##The text reports remain available: the runners still write them unless --no-text-reports is given, and
+##"export" rebuilds them for any stored run. "import" adds runs from older journals and raw-output archives.
+##Needs pyarrow (pip install pyarrow); without it the runners only print a warning and skip the store.
+##
+##Examples:
+##  python run_store.py import
+##  python run_store.py list
+##  python run_store.py compact
+##  python run_store.py export 20250530_205248 --results-dir results/exported
+
+import argparse
+import glob
+import json
+import os
+from datetime import datetime
+import pandas as pd
+from flip_codes import SEQUENCE_LENGTH
+from flip_extraction import EXTRACTION_STRATEGIES, is_valid_sequence
+from raw_archive import ARCHIVE_GLOBS, ArchiveIndex, archive_label
+from trial_journal import extraction_rows, is_journal_file, iter_journal_entries, write_text_reports
+from trial_metrics import USAGE_FIELDS
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+DEFAULT_STORE_DIR = os.path.join("results", "run_store")
+JOURNAL_GLOBS = ["results/coin_flip_journal_*.jsonl", "results/sweep_*/*.jsonl", "results/batch_*/*.jsonl"]
+TIMING_FIELDS = ("latency_s", "ttft_s", "queue_wait_s", "rate_limit_wait_s", "started_at", "finished_at")
+RUN_FIELDS = ("run_id", "timestamp", "source", "model", "temperature", "max_tokens", "prompt", "num_simulations",
+              "trials", "valid", "raw_path", "created_at", "trials_file", "num_flips")
+# Rows per row group of a compacted trials file (the run_id statistics let a load skip the other groups)
+COMPACT_ROW_GROUP_SIZE = 65536
+
+
+def store_available():
+    if pa is None:
+        print("Warning: pyarrow is not installed, the run store is not available (pip install pyarrow).")
+        return False
+    return True
+
+
+def trial_schema():
+    """Arrow schema of the trials files (one string column per registered strategy)."""
+    return pa.schema(
+        [("run_id", pa.string()), ("simulation_id", pa.int64())]
+        + [(name, pa.string()) for name in EXTRACTION_STRATEGIES]
+        + [("extraction_ok", pa.bool_()), ("error", pa.string())]
+        + [(field, pa.float64()) for field in TIMING_FIELDS]
+        + [("retries", pa.int64())]
+        + [(field, pa.int64()) for field in USAGE_FIELDS]
+        + [("raw_path", pa.string()), ("raw_format", pa.string()), ("raw_offset", pa.int64()), ("raw_length", pa.int64())]
+    )
+
+
+def run_schema():
+    return pa.schema([("run_id", pa.string()), ("timestamp", pa.string()), ("source", pa.string()), ("model", pa.string()),
+                      ("temperature", pa.float64()), ("max_tokens", pa.int64()), ("prompt", pa.string()),
+                      ("num_simulations", pa.int64()), ("trials", pa.int64()), ("valid", pa.int64()),
+                      ("raw_path", pa.string()), ("created_at", pa.string()), ("trials_file", pa.string()),
+                      ("num_flips", pa.int64())])
+
+
+def _trials_path(store_dir, run_id):
+    return os.path.join(store_dir, "trials", f"{run_id}.parquet")
+
+
+def _runs_path(store_dir):
+    return os.path.join(store_dir, "runs.parquet")
+
+
+def _trial_row(run_id, record, extractions, raw_ref):
+    """One trials-table row from a journal-style record, its extractions and its raw-text reference."""
+    usage = record.get("usage") or {}
+    row = {"run_id": run_id, "simulation_id": record["simulation_id"], "error": record.get("error"),
+           "retries": record.get("retries")}
+    row.update(extractions)
+    row["extraction_ok"] = record.get("extraction_ok", is_valid_sequence(extractions.get("prioritized"),
+                                                                         record.get("num_flips", SEQUENCE_LENGTH)))
+    row.update({field: record.get(field) for field in TIMING_FIELDS})
+    row.update({field: usage.get(field) for field in USAGE_FIELDS})
+    row.update(raw_ref)
+    return row
+
+
+def write_run(run_id, rows, metadata, store_dir=DEFAULT_STORE_DIR):
+    """
+    Writes one run's trials file and replaces its row in runs.parquet.
+
+    Args:
+        run_id (str): Unique run id (timestamp, plus cell tag for sweeps and batches).
+        rows (list): Trials-table rows (see _trial_row).
+        metadata (dict): RUN_FIELDS values (run_id, trials, valid and created_at are filled in).
+
+    Returns:
+        str: Path of the trials file, or None without pyarrow.
+    """
+    if not store_available():
+        return None
+    os.makedirs(os.path.join(store_dir, "trials"), exist_ok=True)
+    trials_path = _trials_path(store_dir, run_id)
+    pq.write_table(pa.Table.from_pylist(rows, schema=trial_schema()), trials_path)
+
+    run = {field: metadata.get(field) for field in RUN_FIELDS}
+    run.update(run_id=run_id, trials=len(rows), valid=sum(1 for row in rows if row["extraction_ok"]),
+               created_at=datetime.now().isoformat(timespec="seconds"), trials_file=os.path.basename(trials_path))
+    runs = pa.Table.from_pylist([run], schema=run_schema())
+    if os.path.exists(_runs_path(store_dir)):
+        existing = pq.read_table(_runs_path(store_dir), schema=run_schema())
+        existing = existing.filter(pc.not_equal(existing["run_id"], run_id))
+        runs = pa.concat_tables([existing, runs])
+    _write_runs(runs, store_dir)
+    print(f"Run {run_id} stored in {trials_path}")
+    return trials_path
+
+
+def _write_runs(runs, store_dir):
+    # Write next to it and swap, so a crash never leaves a half-written runs table
+    runs_path = _runs_path(store_dir)
+    pq.write_table(runs, runs_path + ".tmp")
+    os.replace(runs_path + ".tmp", runs_path)
+
+
+def write_run_from_journal(journal_path, run_id, metadata, store_dir=DEFAULT_STORE_DIR):
+    """Stores a run from its trial journal; the raw-text references point at the journal lines."""
+    if not store_available():
+        return None
+    rows = []
+    for offset, length, record in iter_journal_entries(journal_path):
+        _, extractions = next(extraction_rows([record]))
+        rows.append(_trial_row(run_id, record, extractions, {"raw_path": journal_path, "raw_format": "journal",
+                                                            "raw_offset": offset, "raw_length": length}))
+    return write_run(run_id, rows, dict(metadata, raw_path=journal_path), store_dir)
+
+
+def write_run_from_archive(archive_path, run_id, metadata, store_dir=DEFAULT_STORE_DIR):
+    """Stores an archived run (raw-output file, see raw_archive.py); extractions are computed from the archived text."""
+    if not store_available():
+        return None
+    rows = []
+    with ArchiveIndex(archive_path) as index:
+        for simulation_id in sorted(index.sections):
+            start, end = index.sections[simulation_id]
+            record = {"simulation_id": simulation_id, "raw_output": index.text(simulation_id)}
+            _, extractions = next(extraction_rows([record]))
+            rows.append(_trial_row(run_id, record, extractions, {"raw_path": archive_path, "raw_format": "archive",
+                                                                "raw_offset": start, "raw_length": end - start}))
+    return write_run(run_id, rows, dict(metadata, raw_path=archive_path, num_simulations=len(rows)), store_dir)
+
+
+def read_raw_output(row):
+    """Raw text of one trial row (a dict or pandas row with the raw_* columns)."""
+    if row["raw_format"] == "journal":
+        with open(row["raw_path"], "rb") as f:
+            f.seek(row["raw_offset"])
+            return json.loads(f.read(row["raw_length"]))["raw_output"]
+    sections = {row["simulation_id"]: (row["raw_offset"], row["raw_offset"] + row["raw_length"])}
+    with ArchiveIndex(row["raw_path"], sections) as index:
+        return index.text(row["simulation_id"])
+
+
+def load_runs(store_dir=DEFAULT_STORE_DIR):
+    """Run metadata table (DataFrame, empty if nothing is stored yet; None without pyarrow)."""
+    if not store_available():
+        return None
+    if not os.path.exists(_runs_path(store_dir)):
+        return pd.DataFrame(columns=list(RUN_FIELDS))
+    return pq.read_table(_runs_path(store_dir), schema=run_schema()).to_pandas()
+
+
+def _read_trials(runs, columns, store_dir):
+    """Arrow table of the trials of `runs` (rows of the runs table), read file by file from their trials_file."""
+    # An explicit schema lets files written before a strategy was registered load with that column as null
+    schema = trial_schema()
+    by_file = {}
+    for run_id, trials_file in zip(runs["run_id"], runs["trials_file"]):
+        by_file.setdefault(trials_file, []).append(run_id)
+    single = [os.path.join(store_dir, "trials", name) for name, ids in by_file.items() if name == f"{ids[0]}.parquet"]
+    tables = [ds.dataset(single, format="parquet", schema=schema).to_table(columns=columns)] if single else []
+    for name, ids in by_file.items():
+        if name != f"{ids[0]}.parquet":
+            # Compacted file: only the runs it still holds (a run stored again later lives in its own file)
+            dataset = ds.dataset(os.path.join(store_dir, "trials", name), format="parquet", schema=schema)
+            tables.append(dataset.to_table(columns=columns, filter=ds.field("run_id").isin(ids)))
+    return pa.concat_tables(tables) if tables else pa.Table.from_pylist([], schema=schema).select(columns)
+
+
+def load_trials(run_ids=None, columns=None, store_dir=DEFAULT_STORE_DIR):
+    """
+    Trials of the given runs (default: all stored runs), reading only the requested columns.
+
+    Args:
+        run_ids (list, optional): Runs to load.
+        columns (list, optional): Trials-table columns (default: all). run_id and simulation_id are always included.
+
+    Returns:
+        pandas.DataFrame: One row per trial, ordered by run and simulation id (None without pyarrow).
+    """
+    runs = load_runs(store_dir)
+    if runs is None:
+        return None
+    if run_ids is not None:
+        missing = sorted(set(run_ids) - set(runs["run_id"]))
+        if missing:
+            print(f"Warning: No stored trials for run(s) {', '.join(missing)}.")
+        runs = runs[runs["run_id"].isin(run_ids)]
+    columns = ["run_id", "simulation_id"] + [c for c in columns or trial_schema().names if c not in ("run_id", "simulation_id")]
+    table = _read_trials(runs, columns, store_dir)
+    return table.to_pandas().sort_values(["run_id", "simulation_id"], kind="stable").reset_index(drop=True)
+
+
+def compact_store(store_dir=DEFAULT_STORE_DIR):
+    """
+    Rewrites every stored run's trials into one file sorted by run_id and removes the files it replaces.
+
+    Returns:
+        str: Path of the compacted file (None if nothing is stored).
+    """
+    runs = load_runs(store_dir)
+    if runs is None or runs.empty:
+        print("Nothing to compact.")
+        return None
+    table = _read_trials(runs, trial_schema().names, store_dir).sort_by([("run_id", "ascending"), ("simulation_id", "ascending")])
+    name = f"compacted_{datetime.now().strftime('%Y%m%d_%H%M%S')}.parquet"
+    compacted_path = os.path.join(store_dir, "trials", name)
+    pq.write_table(table, compacted_path, row_group_size=COMPACT_ROW_GROUP_SIZE)
+    # Files of the runs just merged and older compacted files (only stale rows left); a run stored meanwhile keeps its file
+    old_files = (set(runs["trials_file"]) | {os.path.basename(path) for path in
+                                            glob.glob(os.path.join(store_dir, "trials", "compacted_*.parquet"))}) - {name}
+    runs = pa.Table.from_pandas(runs.assign(trials_file=name), schema=run_schema(), preserve_index=False)
+    _write_runs(runs, store_dir)
+    for old_file in old_files:
+        os.remove(os.path.join(store_dir, "trials", old_file))
+    print(f"Compacted {len(runs)} runs ({len(table)} trials) into {compacted_path}")
+    return compacted_path
+
+
+def run_num_flips(run):
+    """Sequence length of a runs-table row (runs stored before it was recorded have 10 flips)."""
+    num_flips = run.get("num_flips") if isinstance(run, dict) else run["num_flips"]
+    return int(num_flips) if pd.notna(num_flips) else SEQUENCE_LENGTH
+
+
+def stored_num_flips(run_id, store_dir=DEFAULT_STORE_DIR):
+    """Sequence length of one stored run (SEQUENCE_LENGTH if it is not stored)."""
+    runs = load_runs(store_dir)
+    if runs is None or run_id not in set(runs["run_id"]):
+        return SEQUENCE_LENGTH
+    return run_num_flips(runs[runs["run_id"] == run_id].iloc[0])
+
+
+def load_sequences(run_id, strategy="prioritized", store_dir=DEFAULT_STORE_DIR, length=None):
+    """
+    Valid sequences of one stored run, in simulation order (what parse_simulation_results_file returns).
+    `length` defaults to the run's own num_flips.
+    """
+    trials = load_trials([run_id], [strategy], store_dir)
+    if trials is None or trials.empty:
+        return []
+    length = length or stored_num_flips(run_id, store_dir)
+    return [seq for seq in trials[strategy] if is_valid_sequence(seq, length)]
+
+
+def latest_run_id(store_dir=DEFAULT_STORE_DIR):
+    runs = load_runs(store_dir)
+    if runs is None or runs.empty:
+        return None
+    return runs.sort_values(["timestamp", "run_id"])["run_id"].iloc[-1]
+
+
+def export_text_reports(run_id, results_dir="results", store_dir=DEFAULT_STORE_DIR):
+    """Rebuilds a stored run's text reports (prioritized / embedded-only / raw outputs / extraction table)."""
+    runs = load_runs(store_dir)
+    if runs is None or run_id not in set(runs["run_id"]):
+        print(f"Run {run_id} is not in the store.")
+        return
+    run = runs[runs["run_id"] == run_id].iloc[0]
+    trials = load_trials([run_id], store_dir=store_dir)
+    strategies = [name for name in EXTRACTION_STRATEGIES if name in trials.columns]
+
+    def records():
+        for row in trials.to_dict("records"):
+            yield {"simulation_id": row["simulation_id"], "raw_output": read_raw_output(row),
+                   "extractions": {name: row[name] or "" for name in strategies}}
+
+    num_simulations = run["num_simulations"] if pd.notna(run["num_simulations"]) else len(trials)
+    write_text_reports(records, run_id, int(num_simulations), results_dir, length=run_num_flips(run))
+
+
+def journal_run_info(path):
+    """(run_id, metadata) of a trial journal, from its location and its first record (model / sweep cell)."""
+    name = os.path.splitext(os.path.basename(path))[0]
+    parent = os.path.basename(os.path.dirname(path))
+    # coin_flip_journal_<ts>.jsonl, or <cell tag>.jsonl inside sweep_<ts>/ / batch_<ts>/
+    if name.startswith("coin_flip_journal_"):
+        run_id = timestamp = name[len("coin_flip_journal_"):]
+    else:
+        timestamp = parent.split("_", 1)[1] if "_" in parent else parent
+        run_id = f"{timestamp}_{name}"
+    first = next((record for _, _, record in iter_journal_entries(path)), {})
+    cell = first.get("cell") or {}
+    metadata = {"timestamp": timestamp, "source": parent.split("_", 1)[0] if cell else "journal",
+                "model": cell.get("model", first.get("model")),
+                "temperature": cell.get("temperature", first.get("temperature")),
+                "max_tokens": cell.get("max_tokens"), "prompt": cell.get("prompt"),
+                "num_flips": cell.get("num_flips", first.get("num_flips"))}
+    return run_id, metadata
+
+
+def stored_run_metadata(store_dir=DEFAULT_STORE_DIR):
+    """{run_id: RUN_FIELDS dict} of the stored runs; empty (and no warning) without pyarrow or a store."""
+    if pa is None or not os.path.exists(_runs_path(store_dir)):
+        return {}
+    runs = pq.read_table(_runs_path(store_dir), schema=run_schema()).to_pylist()
+    return {run["run_id"]: run for run in runs}
+
+
+def import_results(paths, store_dir=DEFAULT_STORE_DIR, force=False):
+    """
+    Adds older runs to the store: trial journals (*.jsonl) and raw-output archives (raw_archive.py layouts).
+    Runs already stored are skipped unless force is set. Returns the run ids written.
+    """
+    stored = set(load_runs(store_dir)["run_id"])
+    written = []
+    for path in paths:
+        if path.endswith(".jsonl"):
+            run_id, metadata = journal_run_info(path)
+            if run_id in stored and not force:
+                continue
+            if write_run_from_journal(path, run_id, metadata, store_dir):
+                written.append(run_id)
+        else:
+            run_id = archive_label(path)
+            if run_id in stored and not force:
+                continue
+            if write_run_from_archive(path, run_id, {"timestamp": run_id[:15], "source": "archive"}, store_dir):
+                written.append(run_id)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Columnar (Parquet) store of coin flip runs.")
+    parser.add_argument("--store-dir", default=DEFAULT_STORE_DIR)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = subparsers.add_parser("import", help="Add older journals and raw-output archives")
+    import_parser.add_argument("paths", nargs="*", help="Journal / archive files (default: everything in results/)")
+    import_parser.add_argument("--force", action="store_true", help="Re-import runs that are already stored")
+    subparsers.add_parser("list", help="List the stored runs")
+    subparsers.add_parser("compact", help="Merge the per-run trials files into one")
+    export_parser = subparsers.add_parser("export", help="Write a stored run's text reports")
+    export_parser.add_argument("run_id")
+    export_parser.add_argument("--results-dir", default="results")
+    args = parser.parse_args()
+
+    if not store_available():
+        return
+    if args.command == "import":
+        paths = args.paths or sorted(path for pattern in JOURNAL_GLOBS + ARCHIVE_GLOBS for path in glob.glob(pattern)
+                                     if not path.endswith(".jsonl") or is_journal_file(path))
+        written = import_results(paths, args.store_dir, args.force)
+        print(f"Imported {len(written)} run(s) into {args.store_dir}")
+    elif args.command == "list":
+        runs = load_runs(args.store_dir)
+        print(runs.drop(columns=["raw_path", "trials_file"]).to_string(index=False) if not runs.empty else "No runs stored yet.")
+    elif args.command == "compact":
+        compact_store(args.store_dir)
+    else:
+        export_text_reports(args.run_id, args.results_dir, args.store_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+##Sequential bias test for the runners' --early-stop mode.
+##After every completed trial the head-count histogram is updated and compared with Binomial(10, 0.5) using
+##the same statistics as coin_flips_distribution.py: total variation distance (TVD) and a chi-square
+##goodness-of-fit test (tail bins pooled until every bin expects at least 5 counts).
+##Because the data is looked at after every trial, look k is tested at alpha / (k * (k + 1)) (these sum to
+##alpha), so the overall false-alarm rate stays below alpha however long the run goes. The run stops as
+##  "biased"     once the chi-square p-value is below the look's threshold and the TVD exceeds tvd_tolerance,
+##  "consistent" once an upper confidence bound of the TVD (L1 concentration bound) is below tvd_tolerance,
+##or at the trial budget (num_simulations) with an "inconclusive" verdict.
+##Replaying the archived 100-trial R1/V3 reports in results/ with the defaults, every run stops as "biased" after
+##20-30 trials, most of them at the first look (min_trials = 20).
+
+import json
+import math
+import os
+import numpy as np
+from scipy.stats import binom, chisquare
+
+DEFAULT_ALPHA = 0.05
+DEFAULT_TVD_TOLERANCE = 0.1
+DEFAULT_MIN_TRIALS = 20
+MIN_EXPECTED_PER_BIN = 5
+
+
+def pooled_bins(observed, expected, min_expected=MIN_EXPECTED_PER_BIN):
+    """
+    Merges outer bins inwards until every bin expects at least `min_expected` counts.
+
+    Returns:
+        tuple: (observed, expected) numpy arrays of the pooled bins.
+    """
+    observed = [float(x) for x in observed]
+    expected = [float(x) for x in expected]
+    while len(expected) > 2 and expected[0] < min_expected:
+        first_observed, first_expected = observed.pop(0), expected.pop(0)
+        observed[0] += first_observed
+        expected[0] += first_expected
+    while len(expected) > 2 and expected[-1] < min_expected:
+        last_observed, last_expected = observed.pop(), expected.pop()
+        observed[-1] += last_observed
+        expected[-1] += last_expected
+    return np.array(observed), np.array(expected)
+
+
+class SequentialBiasTest:
+    """
+    Running TVD / chi-square test of the head counts against the binomial distribution.
+
+    Args:
+        alpha (float): Overall significance level across all looks.
+        tvd_tolerance (float): TVD below which a model counts as fair enough; a "biased" verdict also
+                               needs the observed TVD above it, so tiny but significant deviations don't stop a run.
+        min_trials (int): Valid sequences required before the first look.
+        n_flips (int): Flips per sequence.
+    """
+
+    def __init__(self, alpha=DEFAULT_ALPHA, tvd_tolerance=DEFAULT_TVD_TOLERANCE, min_trials=DEFAULT_MIN_TRIALS, n_flips=10):
+        self.alpha = alpha
+        self.tvd_tolerance = tvd_tolerance
+        self.min_trials = min_trials
+        self.n_flips = n_flips
+        self.binomial = binom.pmf(np.arange(n_flips + 1), n_flips, 0.5)
+        self.head_counts = np.zeros(n_flips + 1, dtype=np.int64)
+        self.trials_seen = 0
+        self.looks = 0
+        self.verdict = None
+        self.history = []
+
+    @property
+    def valid_sequences(self):
+        return int(self.head_counts.sum())
+
+    def add(self, sequence):
+        """
+        Adds one trial's extracted sequence (invalid ones only count as trials) and runs a look.
+
+        Returns:
+            str or None: The verdict once the test has stopped ("biased" or "consistent").
+        """
+        self.trials_seen += 1
+        if isinstance(sequence, str) and len(sequence) == self.n_flips and all(c in 'HT' for c in sequence):
+            self.head_counts[sequence.count('H')] += 1
+            if self.verdict is None and self.valid_sequences >= self.min_trials:
+                self._look()
+        return self.verdict
+
+    def statistics(self):
+        """TVD, chi-square statistic and p-value of the current histogram (None before any valid sequence)."""
+        n = self.valid_sequences
+        if n == 0:
+            return {"n": 0, "tvd": None, "chi2": None, "p_value": None}
+        tvd = 0.5 * float(np.abs(self.head_counts / n - self.binomial).sum())
+        observed, expected = pooled_bins(self.head_counts, self.binomial * n)
+        chi2, p_value = chisquare(observed, expected)
+        return {"n": n, "tvd": tvd, "chi2": float(chi2), "p_value": float(p_value)}
+
+    def tvd_margin(self, delta):
+        """Half of the L1 deviation bound sqrt(2 (K ln 2 + ln(1/delta)) / n) for K bins (holds with prob. 1 - delta)."""
+        n = self.valid_sequences
+        return 0.5 * math.sqrt(2 * ((self.n_flips + 1) * math.log(2) + math.log(1 / delta)) / n)
+
+    def _look(self):
+        self.looks += 1
+        threshold = self.alpha / (self.looks * (self.looks + 1))
+        stats = self.statistics()
+        margin = self.tvd_margin(threshold)
+        stats.update(look=self.looks, threshold=threshold, tvd_upper_bound=stats["tvd"] + margin)
+        self.history.append(stats)
+        if stats["p_value"] < threshold and stats["tvd"] > self.tvd_tolerance:
+            self.verdict = "biased"
+        elif stats["tvd_upper_bound"] < self.tvd_tolerance:
+            self.verdict = "consistent"
+
+    def should_stop(self):
+        return self.verdict is not None
+
+    def summary(self):
+        """Final verdict ("inconclusive" if the budget ran out first), statistics and settings."""
+        return {
+            "verdict": self.verdict or "inconclusive",
+            "trials": self.trials_seen,
+            "valid_sequences": self.valid_sequences,
+            "looks": self.looks,
+            "alpha": self.alpha,
+            "tvd_tolerance": self.tvd_tolerance,
+            "min_trials": self.min_trials,
+            "head_counts": self.head_counts.tolist(),
+            **self.statistics(),
+        }
+
+    def save(self, timestamp, results_dir="results", suffix=""):
+        """Writes the summary and per-look history to coin_flip_sequential_{timestamp}{suffix}.json."""
+        os.makedirs(results_dir, exist_ok=True)
+        filepath = os.path.join(results_dir, f"coin_flip_sequential_{timestamp}{suffix}.json")
+        with open(filepath, "w", encoding="utf-8") as f:
+            json.dump(dict(self.summary(), history=self.history), f, indent=2)
+        print(f"Sequential test saved to {filepath}")
+        return filepath
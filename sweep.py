@@ -0,0 +1,242 @@
+##Runs a whole model x temperature x max_tokens x prompt (x sequence length) grid in one invocation, instead of hand-editing
+##config_list / llm_config in the runners for every combination.
+##All cells run concurrently in one event loop. Requests are capped globally and per endpoint (each endpoint
+##also gets its own adaptive rate limiter), so the grid finishes in roughly the time of its slowest cell.
+##Every cell gets its own journal and the usual coin_flips_prioritized / embedded_only / raw_llm_outputs files,
+##tagged with the cell parameters, a per-cell coin_flip_metrics file (latency percentiles, tokens, throughput),
+##and a results/sweep_<timestamp>.json manifest lists all cells.
+##
+##Examples:
+##  python sweep.py --models deepseek-r1 deepseek-v3-0324 --temperatures 0.2 1 1.5 --num-simulations 100
+##  python sweep.py --grid my_grid.json
+##  python sweep.py --num-flips 10 20 50 100 --num-simulations 200
+##where my_grid.json may contain any of: models, temperatures, max_tokens, prompts, num_flips, num_simulations,
+##endpoints ({"model": "base_url"} for models served from another OpenAI-compatible endpoint).
+##Cells asking for another length than 10 flips get a _flips<N> tag suffix; the prompt is resized (prompts.sized_prompt).
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+from datetime import datetime
+from config import settings
+from prompts import PROMPTS, sized_prompt
+from flip_codes import SEQUENCE_LENGTH
+from inference_client import create_async_client, make_request, run_direct_trial
+from trial_engine import run_trials_async
+from trial_journal import TrialJournal, write_reports_from_journal
+from trial_metrics import write_metrics_report
+from run_store import write_run_from_journal
+from flip_extraction import is_valid_sequence, run_extractions
+from rate_limiter import DEFAULT_MAX_RETRIES, DEFAULT_REQUESTS_PER_SECOND, AdaptiveRateLimiter, is_retryable
+
+DEFAULT_GLOBAL_CONCURRENCY = 32
+DEFAULT_ENDPOINT_CONCURRENCY = 16
+DEFAULT_TEMPERATURES = [1.5]
+DEFAULT_MAX_TOKENS = [1000]
+DEFAULT_PROMPTS = ["unbiased"]
+
+
+def build_grid(models, temperatures, max_tokens_values, prompt_names, endpoints=None, num_flips_values=(SEQUENCE_LENGTH,)):
+    """
+    Every combination of the grid axes as a list of cell dicts.
+
+    Args:
+        models (list): Model names.
+        temperatures (list): Sampling temperatures.
+        max_tokens_values (list): max_tokens values.
+        prompt_names (list): Keys of prompts.PROMPTS.
+        endpoints (dict, optional): model -> base_url; other models use LAMBDA_INFERENCE_API_BASE.
+        num_flips_values (list): Sequence lengths.
+
+    Returns:
+        list: Cells with model, temperature, max_tokens, prompt, num_flips and base_url.
+    """
+    endpoints = endpoints or {}
+    unknown_prompts = [name for name in prompt_names if name not in PROMPTS]
+    if unknown_prompts:
+        raise ValueError(f"Unknown prompt(s) {unknown_prompts}; available: {sorted(PROMPTS)}")
+    if any(num_flips < 1 for num_flips in num_flips_values):
+        raise ValueError(f"Sequence lengths must be at least 1, got {list(num_flips_values)}")
+    return [
+        {
+            "model": model,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "prompt": prompt_name,
+            "num_flips": num_flips,
+            "base_url": endpoints.get(model, settings.LAMBDA_INFERENCE_API_BASE),
+        }
+        for model, temperature, max_tokens, prompt_name, num_flips
+        in itertools.product(models, temperatures, max_tokens_values, prompt_names, num_flips_values)
+    ]
+
+
+def cell_num_flips(cell):
+    """Sequence length of a cell (manifests written before the num_flips axis existed: 10)."""
+    return cell.get("num_flips", SEQUENCE_LENGTH)
+
+
+def cell_tag(cell):
+    """
+    File-name tag of a cell, e.g. deepseek-r1_temp1_5_max1000_unbiased (same spirit as the DSR1Temp1_5 suffixes),
+    with _flips<N> appended for another sequence length than 10.
+    """
+    temperature = f"{cell['temperature']:g}".replace(".", "_")
+    num_flips = cell_num_flips(cell)
+    flips = f"_flips{num_flips}" if num_flips != SEQUENCE_LENGTH else ""
+    return f"{cell['model']}_temp{temperature}_max{cell['max_tokens']}_{cell['prompt']}{flips}"
+
+
+def cell_metadata(cell):
+    """Run-store metadata of a cell (model, temperature, max_tokens, prompt, num_flips)."""
+    return dict({field: cell[field] for field in ("model", "temperature", "max_tokens", "prompt")}, num_flips=cell_num_flips(cell))
+
+
+def build_cell_request(cell, simulation_id):
+    num_flips = cell_num_flips(cell)
+    return make_request(simulation_id, cell["model"], cell["temperature"], cell["max_tokens"],
+                        sized_prompt(PROMPTS[cell["prompt"]], num_flips), num_flips=num_flips)
+
+
+async def run_sweep_async(cells, num_simulations, api_key, results_dir="results", timestamp=None,
+                          global_concurrency=DEFAULT_GLOBAL_CONCURRENCY, endpoint_concurrency=DEFAULT_ENDPOINT_CONCURRENCY,
+                          stream=False, token_budget=None, requests_per_second=DEFAULT_REQUESTS_PER_SECOND,
+                          tokens_per_minute=None, max_retries=DEFAULT_MAX_RETRIES, text_reports=True):
+    """
+    Runs all cells concurrently and writes their journals, reports and the sweep manifest.
+
+    Returns:
+        dict: The manifest (timestamp, settings and one entry per cell with its tag and file paths).
+    """
+    timestamp = timestamp or datetime.now().strftime("%Y%m%d_%H%M%S")
+    sweep_dir = os.path.join(results_dir, f"sweep_{timestamp}")
+    os.makedirs(sweep_dir, exist_ok=True)
+
+    base_urls = sorted({cell["base_url"] for cell in cells})
+    global_slots = asyncio.Semaphore(global_concurrency)
+    endpoint_slots = {url: asyncio.Semaphore(endpoint_concurrency) for url in base_urls}
+    clients = {url: create_async_client(api_key, url) for url in base_urls}
+    rate_limiters = {url: AdaptiveRateLimiter(requests_per_second, tokens_per_minute) for url in base_urls}
+
+    async def run_cell(cell):
+        tag = cell_tag(cell)
+        url = cell["base_url"]
+        num_flips = cell_num_flips(cell)
+        journal_path = os.path.join(sweep_dir, f"{tag}.jsonl")
+        print(f"Starting cell {tag} ({num_simulations} simulations)")
+
+        async def trial(simulation_id):
+            async with global_slots, endpoint_slots[url]:
+                return await run_direct_trial(clients[url], build_cell_request(cell, simulation_id), stream=stream,
+                                              token_budget=token_budget, rate_limiter=rate_limiters[url])
+
+        with TrialJournal(journal_path) as journal:
+            def record_trial(simulation_id, record):
+                record["extractions"] = run_extractions(record["raw_output"], num_flips)
+                record["extraction_ok"] = is_valid_sequence(record["extractions"]["prioritized"], num_flips)
+                record["num_flips"] = num_flips
+                record["cell"] = cell
+                journal.append(record)
+
+            await run_trials_async(trial, range(1, num_simulations + 1), concurrency=endpoint_concurrency,
+                                   on_result=record_trial, collect_results=False,
+                                   should_retry=is_retryable, max_retries=max_retries)
+
+        if text_reports:
+            write_reports_from_journal(journal_path, timestamp, num_simulations, results_dir, suffix=f"_{tag}", length=num_flips)
+        metrics = write_metrics_report(journal_path, timestamp, results_dir, suffix=f"_{tag}",
+                                       group_by=("model", "temperature", "max_tokens", "prompt"))
+        write_run_from_journal(journal_path, f"{timestamp}_{tag}", dict(cell_metadata(cell), timestamp=timestamp, source="sweep",
+                                                                        num_simulations=num_simulations))
+        print(f"Finished cell {tag}")
+        return dict(cell, tag=tag, journal=journal_path, metrics=metrics[0] if metrics else None)
+
+    try:
+        cell_entries = await asyncio.gather(*(run_cell(cell) for cell in cells))
+    finally:
+        for client in clients.values():
+            await client.close()
+
+    manifest = {
+        "timestamp": timestamp,
+        "num_simulations": num_simulations,
+        "stream": stream,
+        "token_budget": token_budget,
+        "cells": cell_entries,
+    }
+    manifest_path = os.path.join(results_dir, f"sweep_{timestamp}.json")
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Sweep manifest saved to {manifest_path}")
+    return manifest
+
+
+def run_sweep(cells, num_simulations, api_key, **options):
+    """Synchronous entry point for run_sweep_async."""
+    return asyncio.run(run_sweep_async(cells, num_simulations, api_key, **options))
+
+
+def add_grid_arguments(parser):
+    """Grid options shared by sweep.py and batch_jobs.py."""
+    parser.add_argument("--grid", default=None, help="JSON file with the grid (command-line axes override it)")
+    parser.add_argument("--models", nargs="+", default=None, help=f"Default: DEFAULT_MODEL from config.py ({settings.DEFAULT_MODEL})")
+    parser.add_argument("--temperatures", nargs="+", type=float, default=None)
+    parser.add_argument("--max-tokens", nargs="+", type=int, default=None)
+    parser.add_argument("--prompts", nargs="+", default=None, help=f"Prompt names from prompts.py: {sorted(PROMPTS)}")
+    parser.add_argument("--num-flips", nargs="+", type=int, default=None, help=f"Sequence lengths (default: {SEQUENCE_LENGTH})")
+    parser.add_argument("--num-simulations", type=int, default=None)
+
+
+def grid_from_args(args):
+    """
+    Cells and number of simulations from parsed add_grid_arguments options.
+
+    Returns:
+        tuple: (cells, num_simulations)
+    """
+    grid = {}
+    if args.grid:
+        with open(args.grid, "r", encoding="utf-8") as f:
+            grid = json.load(f)
+
+    cells = build_grid(
+        args.models or grid.get("models") or [settings.DEFAULT_MODEL],
+        args.temperatures or grid.get("temperatures") or DEFAULT_TEMPERATURES,
+        args.max_tokens or grid.get("max_tokens") or DEFAULT_MAX_TOKENS,
+        args.prompts or grid.get("prompts") or DEFAULT_PROMPTS,
+        endpoints=grid.get("endpoints"),
+        num_flips_values=args.num_flips or grid.get("num_flips") or [SEQUENCE_LENGTH],
+    )
+    num_simulations = args.num_simulations or grid.get("num_simulations") or 100
+    return cells, num_simulations
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a model x temperature x max_tokens x prompt x sequence length grid of coin flip simulations.")
+    add_grid_arguments(parser)
+    parser.add_argument("--global-concurrency", type=int, default=DEFAULT_GLOBAL_CONCURRENCY, help="Requests in flight across all cells")
+    parser.add_argument("--endpoint-concurrency", type=int, default=DEFAULT_ENDPOINT_CONCURRENCY, help="Requests in flight per endpoint")
+    parser.add_argument("--stream", action="store_true", help="Stream replies and close them once the sequence is captured")
+    parser.add_argument("--token-budget", type=int, default=None)
+    parser.add_argument("--rps", type=float, default=DEFAULT_REQUESTS_PER_SECOND, help="Starting requests/second per endpoint")
+    parser.add_argument("--tpm", type=int, default=None, help="Tokens/minute limit per endpoint, if any")
+    parser.add_argument("--max-retries", type=int, default=DEFAULT_MAX_RETRIES)
+    parser.add_argument("--no-text-reports", action="store_true", help="Only store the cells in the Parquet run store")
+    args = parser.parse_args()
+
+    cells, num_simulations = grid_from_args(args)
+    print(f"Sweep of {len(cells)} cells x {num_simulations} simulations")
+
+    run_sweep(
+        cells, num_simulations, settings.LAMBDA_INFERENCE_API_KEY,
+        global_concurrency=args.global_concurrency, endpoint_concurrency=args.endpoint_concurrency,
+        stream=args.stream, token_budget=args.token_budget,
+        requests_per_second=args.rps, tokens_per_minute=args.tpm, max_retries=args.max_retries,
+        text_reports=not args.no_text_reports,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+##Shared asyncio trial engine for coinflip.py and coinflip_regex.py.
+##Instead of running the simulations one after another, up to `concurrency` trials are kept in flight at once.
+##Results are handed back ordered by simulation id, so the existing report files come out exactly as before.
+##Point LAMBDA_INFERENCE_API_BASE at any local OpenAI-compatible stub to exercise the engine offline.
+##Trials that fail with a retryable error are put back on the queue after a jittered exponential backoff.
+##Every trial record is stamped with its queue wait, start/finish wall-clock times and retry count (see trial_metrics.py).
+##A should_stop callback (e.g. sequential_test.SequentialBiasTest) can end a run early: queued trials are dropped,
+##trials already in flight still finish and are recorded.
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from rate_limiter import backoff_delay
+
+DEFAULT_CONCURRENCY = 8
+
+
+async def run_trials_async(trial_fn, simulation_ids, concurrency=DEFAULT_CONCURRENCY, on_result=None, collect_results=True,
+                           should_retry=None, max_retries=0, backoff_base=1.0, backoff_cap=60.0, should_stop=None):
+    """
+    Runs trial_fn for every simulation id with at most `concurrency` trials in flight.
+
+    Args:
+        trial_fn (callable): Async function taking a simulation id and returning that trial's record dict.
+        simulation_ids (iterable): Simulation ids to run (1-based, as used in the result files).
+        concurrency (int): Maximum number of trials running at the same time.
+        on_result (callable, optional): Called as on_result(simulation_id, result) as soon as each
+                                        trial finishes (completion order, not simulation order).
+        collect_results (bool): Keep every result in memory and return them. Set to False when on_result
+                                already persists each trial (e.g. to a journal) to keep memory flat.
+        should_retry (callable, optional): should_retry(result) -> True re-queues the trial after a backoff
+                                           instead of recording it (at most max_retries times).
+        max_retries (int): Maximum number of re-queues per simulation id.
+        backoff_base, backoff_cap (float): Jittered exponential backoff parameters in seconds.
+        should_stop (callable, optional): Checked after every recorded trial; once it returns True no new
+                                          trials are started (pending retries are dropped too).
+
+    Returns:
+        list: (simulation_id, result) tuples sorted by simulation id (empty if collect_results is False).
+        Each result is stamped with queue_wait_s (time spent queued before its last attempt started),
+        started_at / finished_at (epoch seconds, first attempt start and final attempt end) and retries.
+    """
+    queue = asyncio.Queue()
+    enqueued_at = {}
+    started_at = {}
+
+    stopping = False
+
+    def enqueue(simulation_id):
+        enqueued_at[simulation_id] = time.perf_counter()
+        queue.put_nowait(simulation_id)
+
+    for simulation_id in simulation_ids:
+        enqueue(simulation_id)
+    num_workers = max(1, min(concurrency, queue.qsize()))
+    remaining = queue.qsize()
+    if remaining == 0:
+        return []
+
+    results = {}
+    attempts = {}
+    loop = asyncio.get_running_loop()
+
+    def done_one():
+        nonlocal remaining
+        remaining -= 1
+        if remaining == 0:
+            # Everything is recorded (or dropped): release all workers
+            for _ in range(num_workers):
+                queue.put_nowait(None)
+
+    async def worker():
+        nonlocal stopping
+        while True:
+            simulation_id = await queue.get()
+            if simulation_id is None:
+                return
+            if stopping:
+                # Queued or re-queued after the stop: drop it without running
+                done_one()
+                continue
+            queue_wait_s = time.perf_counter() - enqueued_at[simulation_id]
+            started_at.setdefault(simulation_id, time.time())
+            result = await trial_fn(simulation_id)
+            retries = attempts.get(simulation_id, 0)
+            if not stopping and should_retry is not None and retries < max_retries and should_retry(result):
+                attempts[simulation_id] = retries + 1
+                delay = backoff_delay(retries, backoff_base, backoff_cap)
+                print(f"Simulation {simulation_id} failed ({result.get('error')}), retry {retries + 1}/{max_retries} in {delay:.1f}s")
+                loop.call_later(delay, enqueue, simulation_id)
+                continue
+            result["queue_wait_s"] = queue_wait_s
+            result["started_at"] = started_at.pop(simulation_id)
+            result["finished_at"] = time.time()
+            result["retries"] = retries
+            if collect_results:
+                results[simulation_id] = result
+            if on_result is not None:
+                on_result(simulation_id, result)
+            if not stopping and should_stop is not None and should_stop():
+                stopping = True
+                print(f"Stopping early: {queue.qsize()} queued trials dropped, waiting for trials in flight.")
+            done_one()
+
+    await asyncio.gather(*(worker() for _ in range(num_workers)))
+    return [(simulation_id, results[simulation_id]) for simulation_id in sorted(results)]
+
+
+def run_trials(trial_fn, simulation_ids, concurrency=DEFAULT_CONCURRENCY, on_result=None, collect_results=True, **engine_options):
+    """Synchronous entry point for run_trials_async (starts its own event loop)."""
+    return asyncio.run(run_trials_async(trial_fn, simulation_ids, concurrency=concurrency, on_result=on_result,
+                                        collect_results=collect_results, **engine_options))
+
+
+def run_blocking_trials(blocking_trial_fn, simulation_ids, concurrency=DEFAULT_CONCURRENCY, on_result=None, collect_results=True,
+                        rate_limiter=None, estimated_tokens=0, cache=None, request_builder=None, **engine_options):
+    """
+    Same as run_trials, but for a blocking trial function (e.g. an autogen initiate_chat).
+    Each trial runs in a worker thread so up to `concurrency` of them can wait on the API at once.
+    With a rate_limiter (rate_limiter.AdaptiveRateLimiter), each trial first waits for a request slot
+    and its outcome feeds the limiter's AIMD adjustment.
+    With a cache (response_cache.ResponseCache) and the request_builder giving its keys, hits are served before
+    the rate limiter is asked for a slot (they never reach the API, so they neither wait nor feed the limiter);
+    successful misses are stored for next time.
+    """
+    # Own pool sized to the concurrency limit; the default executor caps out at a few dozen threads
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        async def trial_in_thread(simulation_id):
+            wait_start = time.perf_counter()
+            request = request_builder(simulation_id) if cache is not None else None
+            if cache is not None:
+                cached = cache.get(request)
+                if cached is not None:
+                    return dict(cached, simulation_id=simulation_id, latency_s=time.perf_counter() - wait_start, cached=True)
+            if rate_limiter is not None:
+                await rate_limiter.acquire(estimated_tokens)
+            rate_limit_wait_s = time.perf_counter() - wait_start
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(executor, blocking_trial_fn, simulation_id)
+            result["rate_limit_wait_s"] = rate_limit_wait_s
+            if rate_limiter is not None:
+                rate_limiter.observe(result)
+            if cache is not None and not result.get("error"):
+                cache.put(request, result)
+            return result
+        return run_trials(trial_in_thread, simulation_ids, concurrency=concurrency, on_result=on_result,
+                          collect_results=collect_results, **engine_options)
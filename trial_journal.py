@@ -0,0 +1,273 @@
+##Append-only JSONL journal of completed trials for coinflip.py and coinflip_regex.py.
+##Each trial (raw text, extractions, latency, token usage) is appended and fsynced as soon as it finishes,
+##so a crash only loses the trials that were still in flight. Re-running with --resume skips every simulation
+##id already in the journal, and the text report files are rebuilt from the journal one record at a time.
+##Next to the per-extraction text files, write_extraction_reports writes coin_flips_extractions_*.csv (one row per
+##trial, one column per registered extraction strategy) and coin_flips_disagreements_*.txt.
+##Records of runs with another sequence length than 10 carry it as num_flips; the reports take it as `length`.
+
+import csv
+import json
+import os
+import re
+from flip_codes import SEQUENCE_LENGTH
+from flip_extraction import EXTRACTION_STRATEGIES, evaluate_strategies, summarize_disagreements
+
+
+# Journals inside sweep_<ts>/ and batch_<ts>/ are named after their cell (sweep.cell_tag); the batch request
+# files, manifests and provider output files next to them are not
+_CELL_JOURNAL_NAME = re.compile(r"_temp\d+(?:_\d+)?_max\d+_[^/\\]+\.jsonl$")
+
+
+def journal_path_for(timestamp, results_dir="results"):
+    return os.path.join(results_dir, f"coin_flip_journal_{timestamp}.jsonl")
+
+
+def is_journal_file(path):
+    """True for a runner's coin_flip_journal_<ts>.jsonl or a sweep / batch cell journal (<cell tag>.jsonl)."""
+    name = os.path.basename(path)
+    parent = os.path.basename(os.path.dirname(path))
+    if name.startswith("coin_flip_journal_") and name.endswith(".jsonl"):
+        return True
+    return parent.startswith(("sweep_", "batch_")) and bool(_CELL_JOURNAL_NAME.search(name))
+
+
+class TrialJournal:
+    """
+    Append-only JSONL file; every append() is flushed and fsynced before it returns.
+    With fsync_each=False (bulk ingest of already-durable results) records are only synced on close().
+    """
+
+    def __init__(self, path, fsync_each=True):
+        self.path = path
+        self.fsync_each = fsync_each
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+
+    def append(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        if self.fsync_each:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        if not self.fsync_each:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _scan_journal(filepath):
+    """
+    Yields (byte_offset, record) for every readable line of the journal.
+    A line cut short by a crash (invalid JSON) is skipped instead of failing the whole read, and so are lines
+    that are not trial records (no simulation_id, e.g. a batch request file passed by mistake).
+    """
+    not_trials = 0
+    with open(filepath, "rb") as f:
+        offset = f.tell()
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                print(f"Warning: Skipping unreadable journal line at byte {offset} in '{filepath}'")
+            else:
+                if isinstance(record, dict) and "simulation_id" in record:
+                    yield offset, record
+                else:
+                    not_trials += 1
+            offset += len(line)
+    if not_trials:
+        print(f"Warning: Skipped {not_trials} line(s) without a simulation_id in '{filepath}'")
+
+
+def load_completed_ids(filepath):
+    """
+    Simulation ids that already have a successful record in the journal (used by --resume).
+    Trials recorded with an "error" are not counted, so resuming runs them again.
+    """
+    if not os.path.exists(filepath):
+        return set()
+    completed = set()
+    for _, record in _scan_journal(filepath):
+        if record.get("error"):
+            completed.discard(record["simulation_id"])
+        else:
+            completed.add(record["simulation_id"])
+    return completed
+
+
+def iter_journal_entries(filepath):
+    """
+    Yields (byte_offset, line_length, record) ordered by simulation id (the latest record wins if an id appears
+    twice). Only an id -> byte offset index is kept in memory; each record is read back when it is yielded.
+    """
+    if not os.path.exists(filepath):
+        return
+    offsets = {}
+    for offset, record in _scan_journal(filepath):
+        offsets[record["simulation_id"]] = offset
+    with open(filepath, "rb") as f:
+        for simulation_id in sorted(offsets):
+            f.seek(offsets[simulation_id])
+            line = f.readline()
+            yield offsets[simulation_id], len(line), json.loads(line)
+
+
+def iter_journal_records(filepath):
+    """Yields the journal records ordered by simulation id (see iter_journal_entries)."""
+    for _, _, record in iter_journal_entries(filepath):
+        yield record
+
+
+# extraction name -> (file prefix, report title, logic name, width of the "=" rule) of the sequence reports
+SEQUENCE_REPORTS = {
+    "prioritized": ("coin_flips_prioritized", "Prioritized Extraction", "Prioritized Logic", 50),
+    "embedded_only": ("coin_flips_embedded_only", "Embedded-Only Regex Extraction", "Embedded-Only Regex Logic", 57),
+}
+
+
+def sequence_report_filename(extraction_name, timestamp, suffix=""):
+    prefix = SEQUENCE_REPORTS.get(extraction_name, (f"coin_flips_{extraction_name}",))[0]
+    return f"{prefix}_{timestamp}{suffix}.txt"
+
+
+def sequence_report_header(extraction_name, timestamp, num_simulations, length=SEQUENCE_LENGTH):
+    """Header of a coin_flips_<extraction>_*.txt report (extractions without a SEQUENCE_REPORTS entry get a generic one)."""
+    _, title, logic, width = SEQUENCE_REPORTS.get(extraction_name, (None, f"{extraction_name} Extraction", extraction_name, 50))
+    header = f"Coin Flip Simulation Results ({title})\n"
+    header += f"Timestamp: {timestamp}\n"
+    header += f"Total Simulations Attempted: {num_simulations}\n"
+    header += "=" * width + "\n\n"
+    header += f"Validated {length}-flip sequences ({logic}):\n"
+    return header
+
+
+def sequence_report_line(simulation_id, sequence, length=SEQUENCE_LENGTH):
+    if len(sequence) == length and all(c in 'HT' for c in sequence):
+        return f"Simulation {simulation_id} sequence: {sequence}\n"
+    return f"Simulation {simulation_id} sequence: INVALID_OR_EMPTY ('{sequence}')\n" # Log invalid ones too
+
+
+def write_extraction_reports(rows, timestamp, results_dir="results", suffix="", strategies=None, max_listed=50,
+                             length=SEQUENCE_LENGTH):
+    """
+    Writes the columnar extraction table and the strategy disagreement report in one pass over the rows.
+
+    Args:
+        rows (iterable): (simulation_id, {strategy: sequence}) in simulation order.
+        timestamp (str): Run timestamp (file names and report header).
+        strategies (list, optional): Columns (default: every registered strategy).
+        max_listed (int): Conflicting trials listed in the report (all of them are in the table).
+        length (int): Number of flips in a valid sequence.
+
+    Returns:
+        dict: The summarize_disagreements summary.
+    """
+    strategies = list(strategies or EXTRACTION_STRATEGIES)
+    os.makedirs(results_dir, exist_ok=True)
+    table_path = os.path.join(results_dir, f"coin_flips_extractions_{timestamp}{suffix}.csv")
+    with open(table_path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["simulation_id"] + strategies)
+
+        def written_rows():
+            for simulation_id, extractions in rows:
+                writer.writerow([simulation_id] + [extractions[name] for name in strategies])
+                yield simulation_id, extractions
+        summary = summarize_disagreements(written_rows(), strategies, length)
+    print(f"Extraction table saved to {table_path}")
+
+    report_path = os.path.join(results_dir, f"coin_flips_disagreements_{timestamp}{suffix}.txt")
+    with open(report_path, "w", encoding="utf-8") as f:
+        f.write("Extraction Strategy Disagreement Report\n")
+        f.write(f"Timestamp: {timestamp}\n")
+        f.write(f"Total Trials: {summary['trials']}\n")
+        f.write("=======================================\n\n")
+        f.write(f"Valid {length}-flip sequences per strategy:\n")
+        for name in strategies:
+            f.write(f"  {name}: {summary['valid'][name]}/{summary['trials']}  ({EXTRACTION_STRATEGIES[name][1]})\n")
+        f.write(f"\nTrials where all strategies agree: {summary['unanimous']}/{summary['trials']}\n")
+        f.write("\nPairwise disagreements (differ = different result incl. invalid, conflict = two different valid sequences):\n")
+        for pair, counts in summary["pairs"].items():
+            f.write(f"  {pair}: differ {counts['differ']}, conflict {counts['conflict']}\n")
+        f.write(f"\nTrials with conflicting valid sequences: {len(summary['conflicts'])}\n")
+        for simulation_id, values in list(summary["conflicts"].items())[:max_listed]:
+            f.write(f"Simulation {simulation_id}: " + ", ".join(f"{name}={value or '-'}" for name, value in values.items()) + "\n")
+        if len(summary["conflicts"]) > max_listed:
+            f.write(f"... {len(summary['conflicts']) - max_listed} more in {os.path.basename(table_path)}\n")
+    print(f"Disagreement report saved to {report_path}")
+    return summary
+
+
+def extraction_rows(records, strategies=None):
+    """
+    (simulation_id, extractions) rows of trial records. Records written before a strategy was registered get
+    their extractions recomputed from the raw output (at the record's num_flips), so every row has every column.
+    """
+    strategies = list(strategies or EXTRACTION_STRATEGIES)
+    for record in records:
+        extractions = record.get("extractions") or {}
+        if any(name not in extractions for name in strategies):
+            extractions = dict(evaluate_strategies(record.get("raw_output", ""), strategies,
+                                                   record.get("num_flips", SEQUENCE_LENGTH)), **extractions)
+        yield record["simulation_id"], extractions
+
+
+def journal_extraction_rows(journal_path, strategies=None):
+    return extraction_rows(iter_journal_records(journal_path), strategies)
+
+
+def write_text_reports(records, timestamp, num_simulations, results_dir="results", suffix="", length=SEQUENCE_LENGTH):
+    """
+    Writes the prioritized, embedded-only and raw-output text files (coinflip_regex.py layout), plus the
+    extraction table and disagreement report covering every registered strategy.
+
+    Args:
+        records (callable): Returns a fresh iterator over the trial records (simulation_id, extractions,
+                            raw_output) in simulation order; it is called once per file, so records can be
+                            streamed and memory stays flat for any run size.
+        suffix (str): Appended to the timestamp in the file names (e.g. a sweep cell tag).
+        length (int): Number of flips in a valid sequence.
+    """
+    os.makedirs(results_dir, exist_ok=True)  # Create the directory if it doesn't exist
+
+    # Helper function to save results, one line at a time
+    def save_results(filename, header, lines):
+        filepath = os.path.join(results_dir, filename)
+        with open(filepath, "w", encoding="utf-8") as f:
+            f.write(header)
+            for line in lines:
+                f.write(line)
+        print(f"Results saved to {filepath}")
+
+    def sequence_lines(extraction_name):
+        for simulation_id, extractions in extraction_rows(records(), [extraction_name]):
+            yield sequence_report_line(simulation_id, extractions[extraction_name], length)
+
+    for extraction_name in ("prioritized", "embedded_only"):
+        save_results(sequence_report_filename(extraction_name, timestamp, suffix),
+                     sequence_report_header(extraction_name, timestamp, num_simulations, length), sequence_lines(extraction_name))
+
+    # Optionally, save the raw LLM responses too
+    header_raw = f"Raw LLM Outputs (after TERMINATE removal)\n"
+    header_raw += f"Timestamp: {timestamp}\n"
+    header_raw += f"Total Simulations: {num_simulations}\n"
+    header_raw += "=========================================\n\n"
+    raw_lines = (f"--- Simulation {record['simulation_id']} Raw Output ---\n{record['raw_output']}\n-----------------------------------\n\n"
+                 for record in records())
+    save_results(f"coin_flips_raw_llm_outputs_{timestamp}{suffix}.txt", header_raw, raw_lines)
+
+    # One table with every strategy's extraction per trial, and where they disagree
+    write_extraction_reports(extraction_rows(records()), timestamp, results_dir, suffix, length=length)
+
+
+def write_reports_from_journal(journal_path, timestamp, num_simulations, results_dir="results", suffix="", length=SEQUENCE_LENGTH):
+    """write_text_reports for the records of a journal, streamed one at a time in simulation order."""
+    write_text_reports(lambda: iter_journal_records(journal_path), timestamp, num_simulations, results_dir, suffix, length)
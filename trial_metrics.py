@@ -0,0 +1,125 @@
+##Per-trial instrumentation summary for coinflip.py, coinflip_regex.py and sweep.py.
+##Every journal record carries queue_wait_s, rate_limit_wait_s, latency_s, ttft_s (stream mode), token usage
+##(prompt / completion / reasoning), retries, started_at / finished_at and extraction_ok. This module groups
+##the records of a journal (by model and temperature by default) and writes
+##coin_flip_metrics_<timestamp>.txt / .json next to the coin_flip_results_*.txt files with
+##p50/p95/p99 latency and TTFT, token totals, tokens per valid sequence and valid sequences per second.
+
+import json
+import os
+import numpy as np
+from trial_journal import iter_journal_records
+
+DEFAULT_GROUP_BY = ("model", "temperature")
+PERCENTILES = (50, 95, 99)
+USAGE_FIELDS = ("prompt_tokens", "completion_tokens", "reasoning_tokens")
+
+
+def _group_value(record, field):
+    """A grouping field from the record itself or, for sweep records, from its grid cell."""
+    if field in record:
+        return record[field]
+    return (record.get("cell") or {}).get(field)
+
+
+def _percentiles(values):
+    if not values:
+        return {f"p{p}": None for p in PERCENTILES}
+    return {f"p{p}": float(value) for p, value in zip(PERCENTILES, np.percentile(values, PERCENTILES))}
+
+
+def _mean(values):
+    return float(np.mean(values)) if values else None
+
+
+def summarize_records(records, group_by=DEFAULT_GROUP_BY):
+    """
+    Aggregates trial records into one summary per group.
+
+    Args:
+        records (iterable): Journal records (dicts).
+        group_by (tuple): Record (or record["cell"]) fields that define a group.
+
+    Returns:
+        list: One dict per group (sorted by group key) with trial counts, latency/TTFT percentiles,
+              mean queue and rate-limit wait, token totals, retries, tokens per valid sequence and
+              valid sequences per second (valid sequences over the group's wall-clock span).
+    """
+    groups = {}
+    for record in records:
+        key = tuple(_group_value(record, field) for field in group_by)
+        groups.setdefault(key, []).append(record)
+
+    summaries = []
+    for key in sorted(groups, key=lambda k: tuple(str(v) for v in k)):
+        group = groups[key]
+        valid = sum(1 for r in group if r.get("extraction_ok"))
+        tokens = {field: sum((r.get("usage") or {}).get(field) or 0 for r in group) for field in USAGE_FIELDS}
+        total_tokens = tokens["prompt_tokens"] + tokens["completion_tokens"]
+        started = [r["started_at"] for r in group if r.get("started_at") is not None]
+        finished = [r["finished_at"] for r in group if r.get("finished_at") is not None]
+        wall_clock_s = max(finished) - min(started) if started and finished else None
+
+        summary = dict(zip(group_by, key))
+        summary.update({
+            "trials": len(group),
+            "errors": sum(1 for r in group if r.get("error")),
+            "cached": sum(1 for r in group if r.get("cached") or r.get("replayed_from")),
+            "valid_sequences": valid,
+            "latency_s": _percentiles([r["latency_s"] for r in group if r.get("latency_s") is not None]),
+            "ttft_s": _percentiles([r["ttft_s"] for r in group if r.get("ttft_s") is not None]),
+            "mean_queue_wait_s": _mean([r["queue_wait_s"] for r in group if r.get("queue_wait_s") is not None]),
+            "mean_rate_limit_wait_s": _mean([r["rate_limit_wait_s"] for r in group if r.get("rate_limit_wait_s") is not None]),
+            "retries": sum(r.get("retries") or 0 for r in group),
+            "tokens": dict(tokens, total_tokens=total_tokens),
+            "tokens_per_valid_sequence": total_tokens / valid if valid else None,
+            "wall_clock_s": wall_clock_s,
+            "valid_sequences_per_s": valid / wall_clock_s if valid and wall_clock_s else None,
+        })
+        summaries.append(summary)
+    return summaries
+
+
+def _fmt(value, spec=".3f"):
+    return "n/a" if value is None else format(value, spec)
+
+
+def format_summary(summary, group_by=DEFAULT_GROUP_BY):
+    """Human-readable block for one group summary."""
+    lines = ["Group: " + ", ".join(f"{field}={summary.get(field)}" for field in group_by)]
+    lines.append(f"  Trials: {summary['trials']} (errors: {summary['errors']}, cached/replayed: {summary['cached']}, retries: {summary['retries']})")
+    lines.append(f"  Valid sequences: {summary['valid_sequences']}")
+    for name in ("latency_s", "ttft_s"):
+        lines.append(f"  {name}: " + ", ".join(f"{p}={_fmt(v)}" for p, v in summary[name].items()))
+    lines.append(f"  Mean queue wait: {_fmt(summary['mean_queue_wait_s'])}s, mean rate-limit wait: {_fmt(summary['mean_rate_limit_wait_s'])}s")
+    tokens = summary["tokens"]
+    lines.append(f"  Tokens: prompt={tokens['prompt_tokens']}, completion={tokens['completion_tokens']} "
+                 f"(reasoning={tokens['reasoning_tokens']}), total={tokens['total_tokens']}")
+    lines.append(f"  Tokens per valid sequence: {_fmt(summary['tokens_per_valid_sequence'], '.1f')}")
+    lines.append(f"  Valid sequences per second: {_fmt(summary['valid_sequences_per_s'])} (wall clock {_fmt(summary['wall_clock_s'], '.1f')}s)")
+    return "\n".join(lines)
+
+
+def write_metrics_report(journal_path, timestamp, results_dir="results", suffix="", group_by=DEFAULT_GROUP_BY):
+    """
+    Summarizes a journal and writes coin_flip_metrics_{timestamp}{suffix}.txt and .json into results_dir.
+
+    Returns:
+        list: The group summaries (see summarize_records).
+    """
+    summaries = summarize_records(iter_journal_records(journal_path), group_by)
+    os.makedirs(results_dir, exist_ok=True)
+    base = os.path.join(results_dir, f"coin_flip_metrics_{timestamp}{suffix}")
+
+    with open(f"{base}.json", "w", encoding="utf-8") as f:
+        json.dump({"timestamp": timestamp, "journal": journal_path, "group_by": list(group_by), "groups": summaries}, f, indent=2)
+
+    with open(f"{base}.txt", "w", encoding="utf-8") as f:
+        f.write("Coin Flip Simulation Metrics\n")
+        f.write(f"Timestamp: {timestamp}\n")
+        f.write(f"Journal: {journal_path}\n")
+        f.write("==========================\n\n")
+        for summary in summaries:
+            f.write(format_summary(summary, group_by) + "\n\n")
+    print(f"Metrics saved to {base}.txt")
+    return summaries